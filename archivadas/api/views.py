@@ -1,15 +1,26 @@
 # archivada/api/views.py
+import logging
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import NotFound
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.pagination import PageNumberPagination
 from django.shortcuts import get_object_or_404
 from django.db import DatabaseError, transaction
-from django.db.models import Q, Subquery, OuterRef
 from datetime import datetime
 
-from preparacion.models import Preparacion, PreparacionArchivo
+from preparacion.historial import trazabilidad
+from preparacion.models import CambioHistorial, Preparacion
+from preparacion.api.services import listar_tramites, MODULO_ARCHIVADAS
+from preparacion.resumen import (
+    bloquear_clave,
+    clave_resumen,
+    obtener_resumen,
+    registrar_alta,
+    registrar_baja,
+    registrar_cambio
+)
+from preparacion.websocket.utils import claves_modificadas, filtros_evento
 from user.api.permissions import RolePermission
 from departamentos.models import Departamento
 from municipios.models import Municipio
@@ -20,6 +31,8 @@ from archivadas.websocket.utils import (
     notify_archivada_deleted
 )
 
+logger = logging.getLogger(__name__)
+
 
 # ✅ Crear trámite en archivada
 @api_view(['POST'])
@@ -99,6 +112,7 @@ def create_archivada(request):
                 paquete=data.get('paquete', ''),
                 lista_documentos=data.get('lista_documentos', [])
             )
+            registrar_alta(archivada)
 
             # 5. Construir datos para WebSocket
             archivada_data = {
@@ -119,10 +133,11 @@ def create_archivada(request):
                 'usuario': archivada.usuario.username if archivada.usuario else 'Sin asignar',
                 'created_at': archivada.created_at.isoformat(),
                 'updated_at': archivada.updated_at.isoformat(),
+                'version': archivada.version,
             }
 
             # 6. Notificar vía WebSocket
-            notify_archivada_created(archivada_data)
+            notify_archivada_created(archivada_data, filtros=filtros_evento(archivada))
 
             return Response({
                 "id": archivada.id,
@@ -133,9 +148,7 @@ def create_archivada(request):
     except ValueError as e:
         return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
-        print(f"❌ Error completo al crear archivada: {type(e).__name__}: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception('Error al crear archivada')
         return Response(
             {"error": f"Error inesperado al procesar el trámite: {str(e)}"},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -147,124 +160,23 @@ def create_archivada(request):
 @permission_classes([IsAuthenticated, RolePermission(['admin'])])
 def list_archivadas(request):
     try:
-        # 1. Definir Subconsultas para obtener los nombres
-        nombre_depto_subquery = Departamento.objects.filter(
-            id_departamento=OuterRef('departamento')
-        ).values('departamento')[:1]
-
-        nombre_muni_subquery = Municipio.objects.filter(
-            id_municipio=OuterRef('municipio')
-        ).values('municipio')[:1]
-
-        # 2. QuerySet Base con Annotation (filtrado por estado_modulo=0 para archivada)
-        archivadas = Preparacion.objects.select_related(
-            'usuario', 'departamento', 'municipio', 'proveedor'
-        ).annotate(
-            nombre_depto=Subquery(nombre_depto_subquery),
-            nombre_muni=Subquery(nombre_muni_subquery)
-        ).filter(estado_modulo=0)  # CRÍTICO: Solo registros del módulo archivada
-
-        # --- Filtros ---
-        # Filtro de búsqueda general
-        search_query = request.query_params.get('search', None)
-        if search_query:
-            archivadas = archivadas.filter(
-                Q(placa__icontains=search_query) |
-                Q(tipo_vehiculo__icontains=search_query) |
-                Q(usuario__username__icontains=search_query) |
-                Q(proveedor__codigo_encargado__icontains=search_query) |
-                Q(proveedor__nombre__icontains=search_query) |
-                Q(nombre_depto__icontains=search_query) |
-                Q(nombre_muni__icontains=search_query)
-            )
-
-        # Filtro de estado
-        estado_filter = request.query_params.get('estado', None)
-        if estado_filter:
-            archivadas = archivadas.filter(estado=estado_filter)
-
-        # Filtro de tipo de vehículo
-        tipo_vehiculo_filter = request.query_params.get('tipo_vehiculo', None)
-        if tipo_vehiculo_filter:
-            archivadas = archivadas.filter(tipo_vehiculo=tipo_vehiculo_filter)
-
-        # Filtro de proveedor
-        proveedor_filter = request.query_params.get('proveedor', None)
-        if proveedor_filter:
-            archivadas = archivadas.filter(proveedor_id=proveedor_filter)
-
-        # Filtro de departamento
-        departamento_filter = request.query_params.get('departamento', None)
-        if departamento_filter:
-            archivadas = archivadas.filter(departamento_id=departamento_filter)
-
-        # Filtro de municipio
-        municipio_filter = request.query_params.get('municipio', None)
-        if municipio_filter:
-            archivadas = archivadas.filter(municipio_id=municipio_filter)
-
-        # Filtros de fecha de recepción
-        start_date_str = request.query_params.get('start_date', None)
-        end_date_str = request.query_params.get('end_date', None)
-
-        if start_date_str:
-            start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
-            archivadas = archivadas.filter(fecha_recepcion_municipio__gte=start_date)
-
-        if end_date_str:
-            end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
-            archivadas = archivadas.filter(fecha_recepcion_municipio__lte=end_date)
-
-        # 3. Construir datos
-        archivadas_data = []
-        for archivada in archivadas.order_by('-created_at'):
-
-            # Obtener archivos del trámite
-            archivos = archivada.archivos.all().values(
-                'id', 'nombre_original', 'tipo_archivo', 'tamaño', 'archivo', 'created_at'
-            )
-
-            archivos_list = [{
-                "id": arch['id'],
-                "nombre": arch['nombre_original'],
-                "tipo": arch['tipo_archivo'],
-                "tamaño": arch['tamaño'],
-                "url": arch['archivo'],
-                "created_at": arch['created_at']
-            } for arch in archivos]
-
-            archivadas_data.append({
-                'id': archivada.id,
-                'placa': archivada.placa,
-                'archivos': archivos_list,
-                'total_archivos': len(archivos_list),
-                'tipo_vehiculo': archivada.tipo_vehiculo,
-                'departamento': archivada.departamento_id,
-                'municipio': archivada.municipio_id,
-                'nombre_depto': archivada.nombre_depto,
-                'nombre_muni': archivada.nombre_muni,
-                'estado': archivada.estado,
-                'estado_detalle': archivada.estado_detalle,
-                'fecha_recepcion_municipio': archivada.fecha_recepcion_municipio,
-                'hace_dias': archivada.hace_dias,
-                'proveedor_id': archivada.proveedor_id,
-                'codigo_encargado': archivada.codigo_encargado,
-                'proveedor_nombre': archivada.proveedor.nombre if archivada.proveedor else None,
-                'usuario': archivada.usuario.username if archivada.usuario else 'Sin asignar',
-                'created_at': archivada.created_at,
-                'updated_at': archivada.updated_at,
-            })
+        return listar_tramites(MODULO_ARCHIVADAS, request)
 
-        # 4. Paginación
-        page_size = int(request.query_params.get('page_size', 10))
-        paginator = PageNumberPagination()
-        paginator.page_size = page_size
+    except Exception as e:
+        return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-        paginated_queryset = paginator.paginate_queryset(archivadas_data, request)
-        return paginator.get_paginated_response(paginated_queryset)
 
+# ✅ Conteos del módulo Archivadas (tabla de resumen)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, RolePermission(['admin'])])
+def stats_archivadas(request):
+    try:
+        return Response(obtener_resumen(MODULO_ARCHIVADAS.estado_modulo), status=status.HTTP_200_OK)
     except Exception as e:
-        return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return Response(
+            {"error": f"Error al obtener estadísticas: {str(e)}"},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
 
 
 # ✅ Obtener trámite por ID
@@ -329,7 +241,14 @@ def update_archivada(request, pk):
         if 'proveedor' in data:
             archivada.proveedor_id = data.get('proveedor')
 
-        archivada.save()
+        # Campos que cambiaron (por WebSocket se envía solo el delta) y filtros antes/después del cambio
+        campos = archivada.campos_modificados()
+        filtros = filtros_evento(archivada)
+
+        with transaction.atomic():
+            clave_anterior = bloquear_clave(archivada)
+            archivada.save()
+            registrar_cambio(clave_anterior, archivada)
 
         response_data = {
             "id": archivada.id,
@@ -358,8 +277,9 @@ def update_archivada(request, pk):
             'usuario': archivada.usuario.username if archivada.usuario else 'Sin asignar',
             'created_at': archivada.created_at.isoformat(),
             'updated_at': archivada.updated_at.isoformat(),
+            'version': archivada.version,
         }
-        notify_archivada_updated(archivada_data)
+        notify_archivada_updated(archivada_data, claves_modificadas(campos), filtros=filtros)
 
         return Response(response_data, status=status.HTTP_200_OK)
 
@@ -385,11 +305,15 @@ def delete_archivada(request, pk):
         # Guardar datos antes de eliminar para la notificación WebSocket
         archivada_id = archivada.id
         archivada_placa = archivada.placa
+        filtros = filtros_evento(archivada)
 
-        archivada.delete()
+        with transaction.atomic():
+            clave = bloquear_clave(archivada)
+            archivada.delete()
+            registrar_baja(clave)
 
         # Notificar vía WebSocket
-        notify_archivada_deleted(archivada_id, archivada_placa)
+        notify_archivada_deleted(archivada_id, archivada_placa, filtros=filtros)
 
         return Response(
             {"message": "archivada deleted successfully"},
@@ -410,43 +334,17 @@ def get_archivada_history(request, pk):
         # 1. Obtener el trámite principal
         archivada = get_object_or_404(Preparacion, pk=pk, estado_modulo=0)
 
-        # 2. Obtener historial del trámite
-        archivada_history = archivada.history.all().select_related('history_user')
-
-        timeline = []
-
-        # --- Procesar Historial del archivada ---
-        for record in archivada_history:
-            cambios = []
-            if record.prev_record:
-                delta = record.diff_against(record.prev_record)
-                for change in delta.changes:
-                    cambios.append({
-                        "campo": change.field,
-                        "anterior": change.old,
-                        "nuevo": change.new
-                    })
-
-            timeline.append({
-                "fecha": record.history_date,
-                "usuario": record.history_user.username if record.history_user else "Sistema",
-                "entidad": "Trámite archivada",
-                "evento": record.get_history_type_display(),
-                "descripcion": f"Cambio en datos del trámite {record.placa}",
-                "detalles": cambios,
-                "tipo": "archivada"
-            })
-
-        # 3. Ordenar toda la línea de tiempo por fecha descendente
-        timeline.sort(key=lambda x: x['fecha'], reverse=True)
-
+        # 2. Cambios ya materializados del trámite (una consulta por página, ?cursor=&page_size=)
         return Response({
             "archivada_id": pk,
             "placa_actual": archivada.placa,
-            "total_eventos": len(timeline),
-            "trazabilidad_completa": timeline
+            **trazabilidad(request, pk, {
+                CambioHistorial.ENTIDAD_TRAMITE: ("Trámite archivada", "archivada", "Cambio en datos del trámite {referencia}"),
+            })
         }, status=status.HTTP_200_OK)
 
+    except NotFound:
+        raise
     except Exception as e:
         return Response(
             {"error": f"Error al generar trazabilidad: {str(e)}"},
@@ -470,7 +368,9 @@ def finalizar_archivada(request, pk):
     try:
         with transaction.atomic():
             # 1. Obtener el trámite del módulo archivada
-            archivada = get_object_or_404(Preparacion, pk=pk, estado_modulo=0)
+            archivada = get_object_or_404(Preparacion.objects.select_for_update(), pk=pk, estado_modulo=0)
+            clave_anterior = clave_resumen(archivada)
+            archivada.bloquear_version()  # leído con select_for_update
 
             # 2. Guardar datos del archivada antes de la transición (para notificaciones)
             archivada_data_before = {
@@ -486,7 +386,9 @@ def finalizar_archivada(request, pk):
             if 'estado_detalle' in request.data:
                 archivada.estado_detalle = request.data.get('estado_detalle', '')
 
+            filtros = filtros_evento(archivada)  # antes de guardar: valores anteriores y nuevos
             archivada.save()
+            registrar_cambio(clave_anterior, archivada)
 
             # 4. Construir datos completos para el módulo Finalizados (WebSocket)
             finalizado_data = {
@@ -507,15 +409,18 @@ def finalizar_archivada(request, pk):
                 'usuario': archivada.usuario.username if archivada.usuario else 'Sin asignar',
                 'created_at': archivada.created_at.isoformat(),
                 'updated_at': archivada.updated_at.isoformat(),
+                'version': archivada.version,
             }
 
             # 5. Emitir notificaciones WebSocket
             # 5.1. Notificar al módulo archivada que el registro fue eliminado
-            notify_archivada_deleted(archivada_data_before['id'], archivada_data_before['placa'])
+            notify_archivada_deleted(
+                archivada_data_before['id'], archivada_data_before['placa'], filtros=filtros
+            )
 
             # 5.2. Notificar al módulo Finalizados que se creó un nuevo registro
             from finalizados.websocket.utils import notify_finalizado_created
-            notify_finalizado_created(finalizado_data)
+            notify_finalizado_created(finalizado_data, filtros=filtros)
 
             return Response({
                 "message": "Trámite finalizado exitosamente",
@@ -525,9 +430,7 @@ def finalizar_archivada(request, pk):
             }, status=status.HTTP_200_OK)
 
     except Exception as e:
-        print(f"❌ Error al finalizar archivada: {type(e).__name__}: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception('Error al finalizar archivada')
         return Response(
             {"error": f"Error al finalizar el trámite: {str(e)}"},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -1,3 +1,8 @@
 from django.test import TestCase
 
-# Create your tests here.
+from preparacion.tests import ConsultasListadoMixin
+
+
+class ListArchivadasConsultasTests(ConsultasListadoMixin, TestCase):
+    url = '/api/archivadas/list/'
+    estado_modulo = 0
@@ -1,42 +1,47 @@
 # archivada/websocket/utils.py
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
+from backend.notificaciones import construir_delta, encolar_evento
+from archivadas.websocket.consumers import ArchivadaConsumer
 
 
-def notify_archivada_created(archivada_data):
+def notify_archivada_created(archivada_data, filtros=None):
     """
     Notifica a todos los clientes conectados que se creó un nuevo trámite en archivada.
+    `filtros` (ver filtros_evento) envía el evento también a los grupos por filtro.
     """
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(
+    encolar_evento(
         "archivada_updates",
         {
             "type": "archivada_created",
             "data": archivada_data
-        }
+        },
+        filtros=filtros,
+        dimensiones=ArchivadaConsumer.dimensiones_filtro
     )
 
 
-def notify_archivada_updated(archivada_data):
+def notify_archivada_updated(archivada_data, claves=None, filtros=None):
     """
     Notifica a todos los clientes conectados que se actualizó un trámite en archivada.
+    Si se indican `claves` se envía solo el delta de esas claves con la versión.
+    `filtros` (ver filtros_evento) envía el evento también a los grupos por filtro.
     """
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(
+    encolar_evento(
         "archivada_updates",
         {
             "type": "archivada_updated",
-            "data": archivada_data
-        }
+            "data": archivada_data if claves is None else construir_delta(archivada_data, claves)
+        },
+        filtros=filtros,
+        dimensiones=ArchivadaConsumer.dimensiones_filtro
     )
 
 
-def notify_archivada_deleted(archivada_id, archivada_placa):
+def notify_archivada_deleted(archivada_id, archivada_placa, filtros=None):
     """
     Notifica a todos los clientes conectados que se eliminó un trámite en archivada.
+    `filtros` (ver filtros_evento) envía el evento también a los grupos por filtro.
     """
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(
+    encolar_evento(
         "archivada_updates",
         {
             "type": "archivada_deleted",
@@ -44,5 +49,7 @@ def notify_archivada_deleted(archivada_id, archivada_placa):
                 "id": archivada_id,
                 "placa": archivada_placa
             }
-        }
+        },
+        filtros=filtros,
+        dimensiones=ArchivadaConsumer.dimensiones_filtro
     )
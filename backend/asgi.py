@@ -13,13 +13,16 @@ from channels.security.websocket import AllowedHostsOriginValidator
 
 from backend import routing
 from backend.middleware import JWTAuthMiddlewareStack  # ← Importar nuestro middleware
+from backend.metricas import MetricasWebSocketMiddleware
 
 application = ProtocolTypeRouter({
     "http": django_asgi_app,
     "websocket": AllowedHostsOriginValidator(
-        JWTAuthMiddlewareStack(  # ← Usar nuestro middleware JWT
-            URLRouter(
-                routing.websocket_urlpatterns
+        MetricasWebSocketMiddleware(  # Mensajes, bytes y conexiones por ruta (/metrics)
+            JWTAuthMiddlewareStack(  # ← Usar nuestro middleware JWT
+                URLRouter(
+                    routing.websocket_urlpatterns
+                )
             )
         )
     ),
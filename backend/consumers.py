@@ -1,5 +1,19 @@
+import functools
 import json
+import logging
+from urllib.parse import parse_qs, urlencode
+
 from channels.generic.websocket import AsyncWebsocketConsumer
+from channels.consumer import get_handler_name
+
+from archivadas.websocket.consumers import ArchivadaConsumer
+from backend.logs import RegistroEventosMixin
+from finalizados.websocket.consumers import FinalizadoConsumer
+from preparacion.websocket.consumers import PreparacionConsumer
+from tracker.websocket.consumers import TrackerConsumer
+from user.websocket.consumers import UsersOnlineConsumer
+
+logger = logging.getLogger(__name__)
 
 class TestConsumer(AsyncWebsocketConsumer):
     async def connect(self):
@@ -45,4 +59,134 @@ class TestConsumer(AsyncWebsocketConsumer):
             'type': 'message',
             'message': message,
             'echo': f'Echo: {message}'
-        }))
\ No newline at end of file
+        }))
+
+class MultiplexConsumer(RegistroEventosMixin, AsyncWebsocketConsumer):
+    """
+    Una sola conexión WebSocket para todos los módulos.
+
+    En lugar de abrir un socket por módulo (cada uno con su handshake JWT y su
+    canal), el cliente abre `ws/stream/` y se suscribe a los streams que
+    necesita. Cada stream es una instancia del consumer del módulo que comparte
+    el canal y el usuario de esta conexión; sus mensajes salen envueltos como
+    {'stream': <nombre>, 'payload': {...}}.
+
+    Mensajes del cliente:
+        {'type': 'subscribe', 'stream': 'tracker', 'resume_from': 10}
+        {'type': 'unsubscribe', 'stream': 'tracker'}
+        {'stream': 'tracker', 'payload': {...}}  (se entrega al receive del módulo)
+
+    También acepta `?streams=preparacion,tracker` para suscribirse al conectar.
+    """
+
+    async def connect(self):
+        self.streams = {}
+        await self.accept()
+
+        await self.send(text_data=json.dumps({
+            'type': 'connection_established',
+            'message': 'Conexión multiplexada establecida',
+            'streams': list(STREAMS)
+        }))
+
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        for nombre in ','.join(query.get('streams', [])).split(','):
+            if nombre:
+                await self.suscribir_stream(nombre.strip())
+
+    async def disconnect(self, close_code):
+        for nombre in list(self.streams):
+            await self.cerrar_stream(nombre, close_code)
+
+    async def receive(self, text_data):
+        try:
+            mensaje = json.loads(text_data)
+        except json.JSONDecodeError:
+            await self.enviar_error('Mensaje JSON inválido')
+            return
+
+        tipo = mensaje.get('type')
+        nombre = mensaje.get('stream')
+
+        if tipo == 'subscribe':
+            await self.suscribir_stream(nombre, mensaje.get('resume_from'))
+        elif tipo == 'unsubscribe':
+            if nombre in self.streams:
+                await self.cerrar_stream(nombre, 1000)
+            await self.send(text_data=json.dumps({'type': 'stream_unsubscribed', 'stream': nombre}))
+        elif tipo == 'ping':
+            await self.send(text_data=json.dumps({'type': 'pong'}))
+        elif nombre in self.streams and isinstance(mensaje.get('payload'), dict):
+            await self.streams[nombre].receive(text_data=json.dumps(mensaje['payload']))
+        else:
+            await self.enviar_error(f'Stream no suscrito: {nombre}')
+
+    async def dispatch(self, message):
+        """
+        Los eventos de los grupos llegan a este canal: se entregan al stream
+        cuyo consumer tiene el handler (los tipos son únicos por módulo).
+        """
+        handler = get_handler_name(message)
+        if message['type'].startswith('websocket.') or hasattr(self, handler):
+            await super().dispatch(message)
+            return
+
+        for stream in self.streams.values():
+            if hasattr(stream, handler):
+                await stream.dispatch(message)
+                return
+
+    async def suscribir_stream(self, nombre, resume_from=None):
+        """Crea el consumer del stream sobre esta conexión y ejecuta su connect"""
+        if nombre not in STREAMS:
+            await self.enviar_error(f'Stream desconocido: {nombre}')
+            return
+        if nombre in self.streams:
+            return
+
+        stream = STREAMS[nombre]()
+        # El connect del módulo lee ?resume_from= de su scope
+        query = urlencode({'resume_from': resume_from}) if resume_from is not None else ''
+        stream.scope = {**self.scope, 'query_string': query.encode()}
+        stream.channel_layer = self.channel_layer
+        stream.channel_name = self.channel_name
+        stream.base_send = functools.partial(self.enviar_stream, nombre)
+
+        self.streams[nombre] = stream
+        await stream.connect()
+
+    async def cerrar_stream(self, nombre, close_code):
+        """Ejecuta el disconnect del módulo (sale de sus grupos) y descarta el stream"""
+        stream = self.streams.pop(nombre, None)
+        if stream is None:
+            return
+        try:
+            await stream.disconnect(close_code)
+        except Exception as e:
+            logger.warning('Error cerrando stream %s: %s', nombre, e)
+
+    async def enviar_stream(self, nombre, message):
+        """base_send de cada stream: envuelve sus mensajes con el nombre del stream"""
+        if message['type'] == 'websocket.send':
+            # El texto ya es JSON: se inserta sin volver a decodificarlo
+            # Va directo al socket: los bytes ya los contó el send del stream
+            await self.base_send({
+                'type': 'websocket.send',
+                'text': f'{{"stream": {json.dumps(nombre)}, "payload": {message["text"]}}}'
+            })
+        elif message['type'] == 'websocket.close':
+            await self.cerrar_stream(nombre, message.get('code', 1000))
+            await self.send(text_data=json.dumps({'type': 'stream_unsubscribed', 'stream': nombre}))
+
+    async def enviar_error(self, mensaje):
+        await self.send(text_data=json.dumps({'type': 'error', 'message': mensaje}))
+
+
+# Streams disponibles en la conexión multiplexada
+STREAMS = {
+    'preparacion': PreparacionConsumer,
+    'tracker': TrackerConsumer,
+    'finalizados': FinalizadoConsumer,
+    'archivadas': ArchivadaConsumer,
+    'users_online': UsersOnlineConsumer,
+}
@@ -0,0 +1,184 @@
+# backend/logs.py
+"""
+Logging estructurado y medición por petición / evento WebSocket.
+
+- `ManejadorEnCola`: el hilo de la petición solo deja el registro en una cola;
+  un hilo aparte (QueueListener) lo formatea y lo escribe. Así la escritura a
+  stdout no bloquea las vistas ni el event loop de los consumers.
+- `FormatoJSON`: una línea JSON por registro, con los campos de `extra`.
+- `medir()`: abre una medición (duración, consultas SQL, bytes) para la
+  petición o el evento actual. Las consultas se cuentan con un execute_wrapper
+  instalado en cada conexión; la medición viaja en un ContextVar, así que
+  también cuenta las consultas que hace `database_sync_to_async` en su hilo.
+- `RegistroPeticionesMiddleware` y `RegistroEventosMixin`: una línea de log
+  por petición HTTP y por evento WebSocket.
+"""
+import atexit
+import json
+import logging
+import queue
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger('backend.peticiones')
+
+# Atributos estándar de LogRecord: lo demás viene de `extra`
+_ATRIBUTOS_RECORD = set(logging.LogRecord('', 0, '', 0, '', None, None).__dict__) | {'message', 'asctime'}
+
+
+class FormatoJSON(logging.Formatter):
+    """Formatea cada registro como una línea JSON"""
+
+    def format(self, record):
+        datos = {
+            'ts': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'nivel': record.levelname,
+            'logger': record.name,
+            'mensaje': record.getMessage(),
+        }
+        for clave, valor in record.__dict__.items():
+            if clave not in _ATRIBUTOS_RECORD:
+                datos[clave] = valor
+        if record.exc_info:
+            datos['excepcion'] = self.formatException(record.exc_info)
+        return json.dumps(datos, ensure_ascii=False, default=str)
+
+
+class ManejadorEnCola(QueueHandler):
+    """
+    QueueHandler que arranca su propio QueueListener con un StreamHandler.
+    Se declara en LOGGING con '()' (dictConfig de Python 3.11 no configura listeners).
+    """
+
+    def __init__(self, formato=None):
+        super().__init__(queue.SimpleQueue())
+        destino = logging.StreamHandler()
+        if formato == 'json':
+            destino.setFormatter(FormatoJSON())
+        else:
+            destino.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s %(message)s'))
+        self.listener = QueueListener(self.queue, destino, respect_handler_level=False)
+        self.listener.start()
+        atexit.register(self.listener.stop)
+
+
+class Medicion:
+    """Acumulado de una petición o evento"""
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.consultas = 0
+        self.tiempo_consultas = 0.0
+        self.bytes = 0
+
+    def duracion_ms(self):
+        return round((time.perf_counter() - self.inicio) * 1000, 2)
+
+    def datos(self):
+        return {
+            'duracion_ms': self.duracion_ms(),
+            'consultas': self.consultas,
+            'consultas_ms': round(self.tiempo_consultas * 1000, 2),
+            'bytes': self.bytes,
+        }
+
+
+medicion_actual = ContextVar('medicion_actual', default=None)
+
+
+@contextmanager
+def medir():
+    """
+    Abre una medición para el contexto actual. Si ya hay una abierta (p. ej. un
+    stream dentro de la conexión multiplexada) se reutiliza y retorna None, para
+    que solo el nivel externo registre la línea.
+    """
+    if medicion_actual.get() is not None:
+        yield None
+        return
+    medicion = Medicion()
+    token = medicion_actual.set(medicion)
+    try:
+        yield medicion
+    finally:
+        medicion_actual.reset(token)
+
+
+def contar_consultas(execute, sql, params, many, context):
+    """execute_wrapper: suma la consulta a la medición actual (si hay una)"""
+    medicion = medicion_actual.get()
+    if medicion is None:
+        return execute(sql, params, many, context)
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        medicion.consultas += 1
+        medicion.tiempo_consultas += time.perf_counter() - inicio
+
+
+def instalar_contador(sender, connection, **kwargs):
+    if contar_consultas not in connection.execute_wrappers:
+        connection.execute_wrappers.append(contar_consultas)
+
+
+connection_created.connect(instalar_contador, dispatch_uid='backend.logs.instalar_contador')
+
+
+class RegistroPeticionesMiddleware:
+    """Una línea de log por petición HTTP: ruta, estado, duración, consultas y tamaño"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with medir() as medicion:
+            response = self.get_response(request)
+            if medicion is not None:
+                if not response.streaming:
+                    medicion.bytes = len(response.content)
+                logger.info('peticion', extra={
+                    'metodo': request.method,
+                    'ruta': request.path,
+                    'estado': response.status_code,
+                    **medicion.datos(),
+                })
+        return response
+
+
+# Funciones (consumer, tipo, medicion) que se llaman al terminar cada evento WebSocket
+observadores_eventos_ws = []
+
+
+class RegistroEventosMixin:
+    """
+    Para consumers: una línea de log por mensaje despachado (del cliente o de
+    un grupo) con su duración, consultas y bytes enviados al cliente.
+
+    Los mensajes del cliente se registran en INFO; los eventos de grupo, que se
+    repiten en cada conexión suscrita, en DEBUG.
+    """
+
+    async def dispatch(self, message):
+        with medir() as medicion:
+            await super().dispatch(message)
+            if medicion is not None:
+                consumer = type(self).__name__
+                for observador in observadores_eventos_ws:
+                    observador(consumer, message['type'], medicion)
+                nivel = logging.INFO if message['type'].startswith('websocket.') else logging.DEBUG
+                logger.log(nivel, 'evento_ws', extra={
+                    'consumer': consumer,
+                    'tipo': message['type'],
+                    **medicion.datos(),
+                })
+
+    async def send(self, text_data=None, bytes_data=None, close=False):
+        medicion = medicion_actual.get()
+        if medicion is not None:
+            medicion.bytes += len(text_data.encode()) if text_data else len(bytes_data or b'')
+        await super().send(text_data=text_data, bytes_data=bytes_data, close=close)
@@ -0,0 +1,232 @@
+# backend/metricas.py
+"""
+Métricas de la API y de los WebSockets en formato de texto de Prometheus.
+
+- `MetricasMiddleware` (HTTP): latencia, consultas SQL (cantidad y tiempo) y
+  tamaño de respuesta por ruta. La ruta es el patrón de la URL
+  (`api/tracker/<int:pk>/update/`), no el path, para no abrir una serie por ID.
+- `MetricasWebSocketMiddleware` (Channels): mensajes y bytes recibidos/enviados
+  y conexiones abiertas por ruta WebSocket.
+- `RegistroEventosMixin` (backend/logs.py) registra la duración de cada evento
+  despachado por los consumers.
+
+Los valores son del proceso: con varios workers cada uno expone los suyos en
+`/metrics` y el scraper debe consultarlos por separado.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+from backend.logs import medicion_actual, medir, observadores_eventos_ws
+
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BUCKETS_CONSULTAS = (1, 2, 3, 5, 10, 20, 50, 100)
+BUCKETS_BYTES = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+_lock = threading.Lock()
+
+
+def escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def formatear_etiquetas(nombres, valores, extra=''):
+    pares = [f'{nombre}="{escapar(valor)}"' for nombre, valor in zip(nombres, valores)]
+    if extra:
+        pares.append(extra)
+    return '{' + ','.join(pares) + '}' if pares else ''
+
+
+class Metrica:
+    """Base: nombre, ayuda, etiquetas y series por combinación de valores"""
+    tipo = None
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = etiquetas
+        self.series = {}
+
+    def exponer(self):
+        lineas = [f'# HELP {self.nombre} {self.ayuda}', f'# TYPE {self.nombre} {self.tipo}']
+        with _lock:
+            series = {valores: list(datos) if isinstance(datos, list) else datos for valores, datos in self.series.items()}
+        for valores, datos in sorted(series.items()):
+            lineas.extend(self.lineas_serie(valores, datos))
+        return lineas
+
+
+class Contador(Metrica):
+    tipo = 'counter'
+
+    def incrementar(self, *valores, cantidad=1):
+        with _lock:
+            self.series[valores] = self.series.get(valores, 0) + cantidad
+
+    def lineas_serie(self, valores, total):
+        return [f'{self.nombre}{formatear_etiquetas(self.etiquetas, valores)} {total}']
+
+
+class Medidor(Metrica):
+    tipo = 'gauge'
+
+    def sumar(self, *valores, cantidad=1):
+        with _lock:
+            self.series[valores] = self.series.get(valores, 0) + cantidad
+
+    def lineas_serie(self, valores, actual):
+        return [f'{self.nombre}{formatear_etiquetas(self.etiquetas, valores)} {actual}']
+
+
+class Histograma(Metrica):
+    tipo = 'histogram'
+
+    def __init__(self, nombre, ayuda, etiquetas=(), buckets=BUCKETS_SEGUNDOS):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.buckets = buckets
+
+    def observar(self, valor, *valores):
+        with _lock:
+            # [conteo por bucket..., suma, total]
+            serie = self.series.setdefault(valores, [0] * len(self.buckets) + [0, 0])
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    serie[i] += 1
+            serie[-2] += valor
+            serie[-1] += 1
+
+    def lineas_serie(self, valores, serie):
+        lineas = []
+        for limite, conteo in zip(self.buckets, serie):
+            etiquetas = formatear_etiquetas(self.etiquetas, valores, f'le="{limite}"')
+            lineas.append(f'{self.nombre}_bucket{etiquetas} {conteo}')
+        etiquetas = formatear_etiquetas(self.etiquetas, valores, 'le="+Inf"')
+        lineas.append(f'{self.nombre}_bucket{etiquetas} {serie[-1]}')
+        etiquetas = formatear_etiquetas(self.etiquetas, valores)
+        lineas.append(f'{self.nombre}_sum{etiquetas} {round(serie[-2], 6)}')
+        lineas.append(f'{self.nombre}_count{etiquetas} {serie[-1]}')
+        return lineas
+
+
+http_duracion = Histograma(
+    'http_request_duration_seconds', 'Duración de las peticiones HTTP',
+    ('method', 'route', 'status')
+)
+http_consultas = Histograma(
+    'http_request_db_queries', 'Consultas SQL por petición HTTP',
+    ('route',), BUCKETS_CONSULTAS
+)
+http_tiempo_consultas = Contador(
+    'http_request_db_seconds_total', 'Tiempo total en consultas SQL por ruta',
+    ('route',)
+)
+http_bytes = Histograma(
+    'http_response_size_bytes', 'Tamaño de las respuestas HTTP',
+    ('route',), BUCKETS_BYTES
+)
+ws_mensajes = Contador(
+    'ws_messages_total', 'Mensajes WebSocket por ruta y dirección (in = del cliente, out = al cliente)',
+    ('path', 'direction')
+)
+ws_bytes = Contador(
+    'ws_message_bytes_total', 'Bytes de mensajes WebSocket por ruta y dirección',
+    ('path', 'direction')
+)
+ws_conexiones = Medidor(
+    'ws_connections', 'Conexiones WebSocket abiertas',
+    ('path',)
+)
+ws_eventos = Histograma(
+    'ws_event_duration_seconds', 'Duración del despacho de cada mensaje en los consumers',
+    ('consumer', 'type')
+)
+
+# Duración de cada evento despachado por los consumers (ver RegistroEventosMixin)
+observadores_eventos_ws.append(
+    lambda consumer, tipo, medicion: ws_eventos.observar(medicion.duracion_ms() / 1000, consumer, tipo)
+)
+
+METRICAS = (
+    http_duracion, http_consultas, http_tiempo_consultas, http_bytes,
+    ws_mensajes, ws_bytes, ws_conexiones, ws_eventos,
+)
+
+
+def exponer():
+    """Todas las métricas en formato de texto de Prometheus"""
+    lineas = []
+    for metrica in METRICAS:
+        lineas.extend(metrica.exponer())
+    return '\n'.join(lineas) + '\n'
+
+
+@contextmanager
+def medicion_en_curso():
+    """La medición abierta por RegistroPeticionesMiddleware, o una nueva si no hay"""
+    medicion = medicion_actual.get()
+    if medicion is not None:
+        yield medicion
+        return
+    with medir() as medicion:
+        yield medicion
+
+
+class MetricasMiddleware:
+    """Registra latencia, consultas SQL y tamaño de respuesta por ruta"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with medicion_en_curso() as medicion:
+            inicio = time.perf_counter()
+            consultas, tiempo_consultas = medicion.consultas, medicion.tiempo_consultas
+
+            response = self.get_response(request)
+
+            duracion = time.perf_counter() - inicio
+            match = request.resolver_match
+            ruta = match.route if match else 'sin_ruta'
+            http_duracion.observar(duracion, request.method, ruta, response.status_code)
+            http_consultas.observar(medicion.consultas - consultas, ruta)
+            http_tiempo_consultas.incrementar(ruta, cantidad=medicion.tiempo_consultas - tiempo_consultas)
+            if not response.streaming:
+                http_bytes.observar(len(response.content), ruta)
+        return response
+
+
+class MetricasWebSocketMiddleware:
+    """Middleware ASGI de Channels: tasa de mensajes, bytes y conexiones por ruta WebSocket"""
+
+    def __init__(self, inner):
+        self.inner = inner
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'websocket':
+            return await self.inner(scope, receive, send)
+
+        path = scope.get('path', '')
+        conectado = False
+
+        async def recibir():
+            message = await receive()
+            if message['type'] == 'websocket.receive':
+                ws_mensajes.incrementar(path, 'in')
+                ws_bytes.incrementar(path, 'in', cantidad=len(message.get('text') or message.get('bytes') or ''))
+            return message
+
+        async def enviar(message):
+            nonlocal conectado
+            if message['type'] == 'websocket.send':
+                ws_mensajes.incrementar(path, 'out')
+                ws_bytes.incrementar(path, 'out', cantidad=len(message.get('text') or message.get('bytes') or ''))
+            elif message['type'] == 'websocket.accept' and not conectado:
+                conectado = True
+                ws_conexiones.sumar(path)
+            await send(message)
+
+        try:
+            return await self.inner(scope, recibir, enviar)
+        finally:
+            if conectado:
+                ws_conexiones.sumar(path, cantidad=-1)
@@ -1,42 +1,184 @@
-# backend/middleware.py
+import logging
+import threading
+import time
+from collections import OrderedDict
+
 from channels.db import database_sync_to_async
 from channels.middleware import BaseMiddleware
+from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
+from django.db import transaction
 from rest_framework_simplejwt.tokens import AccessToken
 from django.contrib.auth import get_user_model
 from urllib.parse import parse_qs
 
 User = get_user_model()
+logger = logging.getLogger(__name__)
+
+
+class CacheUsuarios:
+    """
+    Cache en memoria (acotado y con TTL) de los usuarios autenticados por WebSocket.
+
+    Un cliente abre varios sockets y en una tormenta de reconexiones todos
+    repiten el handshake: con el cache solo el primero consulta la base de datos.
+
+    `update_user` y `delete_user` invalidan la entrada con `invalidar_usuario`,
+    que con el backend 'redis' publica el ID en un canal de Redis; cada worker
+    escucha ese canal en un hilo y descarta su copia. Mientras el hilo no está
+    suscrito (arranque, Redis caído) el cache no se usa, así un usuario
+    desactivado no se autentica con una copia vieja. El TTL queda como límite.
+    """
+
+    CANAL = 'auth_ws:invalidar'
+
+    def __init__(self, tamano, ttl, backend='local', redis_url=None):
+        self.tamano = tamano
+        self.ttl = ttl
+        self.backend = backend
+        self.redis_url = redis_url
+        self.lock = threading.Lock()
+        # str(user_id) -> (vencimiento, user); el claim del token puede venir como texto
+        self.usuarios = OrderedDict()
+        self.suscrito = threading.Event()
+        self.oyente = None
+        self.cliente = None
+
+    def escuchar(self):
+        """Arranca (una vez por proceso) el hilo que recibe las invalidaciones de otros workers"""
+        with self.lock:
+            if self.oyente is None:
+                self.oyente = threading.Thread(target=self.recibir_invalidaciones, name='cache-usuarios-ws', daemon=True)
+                self.oyente.start()
+
+    def recibir_invalidaciones(self):
+        import redis
+        while True:
+            try:
+                suscripcion = redis.Redis.from_url(self.redis_url).pubsub(ignore_subscribe_messages=True)
+                suscripcion.subscribe(self.CANAL)
+                self.suscrito.set()
+                for mensaje in suscripcion.listen():
+                    self.invalidar(mensaje['data'].decode())
+            except Exception as e:
+                logger.warning('Invalidaciones del cache de usuarios WS interrumpidas: %s', e)
+            # Sin suscripción no se sabe qué cambió: se descarta todo hasta reconectar
+            self.suscrito.clear()
+            self.vaciar()
+            time.sleep(1)
+
+    def disponible(self):
+        """El cache solo se usa si las invalidaciones de otros procesos llegan"""
+        if self.backend != 'redis':
+            return True
+        self.escuchar()
+        return self.suscrito.is_set()
+
+    def obtener(self, user_id):
+        user_id = str(user_id)
+        if not self.disponible():
+            return None
+        with self.lock:
+            entrada = self.usuarios.get(user_id)
+            if entrada is None:
+                return None
+            if entrada[0] <= time.monotonic():
+                del self.usuarios[user_id]
+                return None
+            self.usuarios.move_to_end(user_id)
+            return entrada[1]
+
+    def guardar(self, user_id, user):
+        user_id = str(user_id)
+        if not self.disponible():
+            return
+        with self.lock:
+            self.usuarios[user_id] = (time.monotonic() + self.ttl, user)
+            self.usuarios.move_to_end(user_id)
+            while len(self.usuarios) > self.tamano:
+                self.usuarios.popitem(last=False)
+
+    def invalidar(self, user_id):
+        with self.lock:
+            self.usuarios.pop(str(user_id), None)
+
+    def vaciar(self):
+        with self.lock:
+            self.usuarios.clear()
+
+    def publicar(self, user_id):
+        """Avisa la invalidación a los demás workers"""
+        if self.backend != 'redis':
+            return
+        try:
+            if self.cliente is None:
+                import redis
+                self.cliente = redis.Redis.from_url(self.redis_url)
+            self.cliente.publish(self.CANAL, str(user_id))
+        except Exception as e:
+            logger.warning('No se pudo publicar la invalidación del usuario %s: %s', user_id, e)
+
+
+_config = getattr(settings, 'AUTENTICACION_WS', {})
+cache_usuarios = CacheUsuarios(
+    _config.get('TAMANO_CACHE', 1000),
+    _config.get('TTL_CACHE', 60),
+    _config.get('BACKEND', 'local'),
+    _config.get('REDIS_URL', 'redis://127.0.0.1:6379/0'),
+)
+
+
+def invalidar_usuario(user_id):
+    """Descarta el usuario del cache de autenticación WebSocket de todos los workers (tras editarlo o eliminarlo)"""
+    def invalidar():
+        cache_usuarios.invalidar(user_id)
+        cache_usuarios.publicar(user_id)
+    # Después del commit: otro worker que recargue antes leería el usuario viejo
+    transaction.on_commit(invalidar)
+
 
 @database_sync_to_async
-def get_user_from_token(token_key):
-    """Obtiene el usuario desde el token JWT"""
+def cargar_usuario(user_id):
+    """Consulta el usuario en la base de datos (None si no existe)"""
+    return User.objects.filter(id=user_id).first()
+
+
+async def get_user_from_token(token_key):
+    """
+    Obtiene el usuario desde el token JWT.
+
+    La firma y el vencimiento del token se validan en cada handshake (no usa
+    la base de datos); el usuario sale del cache si está, y solo si no se consulta.
+    """
     try:
         # Limpiar el token (remover "Bearer " si existe)
         token_key = token_key.strip()
         if token_key.startswith('Bearer '):
             token_key = token_key[7:]
         
-        print(f"🔐 Procesando token...")
-        print(f"   Token (primeros 30 chars): {token_key[:30]}...")
-        
         # Decodificar el token
         access_token = AccessToken(token_key)
         user_id = access_token['user_id']
         
-        print(f"✅ Token decodificado exitosamente")
-        print(f"   User ID: {user_id}")
-        
         # Obtener el usuario
-        user = User.objects.get(id=user_id)
-        print(f"✅ Usuario autenticado: {user.username} (ID: {user.id}, Role: {user.role})")
+        user = cache_usuarios.obtener(user_id)
+        if user is None:
+            user = await cargar_usuario(user_id)
+            if user is None:
+                logger.warning('Token de un usuario que no existe (ID: %s)', user_id)
+                return AnonymousUser()
+            cache_usuarios.guardar(user_id, user)
+        
+        # Igual que en la API: un usuario desactivado no se autentica
+        if not user.is_active:
+            logger.info('Usuario desactivado: %s (ID: %s)', user.username, user.id)
+            return AnonymousUser()
         
+        logger.debug('Usuario autenticado: %s (ID: %s, Role: %s)', user.username, user.id, user.role)
         return user
         
     except Exception as e:
-        print(f"❌ Error al autenticar token:")
-        print(f"   Tipo: {type(e).__name__}")
-        print(f"   Mensaje: {str(e)}")
+        logger.info('Error al autenticar token: %s: %s', type(e).__name__, e)
         return AnonymousUser()
 
 
@@ -44,37 +186,18 @@ class JWTAuthMiddleware(BaseMiddleware):
     """Middleware personalizado para autenticación JWT en WebSockets"""
     
     async def __call__(self, scope, receive, send):
-        print("\n" + "=" * 60)
-        print("🔍 JWTAuthMiddleware - Iniciando autenticación WebSocket")
-        print("=" * 60)
-        
         # Obtener el token de la query string
-        query_string = scope.get('query_string', b'').decode()
-        print(f"📋 Query string completo: {query_string[:100]}...")
-        
-        query_params = parse_qs(query_string)
-        
-        token = None
-        
-        # Buscar el token en query params
-        if 'token' in query_params:
-            token = query_params['token'][0]
-            print(f"✅ Token encontrado en query params")
-            print(f"   Longitud del token: {len(token)} caracteres")
-        else:
-            print(f"❌ No se encontró 'token' en query params")
-            print(f"   Parámetros disponibles: {list(query_params.keys())}")
+        query_params = parse_qs(scope.get('query_string', b'').decode())
+        token = query_params['token'][0] if 'token' in query_params else None
         
         # Autenticar
         if token:
             scope['user'] = await get_user_from_token(token)
         else:
             scope['user'] = AnonymousUser()
-            print("⚠️ Usuario establecido como AnonymousUser")
+            logger.debug('Handshake sin token en query params: %s', list(query_params.keys()))
         
-        print(f"👤 Usuario final: {scope['user']}")
-        print(f"   Autenticado: {scope['user'].is_authenticated if scope['user'] else False}")
-        print("=" * 60 + "\n")
+        logger.debug('Handshake WebSocket %s - usuario: %s', scope.get('path'), scope['user'])
         
         return await super().__call__(scope, receive, send)
 
@@ -0,0 +1,361 @@
+# backend/notificaciones.py
+"""
+Despachador de notificaciones WebSocket (outbox en memoria).
+
+Las vistas ya no llaman a `group_send` dentro de la petición: `encolar_evento`
+registra el evento con `transaction.on_commit` y, cuando la transacción se
+confirma, lo deja en una cola. Un hilo en segundo plano con su propio event loop
+vacía la cola por lotes, fusiona las actualizaciones repetidas de un mismo
+registro y las envía al channel layer.
+
+Los eventos `*_updated` se retienen una ventana corta por registro
+(VENTANA_ACTUALIZACION): si el mismo trámite se edita varias veces seguidas, los
+clientes reciben un solo evento con el último estado.
+
+Antes de enviar, cada evento recibe su número de secuencia del grupo y se guarda
+en el registro de eventos (backend/registro_eventos.py) para la reanudación.
+
+Los eventos que traen `filtros` (proveedor, departamento, estado del registro) se
+envían también a los grupos por filtro (`<grupo>.<dimension>.<valor>`), donde están
+solo los clientes suscritos a ese filtro.
+
+Así la latencia de la petición no incluye el round trip a Redis y no se notifican
+cambios que terminan en rollback.
+"""
+import asyncio
+import atexit
+import logging
+import re
+import threading
+import time
+from collections import deque
+
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+from backend.registro_eventos import get_config, get_registro
+
+logger = logging.getLogger(__name__)
+
+
+def nombre_grupo_filtro(grupo, dimension, valor):
+    """Nombre del grupo de Channels para un filtro (solo caracteres válidos en nombres de grupo)"""
+    valor = re.sub(r'[^A-Za-z0-9_.-]', '_', str(valor))[:40]
+    return f'{grupo}.{dimension}.{valor}'
+
+
+def grupos_destino(grupo, evento):
+    """
+    Grupos a los que se envía el evento: el grupo del módulo y, si el evento trae
+    `filtros`, el grupo del valor actual de cada dimensión. El grupo del valor
+    anterior solo si cambió (el registro sale de ese filtro) o si es una eliminación.
+    """
+    destinos = [grupo]
+    filtros = evento.get('filtros')
+    if not filtros:
+        return destinos
+
+    actual, anterior = filtros['actual'], filtros['anterior']
+    eliminado = evento['type'].endswith('_deleted')
+    valores = list(actual.items()) + [
+        (dimension, valor) for dimension, valor in anterior.items()
+        if eliminado or valor != actual.get(dimension)
+    ]
+    for dimension, valor in valores:
+        if valor is None:
+            continue
+        destino = nombre_grupo_filtro(grupo, dimension, valor)
+        if destino not in destinos:
+            destinos.append(destino)
+    return destinos
+
+
+def combinar_filtros(anterior, nuevo):
+    """Filtros de dos eventos combinados: valores actuales del nuevo, anteriores del primero"""
+    if 'filtros' not in anterior or 'filtros' not in nuevo:
+        return nuevo.get('filtros')
+    return {'actual': nuevo['filtros']['actual'], 'anterior': anterior['filtros']['anterior']}
+
+
+def id_registro(evento):
+    """ID del registro al que se refiere el evento (o None)"""
+    data = evento.get('data')
+    if isinstance(data, dict):
+        return data.get('id')
+    return None
+
+
+def construir_delta(data, claves):
+    """
+    Datos de un evento de actualización parcial: solo las claves que cambiaron.
+
+    `version_base` es la versión sobre la que se aplican los cambios; si el
+    cliente tiene otra versión del registro perdió eventos y debe pedir resync.
+
+    Args:
+        data (dict): Payload completo del registro (con 'id' y 'version')
+        claves (iterable): Claves del payload que cambiaron
+
+    Returns:
+        dict: {'id', 'version', 'version_base', 'cambios'}
+    """
+    return {
+        'id': data['id'],
+        'version': data['version'],
+        'version_base': data['version'] - 1,
+        'cambios': {clave: data[clave] for clave in claves if clave in data},
+    }
+
+
+def combinar_eventos(anterior, nuevo):
+    """
+    Combina dos actualizaciones del mismo registro en una.
+
+    Si ambas son parciales se unen los cambios (gana el más reciente) solo si son
+    consecutivas (la base de la nueva es la versión de la anterior); si no, se
+    retorna None y deben enviarse por separado. Un payload completo reemplaza al
+    anterior.
+    """
+    datos_anterior = anterior.get('data') or {}
+    datos_nuevo = nuevo.get('data') or {}
+    filtros = combinar_filtros(anterior, nuevo)
+    if 'cambios' not in datos_nuevo:
+        return {**nuevo, 'filtros': filtros} if filtros else nuevo
+    if 'cambios' not in datos_anterior or datos_nuevo['version_base'] != datos_anterior['version']:
+        return None
+
+    combinado = {
+        **nuevo,
+        'data': {
+            **datos_nuevo,
+            'version_base': datos_anterior['version_base'],
+            'cambios': {**datos_anterior['cambios'], **datos_nuevo['cambios']},
+        },
+    }
+    if filtros:
+        combinado['filtros'] = filtros
+    return combinado
+
+
+def fusionar_eventos(lote):
+    """
+    Fusiona los eventos `*_updated` repetidos de un mismo registro dentro del lote.
+
+    La última versión se combina con la anterior en su posición (ver
+    `combinar_eventos`). Si entre las dos llega otro evento del mismo registro
+    (p. ej. `*_deleted`) no se fusionan, para no alterar el orden que ven los
+    clientes.
+
+    Args:
+        lote (list): [(grupo, evento), ...] en orden de llegada
+
+    Returns:
+        list: [(grupo, evento), ...] sin actualizaciones redundantes
+    """
+    resultado = []
+    posiciones = {}
+
+    for grupo, evento in lote:
+        registro = id_registro(evento)
+
+        if registro is not None and evento['type'].endswith('_updated'):
+            clave = (grupo, evento['type'], registro)
+            if clave in posiciones:
+                combinado = combinar_eventos(resultado[posiciones[clave]][1], evento)
+                if combinado is not None:
+                    resultado[posiciones[clave]] = (grupo, combinado)
+                    continue
+            posiciones[clave] = len(resultado)
+
+        elif registro is not None:
+            for clave in [c for c in posiciones if c[0] == grupo and c[2] == registro]:
+                del posiciones[clave]
+
+        resultado.append((grupo, evento))
+
+    return resultado
+
+
+class DespachadorNotificaciones:
+    """
+    Cola de eventos + hilo que los envía por lotes al channel layer.
+
+    Las actualizaciones (`*_updated`) esperan en `retenidos` hasta que vence la
+    ventana del registro; mientras tanto cada nueva actualización se combina con
+    la anterior. Cualquier otro evento del mismo registro libera primero la
+    actualización retenida, para no alterar el orden.
+
+    El hilo se inicia con el primer evento (después de un fork cada proceso
+    arranca el suyo) y al terminar el proceso se vacía lo pendiente.
+    """
+
+    def __init__(self):
+        self.cola = deque()
+        self.retenidos = {}
+        self.condicion = threading.Condition()
+        self.hilo = None
+        self.cerrando = False
+
+    def agregar(self, grupo, evento):
+        """Agrega un evento ya confirmado a la cola (o lo retiene si es una actualización)"""
+        registro = id_registro(evento)
+        with self.condicion:
+            if registro is not None and evento['type'].endswith('_updated'):
+                clave = (grupo, evento['type'], registro)
+                combinado = None
+                if clave in self.retenidos:
+                    combinado = combinar_eventos(self.retenidos[clave][1], evento)
+                    if combinado is None:
+                        # No son consecutivas: la retenida sale primero
+                        self.liberar(lambda c: c == clave)
+                if combinado is not None:
+                    # Misma ventana: se conserva el vencimiento y se actualiza el estado
+                    self.retenidos[clave][1] = combinado
+                else:
+                    vence = time.monotonic() + get_config('VENTANA_ACTUALIZACION', 0.3)
+                    self.retenidos[clave] = [vence, evento]
+            else:
+                if registro is not None:
+                    self.liberar(lambda clave: clave[0] == grupo and clave[2] == registro)
+                self.cola.append((grupo, evento))
+            self.iniciar()
+            self.condicion.notify()
+
+    def liberar(self, condicion):
+        """Pasa a la cola las actualizaciones retenidas que cumplen la condición (con la condición tomada)"""
+        claves = sorted(
+            (clave for clave in self.retenidos if condicion(clave)),
+            key=lambda clave: self.retenidos[clave][0]
+        )
+        for clave in claves:
+            _, evento = self.retenidos.pop(clave)
+            self.cola.append((clave[0], evento))
+
+    def iniciar(self):
+        """Inicia el hilo si aún no está corriendo (llamar con la condición tomada)"""
+        if self.hilo is None or not self.hilo.is_alive():
+            self.cerrando = False
+            self.hilo = threading.Thread(
+                target=self.ejecutar,
+                name='despachador-notificaciones',
+                daemon=True
+            )
+            self.hilo.start()
+
+    def detener(self, timeout=5):
+        """Envía lo pendiente y detiene el hilo"""
+        with self.condicion:
+            if self.hilo is None:
+                return
+            self.cerrando = True
+            self.condicion.notify()
+        self.hilo.join(timeout)
+
+    def ejecutar(self):
+        """Ciclo del hilo: espera eventos, junta un lote y lo envía"""
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            while True:
+                lote = self.esperar_lote()
+                if lote is None:
+                    break
+                loop.run_until_complete(self.enviar(lote))
+        finally:
+            loop.close()
+
+    def esperar_lote(self):
+        """
+        Bloquea hasta que haya eventos listos (en cola o con ventana vencida),
+        espera el intervalo de flush para acumular el lote y retorna hasta
+        TAMANO_LOTE eventos.
+        Retorna None cuando el despachador se está cerrando y no queda nada.
+        """
+        with self.condicion:
+            while True:
+                ahora = time.monotonic()
+                self.liberar(lambda clave: self.retenidos[clave][0] <= ahora)
+                if self.cerrando:
+                    self.liberar(lambda clave: True)
+                if self.cola or self.cerrando:
+                    break
+                espera = None
+                if self.retenidos:
+                    espera = min(vence for vence, _ in self.retenidos.values()) - ahora
+                self.condicion.wait(espera)
+
+            if not self.cola:
+                return None
+            cerrando = self.cerrando
+
+        if not cerrando:
+            time.sleep(get_config('INTERVALO_FLUSH', 0.05))
+
+        tamano = get_config('TAMANO_LOTE', 500)
+        with self.condicion:
+            ahora = time.monotonic()
+            self.liberar(lambda clave: self.retenidos[clave][0] <= ahora)
+            return [self.cola.popleft() for _ in range(min(tamano, len(self.cola)))]
+
+    async def enviar(self, lote):
+        """
+        Envía el lote fusionado. Los grupos se envían en paralelo y, dentro de
+        cada grupo, en el orden de llegada.
+        """
+        channel_layer = get_channel_layer()
+        por_grupo = {}
+        for grupo, evento in fusionar_eventos(lote):
+            por_grupo.setdefault(grupo, []).append(evento)
+
+        # Numerar y guardar en el registro para que los clientes puedan reanudar
+        registro = get_registro()
+        for grupo, eventos in por_grupo.items():
+            try:
+                registro.registrar(grupo, eventos)
+            except Exception as e:
+                logger.warning('WebSocket: Error registrando eventos de %s: %s', grupo, e)
+
+        async def enviar_grupo(grupo, eventos):
+            for evento in eventos:
+                try:
+                    await channel_layer.group_send(grupo, evento)
+                except Exception as e:
+                    logger.warning('WebSocket: Error enviando %s a %s: %s', evento.get('type'), grupo, e)
+
+        # Cada evento va al grupo del módulo y a los grupos de sus filtros
+        por_destino = {}
+        for grupo, eventos in por_grupo.items():
+            for evento in eventos:
+                for destino in grupos_destino(grupo, evento):
+                    por_destino.setdefault(destino, []).append(evento)
+
+        await asyncio.gather(*(enviar_grupo(grupo, eventos) for grupo, eventos in por_destino.items()))
+
+
+despachador = DespachadorNotificaciones()
+atexit.register(despachador.detener)
+
+
+def encolar_evento(grupo, evento, filtros=None, dimensiones=None):
+    """
+    Programa el envío de un evento a un grupo de Channels.
+
+    Dentro de `transaction.atomic()` se encola recién al hacer commit (y se
+    descarta si hay rollback); fuera de una transacción se encola de inmediato.
+
+    Args:
+        grupo (str): Nombre del grupo de Channels
+        evento (dict): Mensaje con 'type' (handler del consumer) y 'data'
+        filtros (dict, optional): {'actual': {...}, 'anterior': {...}} con los valores
+            de cada dimensión de filtro del registro, para enviarlo a los grupos por filtro
+        dimensiones (tuple, optional): Dimensiones que acepta el consumer del grupo
+            (`dimensiones_filtro`); las demás no tienen suscriptores y no se envían
+    """
+    if filtros:
+        if dimensiones is not None:
+            filtros = {
+                clave: {dim: valor for dim, valor in valores.items() if dim in dimensiones}
+                for clave, valores in filtros.items()
+            }
+        evento['filtros'] = filtros
+    transaction.on_commit(lambda: despachador.agregar(grupo, evento))
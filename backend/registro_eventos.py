@@ -0,0 +1,173 @@
+# backend/registro_eventos.py
+"""
+Secuencia y registro acotado de eventos WebSocket por grupo.
+
+El despachador de notificaciones numera cada evento con una secuencia creciente
+por grupo (`seq`) y lo guarda en un registro de los últimos TAMANO_REGISTRO
+eventos. Un cliente que se reconecta con `?resume_from=<seq>` recibe los eventos
+que se perdió en lugar de recargar todo el listado.
+
+Backends (settings.NOTIFICACIONES['REGISTRO_EVENTOS']):
+- 'redis': secuencia con INCRBY y registro en un ZSET (compartido entre procesos)
+- 'local': deque en memoria (un solo proceso; desarrollo y pruebas)
+"""
+import json
+import threading
+from collections import deque
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+def get_config(clave, defecto):
+    """Lee una opción de settings.NOTIFICACIONES"""
+    return getattr(settings, 'NOTIFICACIONES', {}).get(clave, defecto)
+
+
+class RegistroEventosLocal:
+    """Registro en memoria del proceso"""
+
+    def __init__(self, tamano):
+        self.tamano = tamano
+        self.lock = threading.Lock()
+        self.secuencias = {}
+        self.eventos = {}
+
+    def registrar(self, grupo, eventos):
+        """Asigna `seq` a cada evento (en orden) y los guarda en el registro"""
+        with self.lock:
+            ultimo = self.secuencias.get(grupo, 0)
+            registro = self.eventos.setdefault(grupo, deque(maxlen=self.tamano))
+            for evento in eventos:
+                ultimo += 1
+                evento['seq'] = ultimo
+                registro.append(evento)
+            self.secuencias[grupo] = ultimo
+        return eventos
+
+    def ultimo(self, grupo):
+        """Última secuencia asignada en el grupo (0 si no hay eventos)"""
+        with self.lock:
+            return self.secuencias.get(grupo, 0)
+
+    def desde(self, grupo, seq):
+        """
+        Eventos con secuencia mayor a `seq`.
+        Retorna None si el registro ya no los tiene todos (el cliente debe recargar).
+        """
+        with self.lock:
+            registro = list(self.eventos.get(grupo, ()))
+            ultimo = self.secuencias.get(grupo, 0)
+        if seq > ultimo:
+            # La secuencia se reinició (p. ej. reinicio del proceso): el cliente debe recargar
+            return None
+        if seq == ultimo:
+            return []
+        if not registro or registro[0]['seq'] > seq + 1:
+            return None
+        return [evento for evento in registro if evento['seq'] > seq]
+
+
+class RegistroEventosRedis:
+    """Registro compartido en Redis: `ws:seq:<grupo>` (contador) y `ws:eventos:<grupo>` (ZSET por seq)"""
+
+    def __init__(self, url, tamano):
+        import redis
+        self.cliente = redis.Redis.from_url(url)
+        self.tamano = tamano
+
+    def registrar(self, grupo, eventos):
+        """Reserva un rango de secuencias con un solo INCRBY y guarda el lote en un pipeline"""
+        if not eventos:
+            return eventos
+        ultimo = self.cliente.incrby(f'ws:seq:{grupo}', len(eventos))
+        primero = ultimo - len(eventos) + 1
+
+        pipe = self.cliente.pipeline(transaction=False)
+        for seq, evento in enumerate(eventos, start=primero):
+            evento['seq'] = seq
+            pipe.zadd(f'ws:eventos:{grupo}', {json.dumps(evento, cls=DjangoJSONEncoder): seq})
+        pipe.zremrangebyrank(f'ws:eventos:{grupo}', 0, -self.tamano - 1)
+        pipe.execute()
+        return eventos
+
+    def ultimo(self, grupo):
+        return int(self.cliente.get(f'ws:seq:{grupo}') or 0)
+
+    def desde(self, grupo, seq):
+        pipe = self.cliente.pipeline(transaction=False)
+        pipe.get(f'ws:seq:{grupo}')
+        pipe.zrange(f'ws:eventos:{grupo}', 0, 0, withscores=True)
+        pipe.zrangebyscore(f'ws:eventos:{grupo}', f'({seq}', '+inf')
+        ultimo, primero, eventos = pipe.execute()
+
+        ultimo = int(ultimo or 0)
+        if seq > ultimo:
+            return None
+        if seq == ultimo:
+            return []
+        if not primero or int(primero[0][1]) > seq + 1:
+            return None
+        return [json.loads(evento) for evento in eventos]
+
+
+_registro = None
+_registro_lock = threading.Lock()
+
+
+def get_registro():
+    """Registro de eventos configurado (se crea una vez por proceso)"""
+    global _registro
+    with _registro_lock:
+        if _registro is None:
+            tamano = get_config('TAMANO_REGISTRO', 1000)
+            if get_config('REGISTRO_EVENTOS', 'local') == 'redis':
+                _registro = RegistroEventosRedis(get_config('REDIS_URL', 'redis://127.0.0.1:6379/0'), tamano)
+            else:
+                _registro = RegistroEventosLocal(tamano)
+        return _registro
+
+
+def get_resume_from(scope):
+    """Lee `?resume_from=<seq>` de la URL del WebSocket (None si no viene o es inválido)"""
+    query = parse_qs(scope.get('query_string', b'').decode())
+    try:
+        return int(query['resume_from'][0])
+    except (KeyError, IndexError, ValueError):
+        return None
+
+
+async def reanudar(consumer, grupo, resume_from=None):
+    """
+    Handshake de reanudación al conectar.
+
+    Llamar después de group_add: así ningún evento nuevo queda en el hueco entre
+    la lectura del registro y la suscripción (a lo sumo llega repetido; el
+    cliente descarta los `seq` que ya procesó).
+
+    - Sin `resume_from` (argumento o query string): no hace nada.
+    - Si el registro cubre los eventos perdidos: los reenvía por los handlers del consumer.
+    - Si no: envía `resync_required` para que el cliente recargue el listado.
+    """
+    if resume_from is None:
+        resume_from = get_resume_from(consumer.scope)
+    if resume_from is None:
+        return
+
+    eventos = await sync_to_async(get_registro().desde, thread_sensitive=False)(grupo, resume_from)
+    if eventos is None:
+        await consumer.send(text_data=json.dumps({
+            'type': 'resync_required',
+            'message': 'Se perdieron demasiados eventos, recargar el listado'
+        }))
+        return
+
+    for evento in eventos:
+        await consumer.dispatch(evento)
+
+
+async def ultima_secuencia(grupo):
+    """Última secuencia del grupo, para informarla al cliente al conectar"""
+    return await sync_to_async(get_registro().ultimo, thread_sensitive=False)(grupo)
@@ -1,4 +1,5 @@
 # backend/routing.py
+import logging
 from django.urls import re_path
 from . import consumers
 
@@ -14,9 +15,11 @@ websocket_urlpatterns = [
     # Ruta de prueba (puedes mantenerla o eliminarla después)
     re_path(r'ws/test/$', consumers.TestConsumer.as_asgi()),
 
+    # Conexión única con todos los módulos como streams
+    re_path(r'ws/stream/$', consumers.MultiplexConsumer.as_asgi()),
+
     # Rutas de las aplicaciones
 ] + preparacion_ws_urls + user_ws_urls + tracker_ws_urls + finalizados_ws_urls + archivadas_ws_urls
 
-print("📡 WebSocket routes registered:")
-for pattern in websocket_urlpatterns:
-    print(f"  - {pattern.pattern}")
\ No newline at end of file
+logger = logging.getLogger(__name__)
+logger.debug('WebSocket routes registered: %s', ', '.join(str(pattern.pattern) for pattern in websocket_urlpatterns))
\ No newline at end of file
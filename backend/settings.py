@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 from datetime import timedelta
 
@@ -55,6 +56,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'backend.logs.RegistroPeticionesMiddleware',
+    'backend.metricas.MetricasMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     "corsheaders.middleware.CorsMiddleware",
@@ -175,4 +178,62 @@ CHANNEL_LAYERS = {
             "hosts": [('127.0.0.1', 6379)],
         },
     },
-}
\ No newline at end of file
+}
+# Despachador de notificaciones WebSocket (backend/notificaciones.py)
+NOTIFICACIONES = {
+    'INTERVALO_FLUSH': 0.05,  # segundos que se acumulan eventos antes de enviar un lote
+    'TAMANO_LOTE': 500,  # máximo de eventos por lote
+    'VENTANA_ACTUALIZACION': 0.3,  # segundos que se agrupan las actualizaciones de un mismo trámite
+    'REGISTRO_EVENTOS': 'redis',  # 'redis' (compartido entre procesos) o 'local' (un solo proceso)
+    'REDIS_URL': 'redis://127.0.0.1:6379/0',
+    'TAMANO_REGISTRO': 1000,  # eventos que se guardan por grupo para reanudar conexiones
+    'MAX_SUSCRIPCIONES_TRAMITE': 50,  # trámites específicos a los que se puede suscribir una conexión
+}
+
+# Presencia de usuarios en línea (user/websocket/presencia.py)
+PRESENCIA = {
+    'BACKEND': 'redis',  # 'redis' (compartido entre workers) o 'local' (un solo proceso)
+    'REDIS_URL': 'redis://127.0.0.1:6379/0',
+    'TTL': 90,  # segundos sin latido tras los que una conexión se da por caída
+    'INTERVALO_LATIDO': 30,  # cada cuántos segundos el consumer renueva el TTL
+    'INTERVALO_DIFUSION': 1.0,  # segundos que se agrupan entradas y salidas antes de avisar a los clientes
+}
+
+# Autenticación JWT de WebSockets (backend/middleware.py)
+AUTENTICACION_WS = {
+    'TAMANO_CACHE': 1000,  # usuarios que se guardan en memoria por proceso
+    'TTL_CACHE': 60,  # segundos que un usuario cacheado es válido
+    'BACKEND': 'redis',  # 'redis' (invalidaciones publicadas a todos los workers) o 'local' (un solo proceso)
+    'REDIS_URL': 'redis://127.0.0.1:6379/0',
+}
+
+# Retención del historial (preparacion/retencion.py, manage.py compactar_historial)
+HISTORIAL = {
+    'DIAS_COMPACTAR': 90,  # los registros más antiguos se compactan: snapshots completos + cambios materializados
+    'DIAS_SNAPSHOT': 30,  # de los registros compactados de cada objeto se conserva el último de cada período de N días
+    'MESES_TABLA_FRIA': 12,  # historial de trámites archivados sin cambios en N meses pasa a la tabla fría
+    'LOTE': 500,  # objetos por transacción
+}
+
+# Logging: JSON por línea, escrito desde un hilo aparte (backend/logs.py).
+# El detalle (DEBUG) queda apagado salvo que se pida con LOG_LEVEL=DEBUG.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'cola': {
+            '()': 'backend.logs.ManejadorEnCola',
+            'formato': 'json',
+        },
+    },
+    'root': {
+        'handlers': ['cola'],
+        'level': os.environ.get('LOG_LEVEL', 'INFO'),
+    },
+}
+
+# Endpoint /metrics (backend/metricas.py). Si se define un token, el scraper
+# debe enviarlo como "Authorization: Bearer <token>"; si no, solo se atiende a
+# las IPs de METRICAS_IPS (separadas por coma en la variable de entorno).
+METRICAS_TOKEN = os.environ.get('METRICAS_TOKEN')
+METRICAS_IPS = os.environ.get('METRICAS_IPS', '127.0.0.1,::1').split(',')
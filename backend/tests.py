@@ -0,0 +1,289 @@
+import asyncio
+import json
+from unittest import mock
+
+from django.db import transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from backend.notificaciones import (
+    DespachadorNotificaciones, combinar_eventos, despachador, encolar_evento, fusionar_eventos, grupos_destino,
+)
+from backend.registro_eventos import RegistroEventosLocal, reanudar
+from preparacion.websocket.utils import notify_preparacion_created
+from tracker.websocket.utils import notify_tracker_created, notify_tracker_deleted, notify_tracker_updated
+
+
+class MetricasTests(SimpleTestCase):
+    """Acceso al endpoint /metrics"""
+
+    @override_settings(METRICAS_TOKEN=None, METRICAS_IPS=['127.0.0.1'])
+    def test_sin_token_solo_ips_permitidas(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.1.2.3').status_code, 403)
+
+    @override_settings(METRICAS_TOKEN='secreto', METRICAS_IPS=['127.0.0.1'])
+    def test_con_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer otro').status_code, 401)
+        respuesta = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secreto', REMOTE_ADDR='10.1.2.3')
+        self.assertEqual(respuesta.status_code, 200)
+
+
+def filtros(anterior=None, **valores):
+    """filtros_evento de un trámite; `anterior` son los valores leídos de la base de datos que cambiaron"""
+    actual = {'proveedor': '5', 'departamento': '11', 'estado': 'en_radicacion', **valores}
+    return {'actual': actual, 'anterior': {**actual, **(anterior or {})}}
+
+
+class GruposDestinoTests(TestCase):
+    """Grupos a los que el despachador envía cada evento de un módulo"""
+
+    def destinos(self, notificar, *args, **kwargs):
+        with mock.patch.object(despachador, 'agregar') as agregar, self.captureOnCommitCallbacks(execute=True):
+            notificar(*args, **kwargs)
+        (grupo, evento), = [llamada.args for llamada in agregar.call_args_list]
+        return set(grupos_destino(grupo, evento))
+
+    def test_creacion(self):
+        self.assertEqual(self.destinos(notify_tracker_created, {'id': 1}, filtros=filtros()), {
+            'tracker_updates',
+            'tracker_updates.proveedor.5',
+            'tracker_updates.departamento.11',
+            'tracker_updates.estado.en_radicacion',
+        })
+
+    def test_actualizacion_que_cambia_proveedor(self):
+        destinos = self.destinos(
+            notify_tracker_updated, {'id': 1, 'version': 2}, claves={'proveedor'},
+            filtros=filtros(proveedor='7', anterior={'proveedor': '5'})
+        )
+        # El proveedor anterior recibe la salida del filtro; las dimensiones sin cambio, solo su valor actual
+        self.assertEqual(destinos, {
+            'tracker_updates',
+            'tracker_updates.proveedor.7',
+            'tracker_updates.proveedor.5',
+            'tracker_updates.departamento.11',
+            'tracker_updates.estado.en_radicacion',
+        })
+
+    def test_actualizacion_sin_cambios_de_filtro(self):
+        destinos = self.destinos(notify_tracker_updated, {'id': 1, 'version': 2}, claves={'placa'}, filtros=filtros())
+        self.assertEqual(len(destinos), 4)
+
+    def test_eliminacion(self):
+        self.assertEqual(self.destinos(notify_tracker_deleted, 1, 'ABC123', filtros=filtros(estado='con_novedad')), {
+            'tracker_updates',
+            'tracker_updates.proveedor.5',
+            'tracker_updates.departamento.11',
+            'tracker_updates.estado.con_novedad',
+        })
+
+    def test_solo_dimensiones_del_consumer(self):
+        # PreparacionConsumer no filtra por proveedor
+        self.assertEqual(self.destinos(notify_preparacion_created, {'id': 1}, filtros=filtros()), {
+            'preparacion_updates',
+            'preparacion_updates.departamento.11',
+            'preparacion_updates.estado.en_radicacion',
+        })
+
+
+class EncolarEventoTests(TestCase):
+    """Los eventos salen recién al confirmar la transacción"""
+
+    def test_se_encola_al_hacer_commit(self):
+        evento = {'type': 'tracker_created', 'data': {'id': 1}}
+        with mock.patch.object(despachador, 'agregar') as agregar:
+            with self.captureOnCommitCallbacks(execute=True):
+                with transaction.atomic():
+                    encolar_evento('tracker_updates', evento)
+                    agregar.assert_not_called()
+                agregar.assert_not_called()
+        agregar.assert_called_once_with('tracker_updates', evento)
+
+    def test_rollback_descarta_el_evento(self):
+        with mock.patch.object(despachador, 'agregar') as agregar:
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                try:
+                    with transaction.atomic():
+                        encolar_evento('tracker_updates', {'type': 'tracker_created', 'data': {'id': 1}})
+                        raise RuntimeError('falla después de guardar')
+                except RuntimeError:
+                    pass
+        self.assertEqual(callbacks, [])
+        agregar.assert_not_called()
+
+
+class EnvioLoteTests(SimpleTestCase):
+    """Envío de un lote del despachador al channel layer"""
+
+    def test_numera_y_envia_en_orden_por_grupo(self):
+        enviados = []
+
+        async def group_send(grupo, evento):
+            enviados.append((grupo, evento['type'], evento['data']['id'], evento['seq']))
+
+        lote = [
+            ('tracker_updates', {'type': 'tracker_created', 'data': {'id': 1}}),
+            ('finalizado_updates', {'type': 'finalizado_created', 'data': {'id': 2}}),
+            ('tracker_updates', {'type': 'tracker_deleted', 'data': {'id': 3}}),
+        ]
+        capa = mock.Mock(group_send=group_send)
+        with mock.patch('backend.notificaciones.get_channel_layer', return_value=capa), \
+                mock.patch('backend.notificaciones.get_registro', return_value=RegistroEventosLocal(10)):
+            asyncio.run(DespachadorNotificaciones().enviar(lote))
+
+        self.assertEqual([e for e in enviados if e[0] == 'tracker_updates'], [
+            ('tracker_updates', 'tracker_created', 1, 1),
+            ('tracker_updates', 'tracker_deleted', 3, 2),
+        ])
+        self.assertIn(('finalizado_updates', 'finalizado_created', 2, 1), enviados)
+
+
+def delta(tramite_id, version, **cambios):
+    """Evento de actualización parcial (construir_delta) de tracker"""
+    return {
+        'type': 'tracker_updated',
+        'data': {'id': tramite_id, 'version': version, 'version_base': version - 1, 'cambios': cambios},
+    }
+
+
+class CombinarEventosTests(SimpleTestCase):
+    """Fusión de actualizaciones repetidas de un mismo trámite"""
+
+    def test_deltas_consecutivos_se_unen(self):
+        combinado = combinar_eventos(delta(1, 2, estado='a', placa='X'), delta(1, 3, estado='b'))
+        self.assertEqual(combinado['data'], {
+            'id': 1, 'version': 3, 'version_base': 1, 'cambios': {'estado': 'b', 'placa': 'X'},
+        })
+
+    def test_deltas_no_consecutivos_quedan_separados(self):
+        # Falta la versión 3: el cliente debe ver el hueco y pedir resync
+        self.assertIsNone(combinar_eventos(delta(1, 2, estado='a'), delta(1, 4, estado='b')))
+
+    def test_payload_completo_reemplaza(self):
+        completo = {'type': 'tracker_updated', 'data': {'id': 1, 'version': 5, 'estado': 'c'}}
+        self.assertEqual(combinar_eventos(delta(1, 2, estado='a'), completo), completo)
+
+    def test_filtros_conservan_el_valor_anterior_del_primero(self):
+        primero = {**delta(1, 2, proveedor=7), 'filtros': {'actual': {'proveedor': '7'}, 'anterior': {'proveedor': '5'}}}
+        segundo = {**delta(1, 3, proveedor=9), 'filtros': {'actual': {'proveedor': '9'}, 'anterior': {'proveedor': '7'}}}
+        self.assertEqual(combinar_eventos(primero, segundo)['filtros'], {
+            'actual': {'proveedor': '9'}, 'anterior': {'proveedor': '5'},
+        })
+
+
+class FusionarEventosTests(SimpleTestCase):
+
+    def test_fusiona_en_la_posicion_de_la_primera(self):
+        lote = [
+            ('tracker_updates', delta(1, 2, estado='a')),
+            ('tracker_updates', delta(2, 8, estado='x')),
+            ('tracker_updates', delta(1, 3, placa='Y')),
+        ]
+        resultado = fusionar_eventos(lote)
+        self.assertEqual([evento['data']['id'] for _, evento in resultado], [1, 2])
+        self.assertEqual(resultado[0][1]['data']['cambios'], {'estado': 'a', 'placa': 'Y'})
+
+    def test_no_fusiona_a_traves_de_otro_evento_del_registro(self):
+        eliminado = {'type': 'tracker_deleted', 'data': {'id': 1}}
+        lote = [
+            ('tracker_updates', delta(1, 2, estado='a')),
+            ('tracker_updates', eliminado),
+            ('tracker_updates', delta(1, 3, estado='b')),
+        ]
+        self.assertEqual(fusionar_eventos(lote), lote)
+
+    def test_no_fusiona_deltas_no_consecutivos(self):
+        lote = [('tracker_updates', delta(1, 2, estado='a')), ('tracker_updates', delta(1, 4, estado='b'))]
+        self.assertEqual(fusionar_eventos(lote), lote)
+
+    def test_grupos_distintos_no_se_fusionan(self):
+        lote = [('tracker_updates', delta(1, 2, estado='a')), ('finalizado_updates', delta(1, 3, estado='b'))]
+        self.assertEqual(len(fusionar_eventos(lote)), 2)
+
+
+@override_settings(NOTIFICACIONES={'VENTANA_ACTUALIZACION': 60})
+class RetencionActualizacionesTests(SimpleTestCase):
+    """Ventana de las actualizaciones retenidas en el despachador (sin iniciar el hilo)"""
+
+    def setUp(self):
+        iniciar = mock.patch.object(DespachadorNotificaciones, 'iniciar')
+        iniciar.start()
+        self.addCleanup(iniciar.stop)
+        self.despachador = DespachadorNotificaciones()
+
+    def cola(self):
+        return [(evento['type'], evento['data'].get('cambios')) for _, evento in self.despachador.cola]
+
+    def test_actualizaciones_de_la_ventana_se_combinan(self):
+        self.despachador.agregar('tracker_updates', delta(1, 2, estado='a'))
+        self.despachador.agregar('tracker_updates', delta(1, 3, placa='Y'))
+        self.assertEqual(self.cola(), [])
+        (_, evento), = self.despachador.retenidos.values()
+        self.assertEqual(evento['data']['cambios'], {'estado': 'a', 'placa': 'Y'})
+
+    def test_eliminacion_libera_primero_la_actualizacion(self):
+        self.despachador.agregar('tracker_updates', delta(1, 2, estado='a'))
+        self.despachador.agregar('tracker_updates', {'type': 'tracker_deleted', 'data': {'id': 1}})
+        self.assertEqual(self.cola(), [('tracker_updated', {'estado': 'a'}), ('tracker_deleted', None)])
+        self.assertEqual(self.despachador.retenidos, {})
+
+    def test_delta_no_consecutivo_libera_el_retenido(self):
+        self.despachador.agregar('tracker_updates', delta(1, 2, estado='a'))
+        self.despachador.agregar('tracker_updates', delta(1, 4, estado='b'))
+        self.assertEqual(self.cola(), [('tracker_updated', {'estado': 'a'})])
+        (_, evento), = self.despachador.retenidos.values()
+        self.assertEqual(evento['data']['version'], 4)
+
+
+class ConsumerPrueba:
+    """Lo que reanudar() usa de un consumer: scope, send y dispatch"""
+
+    def __init__(self, query_string=b''):
+        self.scope = {'query_string': query_string}
+        self.recibidos = []
+
+    async def send(self, text_data):
+        self.recibidos.append(json.loads(text_data))
+
+    async def dispatch(self, evento):
+        self.recibidos.append(evento)
+
+
+class ReanudacionTests(SimpleTestCase):
+    """Registro acotado de eventos y reanudación con resume_from"""
+
+    def setUp(self):
+        self.registro = RegistroEventosLocal(tamano=3)
+        for numero in range(1, 6):
+            self.registro.registrar('tracker_updates', [{'type': 'tracker_updated', 'data': {'id': numero}}])
+        patcher = mock.patch('backend.registro_eventos.get_registro', return_value=self.registro)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def reanudar(self, consumer, resume_from=None):
+        asyncio.run(reanudar(consumer, 'tracker_updates', resume_from))
+        return consumer.recibidos
+
+    def test_registro_acotado_y_numerado(self):
+        self.assertEqual(self.registro.ultimo('tracker_updates'), 5)
+        self.assertEqual([e['seq'] for e in self.registro.desde('tracker_updates', 2)], [3, 4, 5])
+        self.assertEqual(self.registro.desde('tracker_updates', 5), [])
+        # Más antiguo que el registro (solo guarda 3) o de una secuencia reiniciada
+        self.assertIsNone(self.registro.desde('tracker_updates', 1))
+        self.assertIsNone(self.registro.desde('tracker_updates', 9))
+
+    def test_reenvia_los_eventos_perdidos_en_orden(self):
+        recibidos = self.reanudar(ConsumerPrueba(), resume_from=3)
+        self.assertEqual([(e['seq'], e['data']['id']) for e in recibidos], [(4, 4), (5, 5)])
+
+    def test_resume_from_en_la_url(self):
+        recibidos = self.reanudar(ConsumerPrueba(b'token=x&resume_from=4'))
+        self.assertEqual([e['seq'] for e in recibidos], [5])
+
+    def test_resync_si_el_registro_ya_no_tiene_los_eventos(self):
+        recibidos = self.reanudar(ConsumerPrueba(), resume_from=1)
+        self.assertEqual([e['type'] for e in recibidos], ['resync_required'])
+
+    def test_sin_resume_from_no_envia_nada(self):
+        self.assertEqual(self.reanudar(ConsumerPrueba(b'token=x')), [])
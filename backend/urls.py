@@ -38,6 +38,7 @@ urlpatterns = [
     path('api/finalizados/',   include('finalizados.api.urls'), name="finalizados"),
     path('api/archivadas/',    include('archivadas.api.urls'), name="archivadas"),
     path('test-websocket/',    views.test_websocket, name='test_websocket'),
+    path('metrics',            views.metricas, name='metricas'),
 ]
 
 # Servir archivos media en desarrollo
@@ -1,4 +1,28 @@
+import hmac
+
+from django.conf import settings
+from django.http import HttpResponse
 from django.shortcuts import render
 
+from backend.metricas import exponer
+
 def test_websocket(request):
-    return render(request, 'test_websocket.html')
\ No newline at end of file
+    return render(request, 'test_websocket.html')
+
+
+def metricas(request):
+    """
+    Métricas del proceso en formato de texto de Prometheus.
+
+    Solo para el scraper: con METRICAS_TOKEN definido exige
+    "Authorization: Bearer <token>"; sin token solo responde a las IPs de
+    METRICAS_IPS (por defecto, localhost).
+    """
+    token = getattr(settings, 'METRICAS_TOKEN', None)
+    if token:
+        recibido = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(recibido.encode(), f'Bearer {token}'.encode()):
+            return HttpResponse(status=401)
+    elif request.META.get('REMOTE_ADDR') not in getattr(settings, 'METRICAS_IPS', ()):
+        return HttpResponse(status=403)
+    return HttpResponse(exponer(), content_type='text/plain; version=0.0.4; charset=utf-8')
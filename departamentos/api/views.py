@@ -1,3 +1,4 @@
+import logging
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
@@ -11,13 +12,13 @@ from user.api.permissions import RolePermission
 from django.db.models import Q # Importar Q para búsquedas complejas
 from datetime import datetime  # Importar datetime para manejar fechas
 
+logger = logging.getLogger(__name__)
+
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated, RolePermission(['admin'])])
 def list_departamentos(request):
     try:
-        print("Rol del usuario:", request.user.role)
-
         # 1. Obtener todos los usuarios como un queryset
         departamentos = Departamento.objects.all()
 
@@ -36,9 +37,7 @@ def list_departamentos(request):
         )
 
     except Exception as e:
-        print(f"Error en list_users: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception('Error en list_departamentos')
         return Response(
             {"error": f"Error fetching users: {str(e)}"},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -4,6 +4,7 @@ from . import views
 urlpatterns = [
     path('create/', views.create_finalizado, name='create_finalizado'),
     path('list/', views.list_finalizados, name='list_finalizados'),
+    path('stats/', views.stats_finalizados, name='stats_finalizados'),
     path('<int:pk>/', views.get_finalizado, name='get_finalizado'),
     path('<int:pk>/update/', views.update_finalizado, name='update_finalizado'),
     path('<int:pk>/delete/', views.delete_finalizado, name='delete_finalizado'),
@@ -1,15 +1,26 @@
 # finalizado/api/views.py
+import logging
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import NotFound
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.pagination import PageNumberPagination
 from django.shortcuts import get_object_or_404
 from django.db import DatabaseError, transaction
-from django.db.models import Q, Subquery, OuterRef
 from datetime import datetime
 
-from preparacion.models import Preparacion, PreparacionArchivo
+from preparacion.historial import trazabilidad
+from preparacion.models import CambioHistorial, Preparacion
+from preparacion.api.services import listar_tramites, MODULO_FINALIZADOS
+from preparacion.resumen import (
+    bloquear_clave,
+    clave_resumen,
+    obtener_resumen,
+    registrar_alta,
+    registrar_baja,
+    registrar_cambio
+)
+from preparacion.websocket.utils import claves_modificadas, filtros_evento
 from user.api.permissions import RolePermission
 from departamentos.models import Departamento
 from municipios.models import Municipio
@@ -20,6 +31,8 @@ from finalizados.websocket.utils import (
     notify_finalizado_deleted
 )
 
+logger = logging.getLogger(__name__)
+
 
 # ✅ Crear trámite en finalizado
 @api_view(['POST'])
@@ -100,6 +113,7 @@ def create_finalizado(request):
                 paquete=data.get('paquete', ''),
                 lista_documentos=data.get('lista_documentos', [])
             )
+            registrar_alta(finalizado)
 
             # 5. Construir datos para WebSocket
             finalizado_data = {
@@ -120,10 +134,11 @@ def create_finalizado(request):
                 'usuario': finalizado.usuario.username if finalizado.usuario else 'Sin asignar',
                 'created_at': finalizado.created_at.isoformat(),
                 'updated_at': finalizado.updated_at.isoformat(),
+                'version': finalizado.version,
             }
 
             # 6. Notificar vía WebSocket
-            notify_finalizado_created(finalizado_data)
+            notify_finalizado_created(finalizado_data, filtros=filtros_evento(finalizado))
 
             return Response({
                 "id": finalizado.id,
@@ -134,9 +149,7 @@ def create_finalizado(request):
     except ValueError as e:
         return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
-        print(f"❌ Error completo al crear finalizado: {type(e).__name__}: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception('Error al crear finalizado')
         return Response(
             {"error": f"Error inesperado al procesar el trámite: {str(e)}"},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -148,125 +161,23 @@ def create_finalizado(request):
 @permission_classes([IsAuthenticated, RolePermission(['admin'])])
 def list_finalizados(request):
     try:
-        # 1. Definir Subconsultas para obtener los nombres
-        nombre_depto_subquery = Departamento.objects.filter(
-            id_departamento=OuterRef('departamento')
-        ).values('departamento')[:1]
-
-        nombre_muni_subquery = Municipio.objects.filter(
-            id_municipio=OuterRef('municipio')
-        ).values('municipio')[:1]
-
-        # 2. QuerySet Base con Annotation (filtrado por estado_modulo=3 para finalizado)
-        finalizados = Preparacion.objects.select_related(
-            'usuario', 'departamento', 'municipio', 'proveedor'
-        ).annotate(
-            nombre_depto=Subquery(nombre_depto_subquery),
-            nombre_muni=Subquery(nombre_muni_subquery)
-        ).filter(estado_modulo=3)  # CRÍTICO: Solo registros del módulo Finalizados
-
-        # --- Filtros ---
-        # Filtro de búsqueda general
-        search_query = request.query_params.get('search', None)
-        if search_query:
-            finalizados = finalizados.filter(
-                Q(placa__icontains=search_query) |
-                Q(tipo_vehiculo__icontains=search_query) |
-                Q(usuario__username__icontains=search_query) |
-                Q(proveedor__codigo_encargado__icontains=search_query) |
-                Q(proveedor__nombre__icontains=search_query) |
-                Q(nombre_depto__icontains=search_query) |
-                Q(nombre_muni__icontains=search_query)
-            )
-
-        # Filtro de estado
-        estado_filter = request.query_params.get('estado', None)
-        if estado_filter:
-            finalizados = finalizados.filter(estado=estado_filter)
-
-        # Filtro de tipo de vehículo
-        tipo_vehiculo_filter = request.query_params.get('tipo_vehiculo', None)
-        if tipo_vehiculo_filter:
-            finalizados = finalizados.filter(tipo_vehiculo=tipo_vehiculo_filter)
-
-        # Filtro de proveedor
-        proveedor_filter = request.query_params.get('proveedor', None)
-        if proveedor_filter:
-            finalizados = finalizados.filter(proveedor_id=proveedor_filter)
-
-        # Filtro de departamento
-        departamento_filter = request.query_params.get('departamento', None)
-        if departamento_filter:
-            finalizados = finalizados.filter(departamento_id=departamento_filter)
-
-        # Filtro de municipio
-        municipio_filter = request.query_params.get('municipio', None)
-        if municipio_filter:
-            finalizados = finalizados.filter(municipio_id=municipio_filter)
-
-        # Filtros de fecha de recepción
-        start_date_str = request.query_params.get('start_date', None)
-        end_date_str = request.query_params.get('end_date', None)
-
-        if start_date_str:
-            start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
-            finalizados = finalizados.filter(fecha_recepcion_municipio__gte=start_date)
-
-        if end_date_str:
-            end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
-            finalizados = finalizados.filter(fecha_recepcion_municipio__lte=end_date)
-
-        # 3. Construir datos
-        finalizados_data = []
-        for finalizado in finalizados.order_by('-created_at'):
-
-            # Obtener archivos del trámite
-            archivos = finalizado.archivos.all().values(
-                'id', 'nombre_original', 'tipo_archivo', 'tamaño', 'archivo', 'created_at'
-            )
-
-            archivos_list = [{
-                "id": arch['id'],
-                "nombre": arch['nombre_original'],
-                "tipo": arch['tipo_archivo'],
-                "tamaño": arch['tamaño'],
-                "url": arch['archivo'],
-                "created_at": arch['created_at']
-            } for arch in archivos]
-
-            finalizados_data.append({
-                'id': finalizado.id,
-                'placa': finalizado.placa,
-                'archivos': archivos_list,
-                'total_archivos': len(archivos_list),
-                'tipo_vehiculo': finalizado.tipo_vehiculo,
-                'departamento': finalizado.departamento_id,
-                'municipio': finalizado.municipio_id,
-                'nombre_depto': finalizado.nombre_depto,
-                'nombre_muni': finalizado.nombre_muni,
-                'estado': finalizado.estado,
-                'estado_detalle': finalizado.estado_detalle,
-                'estado_tracker': finalizado.estado_tracker,
-                'fecha_recepcion_municipio': finalizado.fecha_recepcion_municipio,
-                'hace_dias': finalizado.hace_dias,
-                'proveedor_id': finalizado.proveedor_id,
-                'codigo_encargado': finalizado.codigo_encargado,
-                'proveedor_nombre': finalizado.proveedor.nombre if finalizado.proveedor else None,
-                'usuario': finalizado.usuario.username if finalizado.usuario else 'Sin asignar',
-                'created_at': finalizado.created_at,
-                'updated_at': finalizado.updated_at,
-            })
+        return listar_tramites(MODULO_FINALIZADOS, request)
 
-        # 4. Paginación
-        page_size = int(request.query_params.get('page_size', 10))
-        paginator = PageNumberPagination()
-        paginator.page_size = page_size
+    except Exception as e:
+        return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-        paginated_queryset = paginator.paginate_queryset(finalizados_data, request)
-        return paginator.get_paginated_response(paginated_queryset)
 
+# ✅ Conteos del módulo Finalizados (tabla de resumen)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, RolePermission(['admin'])])
+def stats_finalizados(request):
+    try:
+        return Response(obtener_resumen(MODULO_FINALIZADOS.estado_modulo), status=status.HTTP_200_OK)
     except Exception as e:
-        return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return Response(
+            {"error": f"Error al obtener estadísticas: {str(e)}"},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
 
 
 # ✅ Obtener trámite por ID
@@ -333,7 +244,14 @@ def update_finalizado(request, pk):
         if 'proveedor' in data:
             finalizado.proveedor_id = data.get('proveedor')
 
-        finalizado.save()
+        # Campos que cambiaron (por WebSocket se envía solo el delta) y filtros antes/después del cambio
+        campos = finalizado.campos_modificados()
+        filtros = filtros_evento(finalizado)
+
+        with transaction.atomic():
+            clave_anterior = bloquear_clave(finalizado)
+            finalizado.save()
+            registrar_cambio(clave_anterior, finalizado)
 
         response_data = {
             "id": finalizado.id,
@@ -363,8 +281,9 @@ def update_finalizado(request, pk):
             'usuario': finalizado.usuario.username if finalizado.usuario else 'Sin asignar',
             'created_at': finalizado.created_at.isoformat(),
             'updated_at': finalizado.updated_at.isoformat(),
+            'version': finalizado.version,
         }
-        notify_finalizado_updated(finalizado_data)
+        notify_finalizado_updated(finalizado_data, claves_modificadas(campos), filtros=filtros)
 
         return Response(response_data, status=status.HTTP_200_OK)
 
@@ -390,11 +309,15 @@ def delete_finalizado(request, pk):
         # Guardar datos antes de eliminar para la notificación WebSocket
         finalizado_id = finalizado.id
         finalizado_placa = finalizado.placa
+        filtros = filtros_evento(finalizado)
 
-        finalizado.delete()
+        with transaction.atomic():
+            clave = bloquear_clave(finalizado)
+            finalizado.delete()
+            registrar_baja(clave)
 
         # Notificar vía WebSocket
-        notify_finalizado_deleted(finalizado_id, finalizado_placa)
+        notify_finalizado_deleted(finalizado_id, finalizado_placa, filtros=filtros)
 
         return Response(
             {"message": "finalizado deleted successfully"},
@@ -415,43 +338,17 @@ def get_finalizado_history(request, pk):
         # 1. Obtener el trámite principal
         finalizado = get_object_or_404(Preparacion, pk=pk, estado_modulo=3)
 
-        # 2. Obtener historial del trámite
-        finalizado_history = finalizado.history.all().select_related('history_user')
-
-        timeline = []
-
-        # --- Procesar Historial del finalizado ---
-        for record in finalizado_history:
-            cambios = []
-            if record.prev_record:
-                delta = record.diff_against(record.prev_record)
-                for change in delta.changes:
-                    cambios.append({
-                        "campo": change.field,
-                        "anterior": change.old,
-                        "nuevo": change.new
-                    })
-
-            timeline.append({
-                "fecha": record.history_date,
-                "usuario": record.history_user.username if record.history_user else "Sistema",
-                "entidad": "Trámite finalizado",
-                "evento": record.get_history_type_display(),
-                "descripcion": f"Cambio en datos del trámite {record.placa}",
-                "detalles": cambios,
-                "tipo": "finalizado"
-            })
-
-        # 3. Ordenar toda la línea de tiempo por fecha descendente
-        timeline.sort(key=lambda x: x['fecha'], reverse=True)
-
+        # 2. Cambios ya materializados del trámite (una consulta por página, ?cursor=&page_size=)
         return Response({
             "finalizado_id": pk,
             "placa_actual": finalizado.placa,
-            "total_eventos": len(timeline),
-            "trazabilidad_completa": timeline
+            **trazabilidad(request, pk, {
+                CambioHistorial.ENTIDAD_TRAMITE: ("Trámite finalizado", "finalizado", "Cambio en datos del trámite {referencia}"),
+            })
         }, status=status.HTTP_200_OK)
 
+    except NotFound:
+        raise
     except Exception as e:
         return Response(
             {"error": f"Error al generar trazabilidad: {str(e)}"},
@@ -474,7 +371,9 @@ def archivar_finalizado(request, pk):
     try:
         with transaction.atomic():
             # 1. Obtener el trámite del módulo Finalizados
-            finalizado = get_object_or_404(Preparacion, pk=pk, estado_modulo=3)
+            finalizado = get_object_or_404(Preparacion.objects.select_for_update(), pk=pk, estado_modulo=3)
+            clave_anterior = clave_resumen(finalizado)
+            finalizado.bloquear_version()  # leído con select_for_update
 
             # 2. Guardar datos del finalizado antes de la transición (para notificaciones)
             finalizado_data_before = {
@@ -484,7 +383,9 @@ def archivar_finalizado(request, pk):
 
             # 3. Realizar la transición de módulo
             finalizado.estado_modulo = 0  # Mover a Archivadas
+            filtros = filtros_evento(finalizado)  # antes de guardar: valores anteriores y nuevos
             finalizado.save()
+            registrar_cambio(clave_anterior, finalizado)
 
             # 4. Construir datos completos para el módulo Archivadas (WebSocket)
             archivada_data = {
@@ -505,15 +406,18 @@ def archivar_finalizado(request, pk):
                 'usuario': finalizado.usuario.username if finalizado.usuario else 'Sin asignar',
                 'created_at': finalizado.created_at.isoformat(),
                 'updated_at': finalizado.updated_at.isoformat(),
+                'version': finalizado.version,
             }
 
             # 5. Emitir notificaciones WebSocket
             # 5.1. Notificar al módulo Finalizados que el registro fue eliminado
-            notify_finalizado_deleted(finalizado_data_before['id'], finalizado_data_before['placa'])
+            notify_finalizado_deleted(
+                finalizado_data_before['id'], finalizado_data_before['placa'], filtros=filtros
+            )
 
             # 5.2. Notificar al módulo Archivadas que se creó un nuevo registro
             from archivadas.websocket.utils import notify_archivada_created
-            notify_archivada_created(archivada_data)
+            notify_archivada_created(archivada_data, filtros=filtros)
 
             return Response({
                 "message": f"Trámite {finalizado.placa} archivado exitosamente",
@@ -523,9 +427,7 @@ def archivar_finalizado(request, pk):
             }, status=status.HTTP_200_OK)
 
     except Exception as e:
-        print(f"❌ Error al archivar finalizado: {type(e).__name__}: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception('Error al archivar finalizado')
         return Response(
             {"error": f"Error al archivar el trámite: {str(e)}"},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -1,3 +1,8 @@
 from django.test import TestCase
 
-# Create your tests here.
+from preparacion.tests import ConsultasListadoMixin
+
+
+class ListFinalizadosConsultasTests(ConsultasListadoMixin, TestCase):
+    url = '/api/finalizados/list/'
+    estado_modulo = 3
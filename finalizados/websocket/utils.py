@@ -1,42 +1,47 @@
 # finalizado/websocket/utils.py
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
+from backend.notificaciones import construir_delta, encolar_evento
+from finalizados.websocket.consumers import FinalizadoConsumer
 
 
-def notify_finalizado_created(finalizado_data):
+def notify_finalizado_created(finalizado_data, filtros=None):
     """
     Notifica a todos los clientes conectados que se creó un nuevo trámite en finalizado.
+    `filtros` (ver filtros_evento) envía el evento también a los grupos por filtro.
     """
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(
+    encolar_evento(
         "finalizado_updates",
         {
             "type": "finalizado_created",
             "data": finalizado_data
-        }
+        },
+        filtros=filtros,
+        dimensiones=FinalizadoConsumer.dimensiones_filtro
     )
 
 
-def notify_finalizado_updated(finalizado_data):
+def notify_finalizado_updated(finalizado_data, claves=None, filtros=None):
     """
     Notifica a todos los clientes conectados que se actualizó un trámite en finalizado.
+    Si se indican `claves` se envía solo el delta de esas claves con la versión.
+    `filtros` (ver filtros_evento) envía el evento también a los grupos por filtro.
     """
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(
+    encolar_evento(
         "finalizado_updates",
         {
             "type": "finalizado_updated",
-            "data": finalizado_data
-        }
+            "data": finalizado_data if claves is None else construir_delta(finalizado_data, claves)
+        },
+        filtros=filtros,
+        dimensiones=FinalizadoConsumer.dimensiones_filtro
     )
 
 
-def notify_finalizado_deleted(finalizado_id, finalizado_placa):
+def notify_finalizado_deleted(finalizado_id, finalizado_placa, filtros=None):
     """
     Notifica a todos los clientes conectados que se eliminó un trámite en finalizado.
+    `filtros` (ver filtros_evento) envía el evento también a los grupos por filtro.
     """
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(
+    encolar_evento(
         "finalizado_updates",
         {
             "type": "finalizado_deleted",
@@ -44,5 +49,7 @@ def notify_finalizado_deleted(finalizado_id, finalizado_placa):
                 "id": finalizado_id,
                 "placa": finalizado_placa
             }
-        }
+        },
+        filtros=filtros,
+        dimensiones=FinalizadoConsumer.dimensiones_filtro
     )
@@ -0,0 +1,116 @@
+# preparacion/api/pagination.py
+import base64
+import json
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def codificar_cursor(created_at, pk, reverse=False):
+    """Cursor opaco de KeysetPagination para la fila (created_at, id)"""
+    payload = json.dumps({'c': created_at.isoformat(), 'i': pk, 'r': int(reverse)})
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginación por cursor (keyset) para los listados de módulos.
+
+    Ordena por (-created_at, -id) y en lugar de OFFSET filtra a partir de la
+    última fila vista, así que una página profunda cuesta lo mismo que la
+    primera y las inserciones que llegan por WebSocket no desplazan filas
+    entre páginas. Usa el índice idx_prep_fecha (InnoDB incluye el id como
+    desempate dentro del índice secundario).
+
+    Los cursores son opacos: JSON {created_at, id, dirección} en base64.
+    """
+    cursor_query_param = 'cursor'
+    page_size = 10
+    invalid_cursor_message = 'Cursor inválido'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = remove_query_param(request.build_absolute_uri(), 'page')
+        cursor = self.decode_cursor(request.query_params.get(self.cursor_query_param))
+
+        if cursor is None:
+            # Primera página
+            self.reverse = False
+            filas = list(queryset.order_by('-created_at', '-id')[:self.page_size + 1])
+            self.has_next = len(filas) > self.page_size
+            self.has_previous = False
+            self.page = filas[:self.page_size]
+            return self.page
+
+        created_at, pk, self.reverse = cursor
+
+        if self.reverse:
+            # Página anterior: se recorre en orden ascendente y luego se invierte
+            filas = list(queryset.filter(
+                Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)
+            ).order_by('created_at', 'id')[:self.page_size + 1])
+            self.has_previous = len(filas) > self.page_size
+            self.has_next = True
+            self.page = list(reversed(filas[:self.page_size]))
+        else:
+            filas = list(queryset.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+            ).order_by('-created_at', '-id')[:self.page_size + 1])
+            self.has_next = len(filas) > self.page_size
+            self.has_previous = True
+            self.page = filas[:self.page_size]
+
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data
+        })
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        ultimo = self.page[-1]
+        return self.encode_cursor(ultimo.created_at, ultimo.id, reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        primero = self.page[0]
+        return self.encode_cursor(primero.created_at, primero.id, reverse=True)
+
+    def encode_cursor(self, created_at, pk, reverse):
+        """Construye la URL con el cursor opaco para la siguiente/anterior página"""
+        return replace_query_param(self.base_url, self.cursor_query_param, codificar_cursor(created_at, pk, reverse))
+
+    def decode_cursor(self, token):
+        """Retorna (created_at, id, reverse) o None si es la primera página"""
+        if not token:
+            return None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8'))
+            return datetime.fromisoformat(payload['c']), int(payload['i']), bool(payload['r'])
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+
+def get_paginator(request):
+    """
+    Retorna el paginador para los listados de módulos.
+
+    Por defecto PageNumberPagination (?page=); si la petición trae el
+    parámetro ?cursor= (aunque esté vacío) se usa la paginación keyset.
+    """
+    if KeysetPagination.cursor_query_param in request.query_params:
+        paginator = KeysetPagination()
+    else:
+        paginator = PageNumberPagination()
+
+    paginator.page_size = int(request.query_params.get('page_size', 10))
+    return paginator
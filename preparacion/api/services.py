@@ -0,0 +1,259 @@
+# preparacion/api/services.py
+"""
+Servicio de consulta compartido por los módulos Preparación, Tracker,
+Finalizados y Archivadas.
+
+Los cuatro módulos trabajan sobre el mismo modelo Preparacion y solo se
+diferencian por `estado_modulo` (1, 2, 3, 0), los filtros que aceptan y los
+campos que devuelven. Aquí vive el filtrado, la proyección, la precarga de
+archivos y la paginación, para que cada optimización se haga una sola vez.
+"""
+from datetime import datetime, time
+
+from django.db.models import F
+
+from preparacion.lookups import compactar_busqueda, fin_prefijo
+from preparacion.models import Preparacion
+from preparacion.api.pagination import get_paginator
+from preparacion.api.utils import get_archivos_por_tramite
+
+LARGO_PLACA = Preparacion._meta.get_field('placa').max_length
+
+
+def parece_placa(texto):
+    """Búsqueda compactada que puede ser (el inicio de) una placa: letras y números, cabe en la columna"""
+    return (
+        0 < len(texto) <= LARGO_PLACA
+        and any(c.isdigit() for c in texto)
+        and any(c.isalpha() for c in texto)
+    )
+
+
+class Modulo:
+    """
+    Configuración de un módulo sobre el modelo Preparacion.
+
+    Args:
+        nombre (str): Nombre del módulo (para mensajes y logs)
+        estado_modulo (int): Valor de Preparacion.estado_modulo del módulo
+        select_related (tuple): FKs a traer por JOIN
+        filtros (dict): {parámetro GET: lookup} de filtros exactos
+        campo_fecha (str): Campo usado por `?start_date=` / `?end_date=`
+        campos (tuple): Campos de cada fila en el listado (en orden)
+    """
+
+    def __init__(self, nombre, estado_modulo, select_related, filtros, campo_fecha, campos):
+        self.nombre = nombre
+        self.estado_modulo = estado_modulo
+        self.select_related = select_related
+        self.filtros = filtros
+        self.campo_fecha = campo_fecha
+        self.campos = campos
+
+
+# Valor de cada campo del listado a partir del trámite y sus archivos
+CAMPOS_LISTADO = {
+    'id': lambda t, archivos: t.id,
+    'placa': lambda t, archivos: t.placa,
+    'archivos': lambda t, archivos: archivos,
+    'total_archivos': lambda t, archivos: len(archivos),
+    'tipo_vehiculo': lambda t, archivos: t.tipo_vehiculo,
+    'departamento': lambda t, archivos: t.departamento_id,
+    'municipio': lambda t, archivos: t.municipio_id,
+    'nombre_depto': lambda t, archivos: t.nombre_depto,
+    'nombre_muni': lambda t, archivos: t.nombre_muni,
+    'estado': lambda t, archivos: t.estado,
+    'estado_detalle': lambda t, archivos: t.estado_detalle,
+    'estado_tracker': lambda t, archivos: t.estado_tracker,
+    'fecha_recepcion_municipio': lambda t, archivos: t.fecha_recepcion_municipio,
+    'hace_dias': lambda t, archivos: t.hace_dias,
+    'proveedor_id': lambda t, archivos: t.proveedor_id,
+    'codigo_encargado': lambda t, archivos: t.codigo_encargado,
+    'proveedor_nombre': lambda t, archivos: t.proveedor.nombre if t.proveedor else None,
+    'paquete': lambda t, archivos: t.paquete,
+    'lista_documentos': lambda t, archivos: t.lista_documentos,
+    'usuario': lambda t, archivos: t.usuario.username if t.usuario else 'Sin asignar',
+    'documentos_completos': lambda t, archivos: t.documentos_completos,
+    'documentos_completados': lambda t, archivos: t.documentos_completados,
+    'total_documentos': lambda t, archivos: t.total_documentos,
+    'created_at': lambda t, archivos: t.created_at,
+    'updated_at': lambda t, archivos: t.updated_at,
+    'version': lambda t, archivos: t.version,
+}
+
+FILTROS_CON_PROVEEDOR = {
+    'estado': 'estado',
+    'tipo_vehiculo': 'tipo_vehiculo',
+    'proveedor': 'proveedor_id',
+    'departamento': 'departamento_id',
+    'municipio': 'municipio_id',
+}
+
+CAMPOS_CON_PROVEEDOR = (
+    'id', 'placa', 'archivos', 'total_archivos', 'tipo_vehiculo',
+    'departamento', 'municipio', 'nombre_depto', 'nombre_muni',
+    'estado', 'estado_detalle', 'estado_tracker', 'fecha_recepcion_municipio', 'hace_dias',
+    'proveedor_id', 'codigo_encargado', 'proveedor_nombre',
+    'usuario', 'created_at', 'updated_at', 'version',
+)
+
+MODULO_PREPARACION = Modulo(
+    nombre='preparacion',
+    estado_modulo=1,
+    select_related=('usuario', 'departamento', 'municipio'),
+    filtros={
+        'estado': 'estado',
+        'tipo_vehiculo': 'tipo_vehiculo',
+        'departamento': 'departamento',
+        'municipio': 'municipio',
+    },
+    campo_fecha='created_at',
+    campos=(
+        'id', 'placa', 'tipo_vehiculo', 'departamento', 'municipio',
+        'nombre_depto', 'nombre_muni', 'estado', 'paquete', 'lista_documentos', 'usuario',
+        'documentos_completos', 'documentos_completados', 'total_documentos',
+        'created_at', 'updated_at', 'archivos', 'total_archivos', 'version',
+    ),
+)
+
+MODULO_TRACKER = Modulo(
+    nombre='tracker',
+    estado_modulo=2,
+    select_related=('usuario', 'departamento', 'municipio', 'proveedor'),
+    filtros=FILTROS_CON_PROVEEDOR,
+    campo_fecha='fecha_recepcion_municipio',
+    campos=CAMPOS_CON_PROVEEDOR,
+)
+
+MODULO_FINALIZADOS = Modulo(
+    nombre='finalizados',
+    estado_modulo=3,
+    select_related=('usuario', 'departamento', 'municipio', 'proveedor'),
+    filtros=FILTROS_CON_PROVEEDOR,
+    campo_fecha='fecha_recepcion_municipio',
+    campos=CAMPOS_CON_PROVEEDOR,
+)
+
+MODULO_ARCHIVADAS = Modulo(
+    nombre='archivadas',
+    estado_modulo=0,
+    select_related=('usuario', 'departamento', 'municipio', 'proveedor'),
+    filtros=FILTROS_CON_PROVEEDOR,
+    campo_fecha='fecha_recepcion_municipio',
+    campos=tuple(campo for campo in CAMPOS_CON_PROVEEDOR if campo != 'estado_tracker'),
+)
+
+MODULOS = {
+    modulo.estado_modulo: modulo
+    for modulo in (MODULO_PREPARACION, MODULO_TRACKER, MODULO_FINALIZADOS, MODULO_ARCHIVADAS)
+}
+
+
+def get_queryset_modulo(modulo):
+    """QuerySet base del módulo, con los nombres de depto/muni proyectados por JOIN"""
+    return Preparacion.objects.select_related(*modulo.select_related).annotate(
+        nombre_depto=F('departamento__departamento'),
+        nombre_muni=F('municipio__municipio')
+    ).filter(estado_modulo=modulo.estado_modulo)
+
+
+def filtrar_tramites(modulo, params):
+    """
+    Aplica a la consulta del módulo los filtros que llegan por query params.
+
+    Args:
+        modulo (Modulo): Configuración del módulo
+        params (QueryDict): request.query_params
+
+    Returns:
+        QuerySet: Trámites filtrados (sin ordenar ni paginar)
+    """
+    tramites = get_queryset_modulo(modulo)
+
+    # --- Filtro de Buscador (Search) ---
+    # Sin OR entre índices (MySQL no combina un FULLTEXT con otro índice y terminaría
+    # evaluando el MATCH fila por fila): una búsqueda con forma de placa ("ABC12",
+    # "abc-123") va por prefijo a `placa_busqueda` (B-tree); el resto, o si ninguna
+    # placa empieza así (p. ej. un código de proveedor), a la columna desnormalizada
+    # `busqueda` (placa, tipo, usuario, proveedor, depto, muni) con índice FULLTEXT.
+    search_query = params.get('search', None)
+    if search_query:
+        placa = compactar_busqueda(search_query)
+        por_placa = tramites.filter(placa_busqueda__gte=placa)
+        fin = fin_prefijo(placa)
+        if fin is not None:
+            por_placa = por_placa.filter(placa_busqueda__lt=fin)
+        if parece_placa(placa) and por_placa.exists():
+            tramites = por_placa
+        else:
+            tramites = tramites.filter(busqueda__fulltext=search_query)
+
+    # --- Filtros exactos (estado, tipo de vehículo, proveedor, ubicación) ---
+    for parametro, lookup in modulo.filtros.items():
+        valor = params.get(parametro, None)
+        if valor:
+            tramites = tramites.filter(**{lookup: valor})
+
+    # --- Filtros de Fecha ---
+    start_date_str = params.get('start_date', None)
+    end_date_str = params.get('end_date', None)
+
+    if start_date_str:
+        start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
+        tramites = tramites.filter(**{f'{modulo.campo_fecha}__gte': start_date})
+
+    if end_date_str:
+        end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
+        if modulo.campo_fecha == 'created_at':
+            # created_at es DateTime: incluir todo el día final
+            end_date = datetime.combine(end_date, time.max)
+        tramites = tramites.filter(**{f'{modulo.campo_fecha}__lte': end_date})
+
+    return tramites
+
+
+def serializar_tramite(modulo, tramite, archivos):
+    """Construye la fila del listado con los campos del módulo"""
+    return {campo: CAMPOS_LISTADO[campo](tramite, archivos) for campo in modulo.campos}
+
+
+def obtener_tramites(modulo, ids):
+    """
+    Filas completas (mismo formato que el listado) de los trámites indicados
+    que siguen en el módulo. Se usa para el resync de clientes WebSocket.
+
+    Returns:
+        tuple: (filas, ids que ya no están en el módulo)
+    """
+    tramites = list(get_queryset_modulo(modulo).filter(id__in=ids))
+    archivos_por_tramite = get_archivos_por_tramite([tramite.id for tramite in tramites])
+
+    filas = [serializar_tramite(modulo, tramite, archivos_por_tramite[tramite.id]) for tramite in tramites]
+    encontrados = {tramite.id for tramite in tramites}
+    return filas, [pk for pk in ids if pk not in encontrados]
+
+
+def listar_tramites(modulo, request):
+    """
+    Listado paginado de un módulo.
+
+    1. Filtra en base de datos
+    2. Pagina en base de datos (?page= o ?cursor=)
+    3. Carga los archivos de toda la página en una sola consulta
+    4. Serializa solo las filas de la página
+
+    Returns:
+        Response: Respuesta paginada del paginador elegido
+    """
+    tramites = filtrar_tramites(modulo, request.query_params)
+
+    paginator = get_paginator(request)
+    pagina = paginator.paginate_queryset(tramites.order_by('-created_at'), request)
+
+    archivos_por_tramite = get_archivos_por_tramite([tramite.id for tramite in pagina])
+
+    data = [
+        serializar_tramite(modulo, tramite, archivos_por_tramite[tramite.id])
+        for tramite in pagina
+    ]
+    return paginator.get_paginated_response(data)
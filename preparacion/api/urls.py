@@ -4,6 +4,7 @@ from . import views
 urlpatterns = [
     path('create/', views.create_tramite, name='create_tramite'),
     path('list/', views.list_tramites, name='list_tramites'),
+    path('stats/', views.stats_tramites, name='stats_tramites'),
     path('<int:pk>/', views.get_tramite, name='get_tramite'),
     path('<int:pk>/update/', views.update_tramite, name='update_tramite'),
     path('<int:pk>/delete/', views.delete_tramite, name='delete_tramite'),
@@ -0,0 +1,64 @@
+# preparacion/api/utils.py
+from collections import defaultdict
+
+from preparacion.models import Preparacion, PreparacionArchivo
+
+
+def get_archivos_por_tramite(tramite_ids):
+    """
+    Obtiene en UNA sola consulta los archivos de varios trámites.
+
+    Evita el N+1 de consultar `tramite.archivos` dentro del ciclo de cada
+    listado: se cargan los archivos de toda la página y se agrupan por trámite.
+
+    Args:
+        tramite_ids (list): IDs de los trámites de la página actual
+
+    Returns:
+        dict: {tramite_id: [archivo, ...]} con el mismo formato que usan los listados
+    """
+    archivos_por_tramite = defaultdict(list)
+    if not tramite_ids:
+        return archivos_por_tramite
+
+    # Orden (-tramite_id, -created_at): recorre idx_prep_arch_tramite_fecha sin filesort
+    # y mantiene el orden por -created_at dentro de cada trámite
+    archivos = PreparacionArchivo.objects.filter(tramite_id__in=tramite_ids).order_by(
+        '-tramite_id', '-created_at'
+    ).values(
+        'id', 'tramite_id', 'nombre_original', 'tipo_archivo', 'tamaño', 'archivo', 'created_at'
+    )
+    for arch in archivos:
+        archivos_por_tramite[arch['tramite_id']].append({
+            "id": arch['id'],
+            "nombre": arch['nombre_original'],
+            "tipo": arch['tipo_archivo'],
+            "tamaño": arch['tamaño'],
+            "url": arch['archivo'],
+            "created_at": arch['created_at']
+        })
+
+    return archivos_por_tramite
+
+
+def actualizar_busqueda(tramites):
+    """
+    Recalcula la columna `busqueda` de un conjunto de trámites.
+
+    Se usa cuando cambia un dato desnormalizado que vive en otra tabla
+    (nombre/código del proveedor, username del usuario).
+
+    Args:
+        tramites (QuerySet): Trámites a recalcular
+    """
+    lote = []
+    for tramite in tramites.select_related(
+        'usuario', 'proveedor', 'departamento', 'municipio'
+    ).order_by('id').iterator(chunk_size=1000):
+        tramite.busqueda = tramite.construir_busqueda()
+        lote.append(tramite)
+        if len(lote) >= 1000:
+            Preparacion.objects.bulk_update(lote, ['busqueda'])
+            lote = []
+    if lote:
+        Preparacion.objects.bulk_update(lote, ['busqueda'])
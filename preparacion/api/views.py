@@ -1,28 +1,40 @@
 # preparacion/api/views.py
+import logging
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import NotFound
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.pagination import PageNumberPagination
 from django.shortcuts import get_object_or_404
 from django.db import DatabaseError, transaction
-from django.db.models import Q, Subquery, OuterRef
 from datetime import datetime
 import json
 
-from preparacion.models import Preparacion, PreparacionArchivo
+from preparacion.historial import trazabilidad
+from preparacion.models import CambioHistorial, Preparacion, PreparacionArchivo
+from preparacion.api.services import listar_tramites, MODULO_PREPARACION
+from preparacion.resumen import (
+    bloquear_clave,
+    clave_resumen,
+    obtener_resumen,
+    registrar_alta,
+    registrar_baja,
+    registrar_cambio
+)
 from user.api.permissions import RolePermission
-from departamentos.models import Departamento
-from municipios.models import Municipio
 from preparacion.websocket.utils import (
     notify_preparacion_created,
     notify_preparacion_updated,
     notify_preparacion_deleted,
     notify_archivo_deleted,
-    notify_preparacion_sent_to_tracker
+    notify_preparacion_sent_to_tracker,
+    claves_modificadas,
+    filtros_evento
 )
 import os
 
+logger = logging.getLogger(__name__)
+
 
 # ✅ Crear trámite en preparación
 @api_view(['POST'])
@@ -68,6 +80,7 @@ def create_tramite(request):
                 lista_documentos=lista_docs,
                 estado_modulo=estado_modulo
             )
+            registrar_alta(tramite)
 
             # 4. Procesar archivos
             archivos_subidos = []
@@ -112,12 +125,13 @@ def create_tramite(request):
                 'total_documentos': tramite.total_documentos,
                 'created_at': tramite.created_at.isoformat(),
                 'updated_at': tramite.updated_at.isoformat(),
+                'version': tramite.version,
                 'archivos': archivos_subidos,
                 'total_archivos': len(archivos_subidos)
             }
             
             # 6. 🔥 NOTIFICAR VÍA WEBSOCKET 🔥
-            notify_preparacion_created(tramite_data)
+            notify_preparacion_created(tramite_data, filtros=filtros_evento(tramite))
 
             return Response({
                 "id": tramite.id,
@@ -130,9 +144,9 @@ def create_tramite(request):
         return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
         # Aquí es donde fallaba: a veces imprimir 'e' o 'data' causa el error de pickling
-        print(f"Error detectado: {type(e).__name__}") 
+        logger.error('Error al crear preparación: %s', type(e).__name__)
         return Response(
-            {"error": f"Error inesperado al procesar el trámite."},
+            {"error": "Error inesperado al procesar el trámite."},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
@@ -142,117 +156,27 @@ def create_tramite(request):
 @permission_classes([IsAuthenticated, RolePermission(['admin'])])
 def list_tramites(request):
     try:
-        # 1. Definir Subconsultas para obtener los nombres
-        nombre_depto_subquery = Departamento.objects.filter(
-            id_departamento=OuterRef('departamento')
-        ).values('departamento')[:1]
-
-        nombre_muni_subquery = Municipio.objects.filter(
-            id_municipio=OuterRef('municipio')
-        ).values('municipio')[:1]
-
-        nombre_usuario_subquery = Preparacion.objects.filter(
-            id=OuterRef('id')
-        ).select_related('usuario').values('usuario__username')[:1]
-
-        # 2. QuerySet Base con Annotation
-        tramites = Preparacion.objects.select_related('usuario', 'departamento', 'municipio').annotate(
-            nombre_depto=Subquery(nombre_depto_subquery),
-            nombre_muni=Subquery(nombre_muni_subquery),
-            nombre_usuario=Subquery(nombre_usuario_subquery)
-        ).all().filter(estado_modulo=1)
-
-        # --- Filtro de Buscador (Search) ---
-        search_query = request.query_params.get('search', None)
-        if search_query:
-            tramites = tramites.filter(
-                Q(placa__icontains=search_query) |
-                Q(tipo_vehiculo__icontains=search_query) |
-                Q(usuario__username__icontains=search_query) |
-                Q(nombre_depto__icontains=search_query) |
-                Q(nombre_muni__icontains=search_query)
-            )
-
-        # --- Filtros de Estado ---
-        estado_filter = request.query_params.get('estado', None)
-        if estado_filter:
-            tramites = tramites.filter(estado=estado_filter)
-
-        # --- Filtro de Tipo de Vehículo ---
-        tipo_vehiculo_filter = request.query_params.get('tipo_vehiculo', None)
-        if tipo_vehiculo_filter:
-            tramites = tramites.filter(tipo_vehiculo=tipo_vehiculo_filter)
-
-        # --- Filtros de Departamento y Municipio ---
-        departamento_filter = request.query_params.get('departamento', None)
-        if departamento_filter:
-            tramites = tramites.filter(departamento=departamento_filter)
-
-        municipio_filter = request.query_params.get('municipio', None)
-        if municipio_filter:
-            tramites = tramites.filter(municipio=municipio_filter)
-
-        # --- Filtros de Fecha ---
-        start_date_str = request.query_params.get('start_date', None)
-        end_date_str = request.query_params.get('end_date', None)
-
-        if start_date_str:
-            start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
-            tramites = tramites.filter(created_at__gte=start_date)
-
-        if end_date_str:
-            end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
-            from datetime import datetime as dt, time
-            end_date_inclusive = dt.combine(end_date, time.max)
-            tramites = tramites.filter(created_at__lte=end_date_inclusive)
-
-        # 3. Selección de campos (Values)
-        tramites_data = []
-        for tramite in tramites.order_by('-created_at'):
-            # Obtener archivos del trámite
-            archivos = tramite.archivos.all().values(
-                'id', 'nombre_original', 'tipo_archivo', 'tamaño', 'archivo', 'created_at'
-            )
-            archivos_list = [{
-                "id": arch['id'],
-                "nombre": arch['nombre_original'],
-                "tipo": arch['tipo_archivo'],
-                "tamaño": arch['tamaño'],
-                "url": arch['archivo'],
-                "created_at": arch['created_at']
-            } for arch in archivos]
-
-            tramites_data.append({
-                'id': tramite.id,
-                'placa': tramite.placa,
-                'tipo_vehiculo': tramite.tipo_vehiculo,
-                'departamento': tramite.departamento_id,
-                'municipio': tramite.municipio_id,
-                'nombre_depto': tramite.nombre_depto,
-                'nombre_muni': tramite.nombre_muni,
-                'estado': tramite.estado,
-                'paquete': tramite.paquete,
-                'lista_documentos': tramite.lista_documentos,
-                'usuario': tramite.usuario.username if tramite.usuario else 'Sin asignar',
-                'documentos_completos': tramite.documentos_completos,
-                'documentos_completados': tramite.documentos_completados,
-                'total_documentos': tramite.total_documentos,
-                'created_at': tramite.created_at,
-                'updated_at': tramite.updated_at,
-                'archivos': archivos_list,
-                'total_archivos': len(archivos_list)
-            })
+        return listar_tramites(MODULO_PREPARACION, request)
 
-        # 4. Paginación
-        page_size = int(request.query_params.get('page_size', 10))
-        paginator = PageNumberPagination()
-        paginator.page_size = page_size
+    except Exception as e:
+        return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-        paginated_queryset = paginator.paginate_queryset(tramites_data, request)
-        return paginator.get_paginated_response(paginated_queryset)
 
+# ✅ Conteos del módulo Preparación (tabla de resumen)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, RolePermission(['admin'])])
+def stats_tramites(request):
+    """
+    Conteos del módulo por estado y estado_tracker.
+    Se leen de la tabla ResumenModulo (mantenida en cada escritura), sin COUNT(*) sobre los trámites.
+    """
+    try:
+        return Response(obtener_resumen(MODULO_PREPARACION.estado_modulo), status=status.HTTP_200_OK)
     except Exception as e:
-        return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return Response(
+            {"error": f"Error al obtener estadísticas: {str(e)}"},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
 
 
 # ✅ Obtener trámite por ID
@@ -326,7 +250,14 @@ def update_tramite(request, pk):
         if 'municipio' in data:
             tramite.municipio_id = data.get('municipio')
 
-        tramite.save()
+        # Campos que cambiaron (por WebSocket se envía solo el delta) y filtros antes/después del cambio
+        campos = tramite.campos_modificados()
+        filtros = filtros_evento(tramite)
+
+        with transaction.atomic():
+            clave_anterior = bloquear_clave(tramite)
+            tramite.save()
+            registrar_cambio(clave_anterior, tramite)
 
         # Procesar archivos subidos (agregar nuevos archivos)
         archivos_subidos = []
@@ -409,10 +340,15 @@ def update_tramite(request, pk):
             'total_documentos': tramite.total_documentos,
             'created_at': tramite.created_at.isoformat(),
             'updated_at': tramite.updated_at.isoformat(),
+            'version': tramite.version,
             'archivos': archivos_list,
             'total_archivos': len(archivos_list)
         }
-        notify_preparacion_updated(tramite_data)
+        notify_preparacion_updated(
+            tramite_data,
+            claves_modificadas(campos, archivos=bool(archivos_subidos)),
+            filtros=filtros
+        )
 
         return Response(response_data, status=status.HTTP_200_OK)
 
@@ -438,11 +374,15 @@ def delete_tramite(request, pk):
         # Guardar datos antes de eliminar para la notificación WebSocket
         tramite_id = tramite.id
         tramite_placa = tramite.placa
+        filtros = filtros_evento(tramite)
 
-        tramite.delete()
+        with transaction.atomic():
+            clave = bloquear_clave(tramite)
+            tramite.delete()
+            registrar_baja(clave)
 
         # 🔥 NOTIFICAR VÍA WEBSOCKET - Trámite eliminado 🔥
-        notify_preparacion_deleted(tramite_id, tramite_placa)
+        notify_preparacion_deleted(tramite_id, tramite_placa, filtros=filtros)
 
         return Response(
             {"message": "Tramite deleted successfully"},
@@ -460,11 +400,12 @@ def delete_tramite(request, pk):
 @permission_classes([IsAuthenticated, RolePermission(['admin'])])
 def delete_archivo(request, archivo_id):
     try:
-        archivo = get_object_or_404(PreparacionArchivo, pk=archivo_id)
+        archivo = get_object_or_404(PreparacionArchivo.objects.select_related('tramite'), pk=archivo_id)
 
         # Guardar información antes de eliminar para notificación WebSocket
         tramite_id = archivo.tramite_id
         nombre_archivo = archivo.nombre_original
+        filtros = filtros_evento(archivo.tramite)
 
         # Eliminar el archivo físico del sistema
         if archivo.archivo:
@@ -475,7 +416,7 @@ def delete_archivo(request, archivo_id):
         archivo.delete()
 
         # 🔥 NOTIFICAR VÍA WEBSOCKET - Archivo eliminado 🔥
-        notify_archivo_deleted(tramite_id, archivo_id, nombre_archivo)
+        notify_archivo_deleted(tramite_id, archivo_id, nombre_archivo, filtros=filtros)
 
         return Response(
             {"message": "Archivo eliminado exitosamente"},
@@ -490,65 +431,26 @@ def delete_archivo(request, archivo_id):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated, RolePermission(['admin'])])
 def get_tramite_history(request, pk):
+    """
+    Trazabilidad del trámite y de sus archivos, lo más nuevo primero.
+    Paginada por cursor: ?cursor=<next de la respuesta anterior>&page_size=50
+    """
     try:
         # 1. Obtener el trámite principal
         tramite = get_object_or_404(Preparacion, pk=pk)
-        
-        # 2. Obtener historial del trámite (Tabla Preparacion)
-        preparacion_history = tramite.history.all().select_related('history_user')
-        
-        # 3. Obtener historial de todos los archivos asociados a este trámite
-        # Filtramos en la tabla de historia por el tramite_id
-        archivos_history = PreparacionArchivo.history.filter(tramite_id=pk).select_related('history_user')
-
-        timeline = []
-
-        # --- Procesar Historial de Preparación ---
-        for record in preparacion_history:
-            cambios = []
-            if record.prev_record:
-                delta = record.diff_against(record.prev_record)
-                for change in delta.changes:
-                    cambios.append({"campo": change.field, "anterior": change.old, "nuevo": change.new})
-            
-            timeline.append({
-                "fecha": record.history_date,
-                "usuario": record.history_user.username if record.history_user else "Sistema",
-                "entidad": "Trámite",
-                "evento": record.get_history_type_display(),
-                "descripcion": f"Cambio en datos del trámite {record.placa}",
-                "detalles": cambios,
-                "tipo": "tramite"
-            })
-
-        # --- Procesar Historial de Archivos ---
-        for arch_record in archivos_history:
-            cambios_arch = []
-            if arch_record.prev_record:
-                delta = arch_record.diff_against(arch_record.prev_record)
-                for change in delta.changes:
-                    cambios_arch.append({"campo": change.field, "anterior": change.old, "nuevo": change.new})
-
-            timeline.append({
-                "fecha": arch_record.history_date,
-                "usuario": arch_record.history_user.username if arch_record.history_user else "Sistema",
-                "entidad": "Archivo",
-                "evento": arch_record.get_history_type_display(),
-                "descripcion": f"Archivo: {arch_record.nombre_original}",
-                "detalles": cambios_arch,
-                "tipo": "archivo"
-            })
-
-        # 4. Ordenar toda la línea de tiempo por fecha descendente (lo más nuevo primero)
-        timeline.sort(key=lambda x: x['fecha'], reverse=True)
 
+        # 2. Cambios ya materializados del trámite y de sus archivos (una consulta por página)
         return Response({
             "tramite_id": pk,
             "placa_actual": tramite.placa,
-            "total_eventos": len(timeline),
-            "trazabilidad_completa": timeline
+            **trazabilidad(request, pk, {
+                CambioHistorial.ENTIDAD_TRAMITE: ("Trámite", "tramite", "Cambio en datos del trámite {referencia}"),
+                CambioHistorial.ENTIDAD_ARCHIVO: ("Archivo", "archivo", "Archivo: {referencia}"),
+            })
         }, status=status.HTTP_200_OK)
 
+    except NotFound:
+        raise
     except Exception as e:
         return Response(
             {"error": f"Error al generar trazabilidad: {str(e)}"},
@@ -573,7 +475,9 @@ def send_to_tracker(request, pk):
 
         with transaction.atomic():
             # 1. Obtener el trámite de preparación
-            preparacion = get_object_or_404(Preparacion, pk=pk)
+            preparacion = get_object_or_404(Preparacion.objects.select_for_update(), pk=pk)
+            clave_anterior = clave_resumen(preparacion)
+            preparacion.bloquear_version()  # leído con select_for_update
 
             # 2. Validar que esté en preparación (estado_modulo=1)
             if preparacion.estado_modulo != 1:
@@ -595,7 +499,9 @@ def send_to_tracker(request, pk):
             if fecha_recepcion:
                 preparacion.fecha_recepcion_municipio = datetime.strptime(fecha_recepcion, '%Y-%m-%d').date()
 
+            filtros = filtros_evento(preparacion)  # antes de guardar: valores anteriores y nuevos
             preparacion.save()
+            registrar_cambio(clave_anterior, preparacion)
 
             # 5. Preparar datos para WebSocket
             tracker_data = {
@@ -615,15 +521,18 @@ def send_to_tracker(request, pk):
                 'codigo_encargado': preparacion.codigo_encargado,
                 'usuario': preparacion.usuario.username if preparacion.usuario else None,
                 'created_at': preparacion.created_at.isoformat(),
-                'updated_at': preparacion.updated_at.isoformat()
+                'updated_at': preparacion.updated_at.isoformat(),
+                'version': preparacion.version
             }
 
             # 6. Notificar vía WebSocket
             # Notificar a preparación que el trámite fue movido (eliminar de vista)
-            notify_preparacion_sent_to_tracker(preparacion.id, preparacion.placa, preparacion.id)
+            notify_preparacion_sent_to_tracker(
+                preparacion.id, preparacion.placa, preparacion.id, filtros=filtros
+            )
 
             # Notificar a tracker que se creó un nuevo trámite
-            notify_tracker_created(tracker_data)
+            notify_tracker_created(tracker_data, filtros=filtros)
 
             return Response({
                 "message": "Trámite enviado al Tracker exitosamente",
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class PreparacionConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'preparacion'
+
+    def ready(self):
+        # Registra la señal que materializa los cambios de cada registro de historial
+        from preparacion import historial  # noqa: F401
@@ -0,0 +1,231 @@
+# preparacion/historial.py
+"""
+Trazabilidad (historial) de los trámites y de sus archivos.
+
+Los cambios por campo de cada registro de simple_history se calculan una sola
+vez, cuando se escribe el registro (señal post_create_historical_record), y se
+guardan en CambioHistorial. Los endpoints de historial solo leen esa tabla:
+
+- Una consulta por página sobre el índice (tramite_id, history_date, entidad,
+  history_id), ya en el orden de la línea de tiempo (trámite y archivos juntos).
+- Paginación por cursor: (history_date, entidad, history_id) del último evento
+  entregado, opaco en base64.
+
+El historial anterior a la tabla se carga en la migración 0014. El que se
+escribe sin señales (bulk_create) se materializa con
+`manage.py materializar_historial`, que recorre cada tabla de historial por
+objeto y compara registros consecutivos.
+"""
+import base64
+import json
+from datetime import datetime
+
+from django.db.models import Q
+from django.dispatch import receiver
+from rest_framework.exceptions import NotFound
+from rest_framework.utils.urls import replace_query_param
+from simple_history.signals import post_create_historical_record
+
+from preparacion.models import CambioHistorial, HistorialFrio, Preparacion, PreparacionArchivo
+
+TAMANO_PAGINA = 50
+MAX_TAMANO_PAGINA = 500
+
+# Modelos de simple_history (`Modelo.history` arma un manager nuevo en cada acceso)
+HistoricoPreparacion = Preparacion.history.model
+HistoricoArchivo = PreparacionArchivo.history.model
+
+# Por tabla de historial: (entidad, trámite del registro, referencia del registro)
+ENTIDADES = {
+    HistoricoPreparacion: (
+        CambioHistorial.ENTIDAD_TRAMITE,
+        lambda registro: registro.id,
+        lambda registro: registro.placa,
+    ),
+    HistoricoArchivo: (
+        CambioHistorial.ENTIDAD_ARCHIVO,
+        lambda registro: registro.tramite_id,
+        lambda registro: registro.nombre_original,
+    ),
+}
+
+
+def diferencias(registro, anterior):
+    """Cambios por campo de `registro` respecto al registro anterior del mismo objeto"""
+    if anterior is None:
+        return []
+    delta = registro.diff_against(anterior)
+    return [
+        {"campo": change.field, "anterior": change.old, "nuevo": change.new}
+        for change in delta.changes
+    ]
+
+
+def construir_cambio(registro, anterior):
+    """CambioHistorial (sin guardar) de un registro histórico de trámite o archivo"""
+    entidad, tramite_de, referencia_de = ENTIDADES[type(registro)]
+    return CambioHistorial(
+        tramite_id=tramite_de(registro),
+        entidad=entidad,
+        history_id=registro.history_id,
+        history_date=registro.history_date,
+        history_type=registro.history_type,
+        history_user_id=registro.history_user_id,
+        referencia=(referencia_de(registro) or '')[:255],
+        cambios=diferencias(registro, anterior),
+    )
+
+
+def registro_frio(registro):
+    """
+    Registro anterior a `registro` guardado en la tabla fría (ver preparacion/retencion.py),
+    como instancia del modelo histórico, o None.
+    """
+    historico = type(registro)
+    frio = HistorialFrio.objects.filter(
+        entidad=ENTIDADES[historico][0],
+        objeto_id=registro.id,
+        history_date__lte=registro.history_date
+    ).order_by('-history_date', '-history_id').first()
+    if frio is None:
+        return None
+    return historico(
+        **{campo.attname: campo.to_python(frio.datos.get(campo.attname)) for campo in historico.tracked_fields},
+        history_id=frio.history_id,
+        history_date=frio.history_date,
+        history_type=frio.history_type,
+        history_user_id=frio.history_user_id,
+    )
+
+
+@receiver(post_create_historical_record)
+def guardar_cambios(sender, history_instance, **kwargs):
+    """Materializa los cambios del registro recién creado (en la misma transacción que el guardado)"""
+    if sender not in ENTIDADES:
+        return
+    # Una creación no tiene registro anterior; en otro caso una consulta por índice (id, history_date).
+    # Si el historial del objeto ya pasó a la tabla fría (trámite archivado que se reactiva), se busca ahí.
+    anterior = None
+    if history_instance.history_type != '+':
+        anterior = history_instance.prev_record or registro_frio(history_instance)
+    construir_cambio(history_instance, anterior).save()
+
+
+def materializar_historial(historico, desde=None, lote=1000, salida=None):
+    """
+    Crea los CambioHistorial que falten para una tabla de historial.
+
+    Recorre los objetos por rangos de ID y, dentro de cada objeto, sus
+    registros en orden (history_date, history_id): el anterior de cada
+    registro es el que se acaba de leer. Es idempotente (ignora los ya
+    materializados).
+
+    Args:
+        historico: HistoricoPreparacion o HistoricoArchivo
+        desde (int, optional): Primer ID de objeto (trámite o archivo) a procesar
+        lote (int): Objetos por rango
+        salida (callable, optional): Función para informar el avance
+
+    Returns:
+        int: Registros procesados
+    """
+    registros = historico.objects.all()
+    if desde is not None:
+        registros = registros.filter(id__gte=desde)
+    primero = registros.order_by('id').values_list('id', flat=True).first()
+    ultimo = registros.order_by('-id').values_list('id', flat=True).first()
+    if primero is None:
+        return 0
+
+    procesados = 0
+    for inicio in range(primero, ultimo + 1, lote):
+        cambios = []
+        anterior = None
+        for registro in registros.filter(id__gte=inicio, id__lt=inicio + lote).order_by(
+            'id', 'history_date', 'history_id'
+        ).iterator(chunk_size=2000):
+            if anterior is not None and anterior.id != registro.id:
+                anterior = None
+            cambios.append(construir_cambio(registro, anterior))
+            anterior = registro
+
+        CambioHistorial.objects.bulk_create(cambios, batch_size=1000, ignore_conflicts=True)
+        procesados += len(cambios)
+        if salida and cambios:
+            salida(f'{historico._meta.db_table}: hasta ID {min(inicio + lote, ultimo + 1) - 1} ({procesados} registros)')
+    return procesados
+
+
+def codificar_cursor(cambio):
+    payload = json.dumps({'f': cambio.history_date.isoformat(), 'o': cambio.entidad, 'h': cambio.history_id})
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+
+def decodificar_cursor(token):
+    """Retorna (history_date, entidad, history_id) o None si es la primera página"""
+    if not token:
+        return None
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8'))
+        return datetime.fromisoformat(payload['f']), int(payload['o']), int(payload['h'])
+    except (TypeError, ValueError, KeyError):
+        raise NotFound('Cursor inválido')
+
+
+def trazabilidad(request, tramite_id, etiquetas):
+    """
+    Una página de la trazabilidad de un trámite (lo más nuevo primero).
+    Lee ?cursor= y ?page_size= (default 50, máximo 500) de la petición.
+
+    Args:
+        request: Petición de DRF
+        tramite_id (int): ID del trámite
+        etiquetas (dict): {entidad: (texto de "entidad", "tipo", plantilla de "descripcion")}
+            solo con las entidades que se muestran; la plantilla recibe {referencia}
+
+    Returns:
+        dict: total_eventos, next (URL o None) y trazabilidad_completa
+    """
+    try:
+        limite = int(request.query_params.get('page_size', TAMANO_PAGINA))
+    except ValueError:
+        limite = TAMANO_PAGINA
+    limite = max(1, min(limite, MAX_TAMANO_PAGINA))
+
+    cambios = CambioHistorial.objects.filter(tramite_id=tramite_id, entidad__in=list(etiquetas))
+    pagina = cambios
+    cursor = decodificar_cursor(request.query_params.get('cursor'))
+    if cursor is not None:
+        fecha, entidad, history_id = cursor
+        pagina = pagina.filter(
+            Q(history_date__lt=fecha)
+            | Q(history_date=fecha, entidad__lt=entidad)
+            | Q(history_date=fecha, entidad=entidad, history_id__lt=history_id)
+        )
+    filas = list(pagina.select_related('history_user').order_by(
+        '-history_date', '-entidad', '-history_id'
+    )[:limite + 1])
+
+    siguiente = None
+    if len(filas) > limite:
+        filas = filas[:limite]
+        siguiente = replace_query_param(request.build_absolute_uri(), 'cursor', codificar_cursor(filas[-1]))
+
+    eventos = []
+    for cambio in filas:
+        entidad, tipo, descripcion = etiquetas[cambio.entidad]
+        eventos.append({
+            "fecha": cambio.history_date,
+            "usuario": cambio.history_user.username if cambio.history_user else "Sistema",
+            "entidad": entidad,
+            "evento": cambio.get_history_type_display(),
+            "descripcion": descripcion.format(referencia=cambio.referencia),
+            "detalles": cambio.cambios,
+            "tipo": tipo
+        })
+
+    return {
+        "total_eventos": cambios.count(),
+        "next": siguiente,
+        "trazabilidad_completa": eventos
+    }
@@ -0,0 +1,100 @@
+# preparacion/lookups.py
+import re
+import unicodedata
+
+from django.db.models import Lookup
+
+
+# InnoDB ignora en FULLTEXT los términos más cortos que innodb_ft_min_token_size (3 por defecto)
+FULLTEXT_MIN_TOKEN = 3
+
+
+def normalizar_busqueda(texto):
+    """
+    Normaliza un texto para la columna de búsqueda: minúsculas, sin tildes
+    y solo letras/números separados por un espacio.
+    """
+    if not texto:
+        return ''
+    texto = unicodedata.normalize('NFKD', str(texto))
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return ' '.join(re.findall(r'[a-z0-9]+', texto.lower()))
+
+
+def terminos_busqueda(texto):
+    """Divide la búsqueda del usuario en términos normalizados"""
+    return normalizar_busqueda(texto).split()
+
+
+def compactar_busqueda(texto):
+    """Texto normalizado sin separadores, como la columna `placa_busqueda` ("ABC-12" -> "abc12")"""
+    return ''.join(terminos_busqueda(texto))
+
+
+def fin_prefijo(prefijo):
+    """
+    Primer texto compactado mayor que todos los que empiezan con `prefijo`
+    ("abc12" -> "abc13", "ab9" -> "aba", "abz" -> "ac"); None si no hay cota.
+
+    Con `>= prefijo AND < fin_prefijo(prefijo)` la búsqueda por prefijo es un
+    rango del índice B-tree en cualquier motor (un LIKE insensible a mayúsculas
+    no usa el índice en SQLite). Vale porque los textos solo tienen [0-9a-z] y
+    los dígitos van antes que las letras en todas las collations.
+    """
+    while prefijo and prefijo[-1] == 'z':
+        prefijo = prefijo[:-1]
+    if not prefijo:
+        return None
+    ultimo = prefijo[-1]
+    return prefijo[:-1] + ('a' if ultimo == '9' else chr(ord(ultimo) + 1))
+
+
+class BusquedaFullText(Lookup):
+    """
+    Lookup `__fulltext` para la columna desnormalizada de búsqueda.
+
+    Cada término es obligatorio y coincide con el inicio de una palabra de la
+    columna ("bog" encuentra "bogota", "ota" no). En MySQL los términos de al
+    menos FULLTEXT_MIN_TOKEN caracteres usan el índice FULLTEXT (MATCH ...
+    AGAINST '+term*' en modo booleano); los más cortos, que InnoDB no indexa,
+    y todos los términos en otros motores se comparan con LIKE por inicio de
+    palabra sobre la misma columna, así que el resultado no depende del largo
+    de los términos ni del motor.
+
+    Es una búsqueda por palabra, no por subcadena. Las búsquedas con forma de
+    placa van por prefijo a `placa_busqueda` (índice B-tree) sin pasar por
+    aquí (ver filtrar_tramites).
+    """
+    lookup_name = 'fulltext'
+
+    def prefijos_sql(self, lhs, lhs_params, terminos):
+        """LIKE por inicio de palabra (la columna separa las palabras con un espacio)"""
+        condiciones, params = [], []
+        for termino in terminos:
+            condiciones.append(f'({lhs} LIKE %s OR {lhs} LIKE %s)')
+            params.extend(lhs_params + [f'{termino}%'] + lhs_params + [f'% {termino}%'])
+        return condiciones, params
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        terminos = terminos_busqueda(self.rhs)
+        if not terminos:
+            return '1 = 1', []
+
+        condiciones, params = self.prefijos_sql(lhs, lhs_params, terminos)
+        return '(' + ' AND '.join(condiciones) + ')', params
+
+    def as_mysql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        terminos = terminos_busqueda(self.rhs)
+        largos = [termino for termino in terminos if len(termino) >= FULLTEXT_MIN_TOKEN]
+        if not largos:
+            return self.as_sql(compiler, connection)
+
+        consulta = ' '.join(f'+{termino}*' for termino in largos)
+        condiciones = [f'MATCH ({lhs}) AGAINST (%s IN BOOLEAN MODE)']
+        params = lhs_params + [consulta]
+        cortos, params_cortos = self.prefijos_sql(
+            lhs, lhs_params, [termino for termino in terminos if len(termino) < FULLTEXT_MIN_TOKEN]
+        )
+        return '(' + ' AND '.join(condiciones + cortos) + ')', params + params_cortos
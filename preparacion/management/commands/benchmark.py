@@ -0,0 +1,325 @@
+# preparacion/management/commands/benchmark.py
+import asyncio
+import json
+import logging
+import math
+import random
+import time
+
+from asgiref.sync import sync_to_async
+from channels.layers import InMemoryChannelLayer, channel_layers, get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from backend.logs import medir
+from backend.middleware import JWTAuthMiddlewareStack
+from backend.routing import websocket_urlpatterns
+from preparacion.api.services import MODULO_TRACKER, filtrar_tramites, get_queryset_modulo
+from preparacion.models import Preparacion
+from preparacion.semillas import sembrar_tramites
+from proveedores.models import Proveedor
+from tracker.websocket.utils import notify_tracker_updated
+from user.models import User
+
+
+# Prefijo de la API de cada módulo (estado_modulo: prefijo)
+PREFIJOS = {1: 'preparacion', 2: 'tracker', 3: 'finalizados', 0: 'archivadas'}
+
+# Filtros de los listados (los mismos que usa el frontend)
+ESCENARIOS_LISTADO = [
+    ('sin filtros', {}),
+    ('estado', {'estado': 'finalizado'}),
+    ('búsqueda', {'search': 'abc'}),
+    ('página 5', {'page': '5', 'page_size': '50'}),
+    ('cursor', {'cursor': '', 'page_size': '50'}),
+]
+
+
+# Búsquedas típicas: placa sin coincidencias (pasa a la columna de texto), palabra,
+# municipio, proveedor; medir_busqueda agrega el inicio de una placa existente
+TERMINOS_BUSQUEDA = ['ABC12', 'abc', 'bogota', 'proveedor 0001']
+
+# Búsqueda anterior a la columna `busqueda`: OR de icontains sobre las tablas unidas (referencia)
+BUSQUEDA_ICONTAINS = (
+    'placa', 'tipo_vehiculo', 'usuario__username', 'proveedor__codigo_encargado',
+    'proveedor__nombre', 'nombre_depto', 'nombre_muni',
+)
+
+
+def percentil(valores, p):
+    """Percentil por rango más cercano (valores ya ordenados)"""
+    if not valores:
+        return 0.0
+    return valores[max(0, math.ceil(p / 100 * len(valores)) - 1)]
+
+
+class CapaMemoriaEntreHilos(InMemoryChannelLayer):
+    """
+    Channel layer en memoria que acepta group_send desde otro hilo.
+
+    Las colas de InMemoryChannelLayer pertenecen al event loop de los consumers;
+    el despachador de notificaciones envía desde el loop de su propio hilo, así
+    que el envío se pasa al loop dueño (`loop`), como lo haría Redis entre procesos.
+    """
+    loop = None
+
+    async def group_send(self, group, message):
+        if self.loop is None or self.loop is asyncio.get_running_loop():
+            return await super().group_send(group, message)
+        futuro = asyncio.run_coroutine_threadsafe(super().group_send(group, message), self.loop)
+        return await asyncio.wrap_future(futuro)
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide la API y los WebSockets con volúmenes realistas: siembra la base "
+        "(opcional), recorre los endpoints de listado, detalle, historial, edición y transición, "
+        "compara la búsqueda con el OR de icontains anterior, "
+        "conecta N clientes WebSocket sobre el channel layer en memoria y reporta "
+        "p50/p95/p99 y consultas por petición."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sembrar',
+            action='store_true',
+            help='Carga el catálogo y los trámites de prueba antes de medir'
+        )
+        parser.add_argument('--tramites', type=int, default=100_000, help='Trámites a sembrar (default 100000)')
+        parser.add_argument('--archivos-per', type=int, default=3, help='Archivos por trámite (default 3)')
+        parser.add_argument('--seed', type=int, default=42, help='Semilla de los datos y del recorrido')
+        parser.add_argument('--iteraciones', type=int, default=50, help='Peticiones por endpoint y escenario')
+        parser.add_argument('--ws-clientes', type=int, default=100, help='Clientes WebSocket concurrentes')
+        parser.add_argument('--ws-eventos', type=int, default=50, help='Eventos enviados a los clientes WebSocket')
+        parser.add_argument('--json', action='store_true', help='Imprime además los resultados en JSON')
+
+    def handle(self, *args, **options):
+        if options['sembrar']:
+            self.stdout.write(self.style.MIGRATE_HEADING('Sembrando datos...'))
+            inicio = time.perf_counter()
+            sembrar_tramites(
+                options['tramites'],
+                archivos_por=options['archivos_per'],
+                semilla=options['seed'],
+                salida=self.stdout.write
+            )
+            self.stdout.write(self.style.SUCCESS(f'Datos sembrados en {time.perf_counter() - inicio:.1f}s'))
+
+        if not Preparacion.objects.exists():
+            raise CommandError('No hay trámites: ejecutar con --sembrar')
+
+        self.rnd = random.Random(options['seed'])
+        self.usuario = User.objects.filter(is_active=True, role='admin').first()
+        if self.usuario is None:
+            raise CommandError('Se necesita un usuario activo con rol admin')
+        self.token = str(AccessToken.for_user(self.usuario))
+
+        # Channel layer en memoria y registro de eventos local: sin Redis y sin tocar los clientes reales
+        notificaciones = {**getattr(settings, 'NOTIFICACIONES', {}), 'REGISTRO_EVENTOS': 'local'}
+        capa = {'default': {'BACKEND': 'preparacion.management.commands.benchmark.CapaMemoriaEntreHilos'}}
+        with override_settings(CHANNEL_LAYERS=capa, NOTIFICACIONES=notificaciones):
+            channel_layers.backends.clear()
+            try:
+                resultados = self.medir_api(options['iteraciones'])
+                resultados += self.medir_busqueda(options['iteraciones'])
+                resultados += asyncio.run(self.medir_websockets(options['ws_clientes'], options['ws_eventos']))
+            finally:
+                channel_layers.backends.clear()
+
+        self.reportar(resultados, options['json'])
+
+    # --- API ---
+
+    def medir_api(self, iteraciones):
+        """Recorre los endpoints y retorna [(nombre, [ms...], [consultas...])]"""
+        cliente = APIClient()
+        cliente.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        resultados = []
+
+        for estado_modulo, prefijo in PREFIJOS.items():
+            for escenario, params in ESCENARIOS_LISTADO:
+                resultados.append(self.medir(
+                    f'GET {prefijo}/list ({escenario})',
+                    lambda: cliente.get(f'/api/{prefijo}/list/', params),
+                    iteraciones
+                ))
+
+            ids = self.muestra_ids(estado_modulo=estado_modulo, cantidad=iteraciones)
+            resultados.append(self.medir(
+                f'GET {prefijo}/<pk>',
+                lambda: cliente.get(f'/api/{prefijo}/{ids.pop()}/'),
+                len(ids)
+            ))
+
+            ids = self.muestra_ids(estado_modulo=estado_modulo, cantidad=iteraciones)
+            resultados.append(self.medir(
+                f'GET {prefijo}/<pk>/history',
+                lambda: cliente.get(f'/api/{prefijo}/{ids.pop()}/history/'),
+                len(ids)
+            ))
+
+        ids = self.muestra_ids(estado_modulo=2, cantidad=iteraciones)
+        proveedores = list(Proveedor.objects.values_list('id', flat=True)[:20])
+        resultados.append(self.medir(
+            'PUT tracker/<pk>/update',
+            lambda: cliente.put(f'/api/tracker/{ids.pop()}/update/', {
+                'estado_tracker': self.rnd.choice(['en_radicacion', 'con_novedad']),
+                'estado_detalle': f'Benchmark {self.rnd.randint(1, 10**6)}',
+                'proveedor': self.rnd.choice(proveedores),
+            }, format='json'),
+            len(ids)
+        ))
+
+        # La transición mueve trámites de Preparación a Tracker (modifica los datos sembrados)
+        ids = self.muestra_ids(estado_modulo=1, cantidad=iteraciones)
+        resultados.append(self.medir(
+            'POST preparacion/<pk>/send-to-tracker',
+            lambda: cliente.post(f'/api/preparacion/{ids.pop()}/send-to-tracker/', {
+                'proveedor': self.rnd.choice(proveedores),
+                'fecha_recepcion_municipio': '2025-01-15',
+            }, format='json'),
+            len(ids)
+        ))
+        return resultados
+
+    def muestra_ids(self, estado_modulo, cantidad):
+        """IDs al azar (deterministas) de un módulo"""
+        ids = list(Preparacion.objects.filter(estado_modulo=estado_modulo).values_list('id', flat=True))
+        return self.rnd.sample(ids, min(cantidad, len(ids)))
+
+    def medir(self, nombre, peticion, iteraciones):
+        """Ejecuta la petición `iteraciones` veces midiendo duración y consultas"""
+        tiempos, consultas = [], []
+        for _ in range(iteraciones):
+            # La medición externa hace que RegistroPeticionesMiddleware no escriba una línea por petición
+            with medir() as medicion:
+                response = peticion()
+            if response.status_code >= 400:
+                raise CommandError(f'{nombre}: HTTP {response.status_code} {response.content[:200]!r}')
+            tiempos.append(medicion.duracion_ms())
+            consultas.append(medicion.consultas)
+        self.stdout.write(f'  {nombre}: {iteraciones} peticiones')
+        return (nombre, tiempos, consultas)
+
+    # --- Búsqueda ---
+
+    def medir_busqueda(self, iteraciones):
+        """
+        Compara la búsqueda actual (prefijo de `placa_busqueda` o columna `busqueda`,
+        ver filtrar_tramites) con el OR de icontains anterior: COUNT y primera página
+        de Tracker por término. En MySQL la columna `busqueda` usa el índice FULLTEXT;
+        en otros motores, LIKE por inicio de palabra (explain_listados verifica el índice).
+        """
+        resultados = []
+        terminos = list(TERMINOS_BUSQUEDA)
+        placa = get_queryset_modulo(MODULO_TRACKER).values_list('placa', flat=True).first()
+        if placa:
+            terminos = [placa[:5], f'{placa[:3]}-{placa[3:5]}'] + terminos
+        for termino in terminos:
+            icontains = Q()
+            for campo in BUSQUEDA_ICONTAINS:
+                icontains |= Q(**{f'{campo}__icontains': termino})
+
+            for nombre, consultar in (
+                # filtrar_tramites consulta si hay placas con ese prefijo: se mide dentro
+                ('actual', lambda t=termino: filtrar_tramites(MODULO_TRACKER, {'search': t})),
+                ('icontains', lambda: get_queryset_modulo(MODULO_TRACKER).filter(icontains)),
+            ):
+                tiempos, consultas = [], []
+                for _ in range(iteraciones):
+                    with medir() as medicion:
+                        tramites = consultar()
+                        tramites.count()
+                        list(tramites.order_by('-created_at')[:50])
+                    tiempos.append(medicion.duracion_ms())
+                    consultas.append(medicion.consultas)
+                resultados.append((f'búsqueda {nombre} "{termino}" ({tramites.count()} filas)', tiempos, consultas))
+        self.stdout.write(f'  Búsqueda: {len(terminos)} términos')
+        return resultados
+
+    # --- WebSockets ---
+
+    async def medir_websockets(self, clientes, eventos):
+        """
+        Conecta `clientes` sockets a /ws/tracker/ (con autenticación JWT, todos a
+        la vez) y publica `eventos` actualizaciones como lo hacen las vistas
+        (notify_tracker_updated → despachador). Mide el handshake completo y el
+        tiempo desde que se encola cada evento hasta que cada cliente lo recibe,
+        con la ventana de agrupación y el flush del despachador incluidos.
+        """
+        if not clientes:
+            return []
+        aplicacion = JWTAuthMiddlewareStack(URLRouter(websocket_urlpatterns))
+        # El despachador envía desde su propio hilo: la capa debe devolver los mensajes a este loop
+        get_channel_layer().loop = asyncio.get_running_loop()
+        nivel = logging.root.manager.disable
+        logging.disable(logging.INFO)  # evento_ws registra cada conexión en INFO
+        conectados = []
+
+        async def conectar():
+            comunicador = WebsocketCommunicator(aplicacion, f'/ws/tracker/?token={self.token}')
+            inicio = time.perf_counter()
+            conectado, _ = await comunicador.connect()
+            if not conectado:
+                raise CommandError('El WebSocket rechazó la conexión')
+            conectados.append(comunicador)
+            await comunicador.receive_json_from()  # connection_established
+            return round((time.perf_counter() - inicio) * 1000, 2)
+
+        try:
+            conexiones = await asyncio.gather(*(conectar() for _ in range(clientes)))
+            self.stdout.write(f'  WS connect: {clientes} clientes concurrentes')
+
+            encolados = {}
+            for numero in range(eventos):
+                encolados[numero] = time.perf_counter()
+                await sync_to_async(notify_tracker_updated)({'id': numero, 'estado_tracker': 'en_radicacion'})
+
+            async def recibir(comunicador):
+                tiempos = []
+                for _ in range(eventos):
+                    mensaje = await comunicador.receive_json_from(timeout=10)
+                    tiempos.append(round((time.perf_counter() - encolados[mensaje['data']['id']]) * 1000, 2))
+                return tiempos
+
+            entregas = [t for tiempos in await asyncio.gather(*(recibir(c) for c in conectados)) for t in tiempos]
+            self.stdout.write(f'  WS fan-out: {eventos} eventos x {clientes} clientes')
+        finally:
+            await asyncio.gather(*(comunicador.disconnect() for comunicador in conectados))
+            logging.disable(nivel)
+
+        return [
+            (f'WS connect /ws/tracker/ ({clientes} clientes)', list(conexiones), []),
+            (f'WS fan-out tracker_updated ({clientes} clientes)', entregas, []),
+        ]
+
+    # --- Reporte ---
+
+    def reportar(self, resultados, como_json=False):
+        self.stdout.write(self.style.MIGRATE_HEADING('\nResultados (ms)'))
+        ancho = max(len(nombre) for nombre, _, _ in resultados)
+        self.stdout.write(f"{'endpoint'.ljust(ancho)}  {'n':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'consultas':>10}")
+        for nombre, tiempos, consultas in resultados:
+            tiempos = sorted(tiempos)
+            promedio = f'{sum(consultas) / len(consultas):.1f}' if consultas else '-'
+            self.stdout.write(
+                f'{nombre.ljust(ancho)}  {len(tiempos):>6} {percentil(tiempos, 50):>8.2f} '
+                f'{percentil(tiempos, 95):>8.2f} {percentil(tiempos, 99):>8.2f} {promedio:>10}'
+            )
+        if como_json:
+            self.stdout.write(json.dumps({
+                nombre: {
+                    'n': len(tiempos),
+                    'p50': percentil(sorted(tiempos), 50),
+                    'p95': percentil(sorted(tiempos), 95),
+                    'p99': percentil(sorted(tiempos), 99),
+                    'consultas': round(sum(consultas) / len(consultas), 2) if consultas else None,
+                }
+                for nombre, tiempos, consultas in resultados
+            }, ensure_ascii=False))
@@ -0,0 +1,84 @@
+# preparacion/management/commands/benchmark_paginacion.py
+import math
+import time
+
+from django.core.management.base import CommandError
+from rest_framework.test import APIClient
+
+from preparacion.api.pagination import codificar_cursor
+from preparacion.management.commands.benchmark import PREFIJOS, Command as Benchmark
+from preparacion.models import Preparacion
+from preparacion.semillas import sembrar_tramites
+from user.models import User
+
+
+class Command(Benchmark):
+    help = (
+        "Compara una página profunda con ?page= (LIMIT/OFFSET) contra la misma "
+        "posición con ?cursor= (keyset) a varios tamaños de tabla. Siembra la base "
+        "hasta cada tamaño (de menor a mayor) y mide la primera y la última página "
+        "del listado del módulo en ambos modos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tamanos',
+            type=int,
+            nargs='+',
+            default=[10_000, 100_000],
+            help='Total de trámites en la tabla para cada medición (default 10000 100000)'
+        )
+        parser.add_argument('--modulo', type=int, choices=sorted(PREFIJOS), default=1, help='estado_modulo del listado')
+        parser.add_argument('--page-size', type=int, default=50, help='Filas por página (default 50)')
+        parser.add_argument('--archivos-per', type=int, default=3, help='Archivos por trámite sembrado (default 3)')
+        parser.add_argument('--seed', type=int, default=42, help='Semilla de los datos')
+        parser.add_argument('--iteraciones', type=int, default=20, help='Peticiones por escenario')
+        parser.add_argument('--json', action='store_true', help='Imprime además los resultados en JSON')
+
+    def handle(self, *args, **options):
+        tamanos = sorted(options['tamanos'])
+        existentes = Preparacion.objects.count()
+        if existentes > tamanos[0]:
+            raise CommandError(f'La base ya tiene {existentes} trámites (más que --tamanos {tamanos[0]})')
+
+        resultados = []
+        for numero, tamano in enumerate(tamanos):
+            faltan = tamano - Preparacion.objects.count()
+            if faltan > 0:
+                self.stdout.write(self.style.MIGRATE_HEADING(f'Sembrando hasta {tamano} trámites...'))
+                inicio = time.perf_counter()
+                sembrar_tramites(faltan, archivos_por=options['archivos_per'], semilla=options['seed'] + numero)
+                self.stdout.write(self.style.SUCCESS(f'{faltan} trámites en {time.perf_counter() - inicio:.1f}s'))
+            resultados += self.medir_paginas(tamano, options['modulo'], options['page_size'], options['iteraciones'])
+
+        self.reportar(resultados, options['json'])
+
+    def medir_paginas(self, tamano, estado_modulo, page_size, iteraciones):
+        """Primera y última página del listado con ?page= y con ?cursor= (misma posición)"""
+        usuario = User.objects.filter(is_active=True, role='admin').first()
+        if usuario is None:
+            raise CommandError('Se necesita un usuario activo con rol admin')
+        cliente = APIClient()
+        cliente.force_authenticate(usuario)
+
+        prefijo = PREFIJOS[estado_modulo]
+        url = f'/api/{prefijo}/list/'
+        filas = Preparacion.objects.filter(estado_modulo=estado_modulo).order_by('-created_at', '-id')
+        ultima = max(1, math.ceil(filas.count() / page_size))
+
+        # Cursor que apunta a la última fila de la penúltima página
+        cursor_profundo = ''
+        if ultima > 1:
+            created_at, pk = filas.values_list('created_at', 'id')[(ultima - 1) * page_size - 1]
+            cursor_profundo = codificar_cursor(created_at, pk)
+
+        escenarios = [
+            ('?page=1', {'page': '1', 'page_size': page_size}),
+            (f'?page={ultima}', {'page': str(ultima), 'page_size': page_size}),
+            ('?cursor= (primera)', {'cursor': '', 'page_size': page_size}),
+            (f'?cursor= (página {ultima})', {'cursor': cursor_profundo, 'page_size': page_size}),
+        ]
+        return [
+            self.medir(f'{tamano} trámites {prefijo} {nombre}', lambda p=params: cliente.get(url, p), iteraciones)
+            for nombre, params in escenarios
+        ]
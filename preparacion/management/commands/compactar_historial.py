@@ -0,0 +1,68 @@
+# preparacion/management/commands/compactar_historial.py
+import time
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from preparacion.historial import HistoricoArchivo, HistoricoPreparacion
+from preparacion.retencion import compactar, get_config, mover_a_frio
+
+
+class Command(BaseCommand):
+    help = (
+        "Aplica la retención del historial (settings.HISTORIAL): compacta los "
+        "registros antiguos en snapshots + cambios materializados y mueve a la "
+        "tabla fría el historial de los trámites archivados hace tiempo. "
+        "Pensado para ejecutarse periódicamente (cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--paso',
+            choices=['compactar', 'frio'],
+            help='Solo uno de los dos pasos (por defecto ambos)'
+        )
+        parser.add_argument('--dias', type=int, help='Compactar registros con más de N días (DIAS_COMPACTAR)')
+        parser.add_argument('--dias-snapshot', type=int, help='Un snapshot completo por período de N días (DIAS_SNAPSHOT)')
+        parser.add_argument('--meses', type=int, help='Trámites archivados sin cambios en N meses (MESES_TABLA_FRIA)')
+        parser.add_argument('--lote', type=int, help='Objetos por transacción (LOTE)')
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Calcula lo que se haría y revierte todo al terminar'
+        )
+
+    def handle(self, *args, **options):
+        for opcion in ('dias', 'dias_snapshot', 'meses', 'lote'):
+            if options[opcion] is not None and options[opcion] < (0 if opcion in ('dias', 'meses') else 1):
+                raise CommandError(f"Valor inválido para --{opcion.replace('_', '-')}: {options[opcion]}")
+
+        salida = self.stdout.write if options['verbosity'] > 1 else None
+        inicio = time.perf_counter()
+
+        # Cada lote se confirma por separado; en --dry-run todo corre dentro de una transacción que se revierte
+        with transaction.atomic() if options['dry_run'] else nullcontext():
+            if options['paso'] in (None, 'frio'):
+                meses = options['meses'] if options['meses'] is not None else get_config('MESES_TABLA_FRIA', 12)
+                movidos = mover_a_frio(meses=meses, lote=options['lote'], salida=salida)
+                self.stdout.write(self.style.SUCCESS(
+                    f"✅ Tabla fría: {movidos} registros de trámites archivados hace más de {meses} meses"
+                ))
+
+            if options['paso'] in (None, 'compactar'):
+                for nombre, historico in (('trámites', HistoricoPreparacion), ('archivos', HistoricoArchivo)):
+                    borrados = compactar(
+                        historico,
+                        dias=options['dias'],
+                        dias_snapshot=options['dias_snapshot'],
+                        lote=options['lote'],
+                        salida=salida
+                    )
+                    self.stdout.write(self.style.SUCCESS(f"✅ Compactación de {nombre}: {borrados} registros borrados"))
+
+            if options['dry_run']:
+                transaction.set_rollback(True)
+                self.stdout.write(self.style.WARNING('Dry run: no se guardó ningún cambio'))
+
+        self.stdout.write(f"Terminado en {time.perf_counter() - inicio:.1f}s")
@@ -0,0 +1,181 @@
+# preparacion/management/commands/explain_listados.py
+import math
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from rest_framework.request import Request
+
+from preparacion.api.pagination import codificar_cursor
+from preparacion.api.services import MODULOS, get_queryset_modulo, listar_tramites
+
+# Tipos de problema en un plan de ejecución
+FULL_SCAN = 'full_scan'
+FILESORT = 'filesort'
+TEMPORAL = 'temporal'
+DEPENDIENTE = 'subconsulta_dependiente'
+SIN_INDICE = 'sin_indice'
+
+# Combinaciones de filtros que usan realmente los listados
+ESCENARIOS = [
+    ('sin filtros', {}),
+    ('estado', {'estado': 'en_verificacion'}),
+    ('proveedor', {'proveedor': '1'}),
+    ('rango de fechas', {'start_date': '2024-01-01', 'end_date': '2024-12-31'}),
+    ('búsqueda', {'search': 'bogota'}),
+    ('cursor', {'cursor': ''}),
+]
+
+# Índice de preparacion que debe usar el listado en cada escenario de búsqueda
+# (solo se verifica si el índice existe en la base: el FULLTEXT es solo de MySQL)
+INDICES_ESPERADOS = {
+    'búsqueda': 'ft_prep_busqueda',
+    'búsqueda placa': 'idx_prep_modulo_placa',
+}
+
+
+def escenarios(modulo, page_size=50):
+    """
+    ESCENARIOS del módulo más, calculados con los datos actuales, el inicio de
+    una placa del módulo (búsqueda por prefijo), la última página (?page= con
+    el OFFSET más grande) y un cursor a la misma profundidad.
+    """
+    resultado = [
+        (nombre, params) for nombre, params in ESCENARIOS
+        if 'proveedor' not in params or 'proveedor' in modulo.filtros
+    ]
+    filas = get_queryset_modulo(modulo).order_by('-created_at', '-id')
+    placa = filas.values_list('placa', flat=True).first() or 'ABC123'
+    resultado.append(('búsqueda placa', {'search': placa[:5]}))
+    ultima = max(1, math.ceil(filas.count() / page_size))
+    resultado.append(('página profunda', {'page': str(ultima), 'page_size': str(page_size)}))
+    if ultima > 1:
+        created_at, pk = filas.values_list('created_at', 'id')[(ultima - 1) * page_size - 1]
+        resultado.append(('cursor profundo', {'cursor': codificar_cursor(created_at, pk), 'page_size': str(page_size)}))
+    return resultado
+
+
+def consultas_listado(modulo, params):
+    """SELECT que ejecuta el listado del módulo con estos query params"""
+    request = Request(RequestFactory().get('/', params))
+    with CaptureQueriesContext(connection) as ctx:
+        listar_tramites(modulo, request)
+    return [query['sql'] for query in ctx.captured_queries if query['sql'].lstrip().upper().startswith('SELECT')]
+
+
+def explicar(sql, indice=None):
+    """
+    Ejecuta EXPLAIN y retorna los problemas encontrados [(tipo, mensaje)].
+
+    Con `indice` (escenarios de búsqueda), también si la consulta sobre
+    preparacion no lo usa. Si lo usa, el ordenamiento es solo de las filas
+    que coinciden y no se señala.
+    """
+    with connection.cursor() as cursor:
+        restricciones = connection.introspection.get_constraints(cursor, 'preparacion')
+        if indice and indice not in restricciones:
+            indice = None
+        if connection.vendor == 'mysql':
+            cursor.execute(f'EXPLAIN {sql}')
+            columnas = [col[0] for col in cursor.description]
+            filas = [dict(zip(columnas, fila)) for fila in cursor.fetchall()]
+            problemas = problemas_mysql(filas)
+            usados = [fila.get('key') for fila in filas if fila.get('table') == 'preparacion']
+        else:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            detalles = [fila[-1] for fila in cursor.fetchall()]
+            problemas = problemas_sqlite(detalles)
+            # Usado de verdad: con su última columna en la condición (no solo el estado_modulo)
+            usados = [
+                indice for detalle in detalles
+                if indice and f'INDEX {indice} ' in detalle and restricciones[indice]['columns'][-1] in detalle
+            ]
+
+    # Solo las consultas que leen preparacion (no la carga de archivos por lotes)
+    if indice and ' FROM "preparacion"' in sql.replace('`', '"'):
+        if indice not in usados:
+            problemas.append((SIN_INDICE, f"No usa el índice {indice}"))
+        else:
+            problemas = [(tipo, mensaje) for tipo, mensaje in problemas if tipo != FILESORT]
+    return problemas
+
+
+def problemas_mysql(filas):
+    problemas = []
+    for fila in filas:
+        tabla = fila.get('table')
+        extra = fila.get('Extra') or ''
+        if fila.get('type') == 'ALL':
+            problemas.append((FULL_SCAN, f"Full scan en {tabla} (~{fila.get('rows')} filas)"))
+        if 'Using filesort' in extra:
+            problemas.append((FILESORT, f"Filesort en {tabla}"))
+        if 'Using temporary' in extra:
+            problemas.append((TEMPORAL, f"Tabla temporal en {tabla}"))
+        if 'DEPENDENT' in (fila.get('select_type') or ''):
+            problemas.append((DEPENDIENTE, f"Subconsulta dependiente ({fila.get('select_type')}) en {tabla}"))
+    return problemas
+
+
+def problemas_sqlite(detalles):
+    problemas = []
+    for detalle in detalles:
+        if detalle.startswith('SCAN') and 'USING' not in detalle:
+            problemas.append((FULL_SCAN, f"Full scan: {detalle}"))
+        if 'USE TEMP B-TREE' in detalle:
+            problemas.append((FILESORT, f"Ordenamiento temporal (filesort): {detalle}"))
+        if 'CORRELATED' in detalle:
+            problemas.append((DEPENDIENTE, f"Subconsulta dependiente: {detalle}"))
+    return problemas
+
+
+class Command(BaseCommand):
+    help = (
+        "Ejecuta EXPLAIN sobre el SQL que generan los listados de cada módulo "
+        "y señala filesorts, tablas temporales, full scans, subconsultas dependientes "
+        "y búsquedas que no usan su índice (FULLTEXT o prefijo de placa)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--modulo',
+            type=int,
+            choices=sorted(MODULOS),
+            help='Solo el módulo con este estado_modulo (1, 2, 3, 0)'
+        )
+        parser.add_argument(
+            '--fail',
+            action='store_true',
+            help='Termina con error si se encuentra algún problema (útil en CI)'
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor not in ('mysql', 'sqlite'):
+            raise CommandError(f"Motor no soportado para EXPLAIN: {connection.vendor}")
+
+        modulos = [MODULOS[options['modulo']]] if options['modulo'] is not None else MODULOS.values()
+        total_problemas = 0
+
+        for modulo in modulos:
+            self.stdout.write(self.style.MIGRATE_HEADING(f"\n=== Módulo {modulo.nombre} (estado_modulo={modulo.estado_modulo}) ==="))
+
+            for escenario, params in escenarios(modulo):
+                for sql in consultas_listado(modulo, params):
+                    problemas = explicar(sql, INDICES_ESPERADOS.get(escenario))
+                    total_problemas += len(problemas)
+
+                    if problemas:
+                        self.stdout.write(self.style.WARNING(f"[{escenario}] {sql[:160]}..."))
+                        for _, problema in problemas:
+                            self.stdout.write(self.style.WARNING(f"    ⚠️ {problema}"))
+                    else:
+                        self.stdout.write(self.style.SUCCESS(f"[{escenario}] OK: {sql[:120]}..."))
+
+        self.stdout.write('')
+        if total_problemas:
+            mensaje = f"Se encontraron {total_problemas} problema(s) en los planes de ejecución"
+            if options['fail']:
+                raise CommandError(mensaje)
+            self.stdout.write(self.style.WARNING(mensaje))
+        else:
+            self.stdout.write(self.style.SUCCESS("Todos los planes usan índices, sin filesort ni subconsultas dependientes"))
@@ -0,0 +1,45 @@
+# preparacion/management/commands/materializar_historial.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from preparacion.historial import HistoricoArchivo, HistoricoPreparacion, materializar_historial
+
+
+class Command(BaseCommand):
+    help = (
+        "Calcula y guarda en CambioHistorial los cambios por campo del historial "
+        "existente de trámites y archivos. Es idempotente: se puede repetir o "
+        "reanudar con --desde."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tabla',
+            choices=['tramites', 'archivos'],
+            help='Solo el historial de trámites o el de archivos'
+        )
+        parser.add_argument(
+            '--desde',
+            type=int,
+            help='Primer ID de objeto (trámite o archivo) a procesar'
+        )
+        parser.add_argument('--lote', type=int, default=1000, help='Objetos por lote (default 1000)')
+
+    def handle(self, *args, **options):
+        tablas = {'tramites': HistoricoPreparacion, 'archivos': HistoricoArchivo}
+        if options['tabla']:
+            tablas = {options['tabla']: tablas[options['tabla']]}
+
+        for nombre, historico in tablas.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(f"Historial de {nombre} ({historico._meta.db_table})"))
+            inicio = time.perf_counter()
+            procesados = materializar_historial(
+                historico,
+                desde=options['desde'],
+                lote=options['lote'],
+                salida=self.stdout.write if options['verbosity'] > 1 else None
+            )
+            self.stdout.write(self.style.SUCCESS(
+                f"✅ {procesados} registros de {nombre} en {time.perf_counter() - inicio:.1f}s"
+            ))
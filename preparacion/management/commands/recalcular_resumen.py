@@ -0,0 +1,17 @@
+# preparacion/management/commands/recalcular_resumen.py
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from preparacion.resumen import recalcular_resumen
+
+
+class Command(BaseCommand):
+    help = (
+        "Reconstruye la tabla de resumen (conteos por módulo, estado y estado_tracker) "
+        "desde los trámites. Usar después de cargas masivas que no pasan por las vistas."
+    )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            recalcular_resumen()
+        self.stdout.write(self.style.SUCCESS("Tabla de resumen recalculada"))
@@ -0,0 +1,60 @@
+# preparacion/management/commands/seed_tracker.py
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from preparacion.models import Preparacion, PreparacionArchivo
+from preparacion.semillas import PESOS_MODULO, sembrar_tramites
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera datos sintéticos a escala: trámites en los cuatro módulos, sus "
+        "archivos y el historial de cada uno (bulk_create por lotes, determinista "
+        "según --seed). Si faltan, crea los departamentos y municipios con nombres "
+        "sintéticos (no es el catálogo DANE)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tramites', type=int, required=True, help='Trámites a crear')
+        parser.add_argument('--archivos-per', type=int, default=3, help='Archivos por trámite (default 3)')
+        parser.add_argument(
+            '--history-depth',
+            type=int,
+            default=5,
+            help='Filas de historial por trámite: creación, transiciones entre módulos y ediciones (default 5)'
+        )
+        parser.add_argument('--seed', type=int, default=42, help='Semilla del generador (default 42)')
+        parser.add_argument('--lote', type=int, default=5000, help='Trámites por lote de inserción (default 5000)')
+
+    def handle(self, *args, **options):
+        if options['tramites'] < 1:
+            raise CommandError('--tramites debe ser mayor que 0')
+        if options['history_depth'] < 1:
+            raise CommandError('--history-depth debe ser al menos 1 (la fila de creación)')
+        if options['archivos_per'] < 0 or options['lote'] < 1:
+            raise CommandError('--archivos-per no puede ser negativo y --lote debe ser mayor que 0')
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"Sembrando {options['tramites']} trámites "
+            f"({options['archivos_per']} archivos y {options['history_depth']} filas de historial cada uno)"
+        ))
+        inicio = time.perf_counter()
+        primer_id = sembrar_tramites(
+            options['tramites'],
+            archivos_por=options['archivos_per'],
+            profundidad_historial=options['history_depth'],
+            semilla=options['seed'],
+            tamano_lote=options['lote'],
+            salida=self.stdout.write
+        )
+        duracion = time.perf_counter() - inicio
+
+        creados = Preparacion.objects.filter(id__gte=primer_id)
+        for estado_modulo in PESOS_MODULO:
+            self.stdout.write(f"  estado_modulo={estado_modulo}: {creados.filter(estado_modulo=estado_modulo).count()}")
+        historial = Preparacion.history.filter(id__gte=primer_id).count()
+        archivos = PreparacionArchivo.objects.filter(tramite_id__gte=primer_id).count()
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {creados.count()} trámites, {archivos} archivos y {historial} filas de historial en {duracion:.1f}s"
+        ))
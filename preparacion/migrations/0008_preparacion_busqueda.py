@@ -0,0 +1,65 @@
+# Generated by Django 4.2 on 2026-10-16 22:31
+
+import re
+
+from django.db import migrations, models
+
+from preparacion.lookups import normalizar_busqueda
+
+
+def poblar_busqueda(apps, schema_editor):
+    """Calcula la columna busqueda para los trámites existentes (por lotes)"""
+    Preparacion = apps.get_model('preparacion', 'Preparacion')
+    tramites = Preparacion.objects.select_related(
+        'usuario', 'proveedor', 'departamento', 'municipio'
+    ).order_by('id')
+
+    lote = []
+    for tramite in tramites.iterator(chunk_size=2000):
+        placa = normalizar_busqueda(tramite.placa)
+        partes = [
+            placa,
+            ' '.join(re.findall(r'[a-z]+|[0-9]+', placa)),
+            tramite.tipo_vehiculo,
+            tramite.usuario.username if tramite.usuario_id else '',
+            tramite.proveedor.codigo_encargado if tramite.proveedor_id else '',
+            tramite.proveedor.nombre if tramite.proveedor_id else '',
+            tramite.departamento.departamento if tramite.departamento_id else '',
+            tramite.municipio.municipio if tramite.municipio_id else '',
+        ]
+        tramite.busqueda = normalizar_busqueda(' '.join(parte for parte in partes if parte))
+        lote.append(tramite)
+        if len(lote) >= 2000:
+            Preparacion.objects.bulk_update(lote, ['busqueda'])
+            lote = []
+    if lote:
+        Preparacion.objects.bulk_update(lote, ['busqueda'])
+
+
+def crear_indice_fulltext(apps, schema_editor):
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute(
+            'ALTER TABLE preparacion ADD FULLTEXT INDEX ft_prep_busqueda (busqueda)'
+        )
+
+
+def eliminar_indice_fulltext(apps, schema_editor):
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute('ALTER TABLE preparacion DROP INDEX ft_prep_busqueda')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('preparacion', '0007_alter_historicalpreparacion_estado_tracker_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='preparacion',
+            name='busqueda',
+            field=models.TextField(blank=True, default='', editable=False, help_text='Placa, tipo de vehículo, usuario, proveedor, departamento y municipio normalizados para búsqueda'),
+        ),
+        migrations.RunPython(poblar_busqueda, migrations.RunPython.noop),
+        migrations.RunPython(crear_indice_fulltext, eliminar_indice_fulltext),
+    ]
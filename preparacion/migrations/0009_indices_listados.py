@@ -0,0 +1,43 @@
+# Generated by Django 4.2 on 2026-10-16 22:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('preparacion', '0008_preparacion_busqueda'),
+    ]
+
+    # Los índices nuevos se crean antes de quitar los anteriores: MySQL no permite
+    # eliminar idx_prep_arch_tramite mientras sea el único índice de la FK tramite_id.
+    operations = [
+        migrations.AddIndex(
+            model_name='preparacion',
+            index=models.Index(fields=['estado_modulo', 'created_at'], name='idx_prep_modulo_fecha'),
+        ),
+        migrations.AddIndex(
+            model_name='preparacion',
+            index=models.Index(fields=['estado_modulo', 'estado', 'created_at'], name='idx_prep_modulo_estado'),
+        ),
+        migrations.AddIndex(
+            model_name='preparacion',
+            index=models.Index(fields=['estado_modulo', 'proveedor', 'created_at'], name='idx_prep_modulo_prov'),
+        ),
+        migrations.AddIndex(
+            model_name='preparacion',
+            index=models.Index(fields=['estado_modulo', 'fecha_recepcion_municipio'], name='idx_prep_modulo_recep'),
+        ),
+        migrations.AddIndex(
+            model_name='preparacionarchivo',
+            index=models.Index(fields=['tramite', 'created_at'], name='idx_prep_arch_tramite_fecha'),
+        ),
+        migrations.RemoveIndex(
+            model_name='preparacion',
+            name='idx_prep_estado_modulo',
+        ),
+        migrations.RemoveIndex(
+            model_name='preparacionarchivo',
+            name='idx_prep_arch_tramite',
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 4.2 on 2026-10-16 22:33
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def poblar_resumen(apps, schema_editor):
+    """Carga inicial de la tabla de resumen con un único COUNT ... GROUP BY"""
+    Preparacion = apps.get_model('preparacion', 'Preparacion')
+    ResumenModulo = apps.get_model('preparacion', 'ResumenModulo')
+
+    conteos = Preparacion.objects.values('estado_modulo', 'estado', 'estado_tracker').annotate(
+        cantidad=Count('id')
+    ).order_by()
+    ResumenModulo.objects.bulk_create([
+        ResumenModulo(
+            estado_modulo=fila['estado_modulo'],
+            estado=fila['estado'],
+            estado_tracker=fila['estado_tracker'],
+            total=fila['cantidad'],
+        )
+        for fila in conteos
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('preparacion', '0009_indices_listados'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenModulo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estado_modulo', models.IntegerField(help_text='Estado del módulo: 1-En preparación, 2-En Tracker, 3-En Finalizados, 0-Archivados')),
+                ('estado', models.CharField(help_text='Estado del trámite', max_length=20)),
+                ('estado_tracker', models.CharField(help_text='Estado del trámite en módulo Tracker', max_length=20)),
+                ('total', models.IntegerField(default=0, help_text='Cantidad de trámites con esta combinación')),
+                ('updated_at', models.DateTimeField(auto_now=True, help_text='Fecha y hora de última actualización')),
+            ],
+            options={
+                'verbose_name': 'Resumen de Módulo',
+                'verbose_name_plural': 'Resumen de Módulos',
+                'db_table': 'preparacion_resumen',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='resumenmodulo',
+            constraint=models.UniqueConstraint(fields=('estado_modulo', 'estado', 'estado_tracker'), name='uniq_resumen_clave'),
+        ),
+        migrations.RunPython(poblar_resumen, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-16 22:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('preparacion', '0010_resumen_modulo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='preparacion',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Número de versión del trámite, aumenta en cada guardado'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2 on 2026-10-16 23:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import rest_framework.utils.encoders
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('preparacion', '0011_preparacion_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CambioHistorial',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tramite_id', models.IntegerField(help_text='Trámite al que pertenece el registro (el propio o el del archivo)')),
+                ('entidad', models.PositiveSmallIntegerField(choices=[(0, 'Archivo'), (1, 'Trámite')], help_text='Tabla de historial de origen: 1-Trámite, 0-Archivo')),
+                ('history_id', models.IntegerField(help_text='history_id del registro en su tabla de historial')),
+                ('history_date', models.DateTimeField(help_text='Fecha del registro de historial')),
+                ('history_type', models.CharField(choices=[('+', 'Created'), ('~', 'Changed'), ('-', 'Deleted')], help_text='Tipo de registro: + creación, ~ cambio, - eliminación', max_length=1)),
+                ('referencia', models.CharField(help_text='Placa del trámite o nombre original del archivo en ese registro', max_length=255)),
+                ('cambios', models.JSONField(default=list, encoder=rest_framework.utils.encoders.JSONEncoder, help_text='Lista de {campo, anterior, nuevo} respecto al registro anterior del mismo objeto')),
+                ('history_user', models.ForeignKey(blank=True, db_constraint=False, help_text='Usuario que hizo el cambio', null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Cambio de Historial',
+                'verbose_name_plural': 'Cambios de Historial',
+                'db_table': 'preparacion_historial_cambios',
+                'ordering': ['-history_date', '-entidad', '-history_id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='cambiohistorial',
+            index=models.Index(fields=['tramite_id', 'history_date', 'entidad', 'history_id'], name='idx_cambio_tramite_fecha'),
+        ),
+        migrations.AddConstraint(
+            model_name='cambiohistorial',
+            constraint=models.UniqueConstraint(fields=('entidad', 'history_id'), name='uniq_cambio_registro'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.2 on 2026-10-16 23:03
+
+from django.db import migrations, models
+import rest_framework.utils.encoders
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('preparacion', '0012_historial_cambios'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HistorialFrio',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tramite_id', models.IntegerField(help_text='Trámite al que pertenece el registro')),
+                ('entidad', models.PositiveSmallIntegerField(choices=[(0, 'Archivo'), (1, 'Trámite')], help_text='Tabla de historial de origen: 1-Trámite, 0-Archivo')),
+                ('objeto_id', models.IntegerField(help_text='ID del trámite o del archivo del registro')),
+                ('history_id', models.IntegerField(help_text='history_id original del registro')),
+                ('history_date', models.DateTimeField(help_text='Fecha del registro de historial')),
+                ('history_type', models.CharField(choices=[('+', 'Created'), ('~', 'Changed'), ('-', 'Deleted')], help_text='Tipo de registro: + creación, ~ cambio, - eliminación', max_length=1)),
+                ('history_user_id', models.IntegerField(blank=True, help_text='ID del usuario que hizo el cambio', null=True)),
+                ('history_change_reason', models.CharField(blank=True, help_text='Motivo del cambio', max_length=100, null=True)),
+                ('datos', models.JSONField(encoder=rest_framework.utils.encoders.JSONEncoder, help_text='Campos rastreados del registro (attname: valor)')),
+            ],
+            options={
+                'verbose_name': 'Historial Frío',
+                'verbose_name_plural': 'Historial Frío',
+                'db_table': 'preparacion_historial_frio',
+                'ordering': ['-history_date', '-history_id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='historialfrio',
+            index=models.Index(fields=['entidad', 'objeto_id', 'history_date'], name='idx_frio_objeto_fecha'),
+        ),
+        migrations.AddIndex(
+            model_name='historialfrio',
+            index=models.Index(fields=['tramite_id'], name='idx_frio_tramite'),
+        ),
+        migrations.AddConstraint(
+            model_name='historialfrio',
+            constraint=models.UniqueConstraint(fields=('entidad', 'history_id'), name='uniq_frio_registro'),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 4.2 on 2026-10-16 23:40
+
+from django.db import migrations
+from django.forms.models import model_to_dict
+
+# (modelo histórico, entidad en CambioHistorial, campo con el trámite, campo de referencia)
+HISTORICOS = (
+    ('HistoricalPreparacion', 1, 'id', 'placa'),
+    ('HistoricalPreparacionArchivo', 0, 'tramite_id', 'nombre_original'),
+)
+
+
+def materializar_historial(apps, schema_editor):
+    """
+    Carga inicial de CambioHistorial con el historial existente (el que se
+    escribió antes de la tabla). Igual que `manage.py materializar_historial`,
+    pero con los modelos históricos de la migración: compara cada registro con
+    el anterior del mismo objeto, campo por campo (como diff_against).
+    """
+    CambioHistorial = apps.get_model('preparacion', 'CambioHistorial')
+
+    for nombre, entidad, campo_tramite, campo_referencia in HISTORICOS:
+        historico = apps.get_model('preparacion', nombre)
+        campos = [
+            campo.name for campo in historico._meta.fields
+            if campo.editable and not campo.name.startswith('history_')
+        ]
+
+        cambios = []
+        anterior = None
+        for registro in historico.objects.order_by('id', 'history_date', 'history_id').iterator(chunk_size=2000):
+            valores = model_to_dict(registro, fields=campos)
+            detalle = []
+            if anterior is not None and anterior[0] == registro.id:
+                detalle = [
+                    {"campo": campo, "anterior": anterior[1][campo], "nuevo": valores[campo]}
+                    for campo in sorted(campos) if anterior[1][campo] != valores[campo]
+                ]
+            cambios.append(CambioHistorial(
+                tramite_id=getattr(registro, campo_tramite),
+                entidad=entidad,
+                history_id=registro.history_id,
+                history_date=registro.history_date,
+                history_type=registro.history_type,
+                history_user_id=registro.history_user_id,
+                referencia=(getattr(registro, campo_referencia) or '')[:255],
+                cambios=detalle,
+            ))
+            anterior = (registro.id, valores)
+
+            if len(cambios) >= 1000:
+                CambioHistorial.objects.bulk_create(cambios, ignore_conflicts=True)
+                cambios = []
+        CambioHistorial.objects.bulk_create(cambios, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('preparacion', '0013_historial_frio'),
+    ]
+
+    operations = [
+        migrations.RunPython(materializar_historial, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2 on 2026-10-17 10:12
+
+from django.db import migrations, models
+
+from preparacion.lookups import compactar_busqueda
+
+
+def poblar_placa_busqueda(apps, schema_editor):
+    """Calcula placa_busqueda para los trámites existentes (por lotes)"""
+    Preparacion = apps.get_model('preparacion', 'Preparacion')
+
+    lote = []
+    for tramite in Preparacion.objects.only('id', 'placa').order_by('id').iterator(chunk_size=2000):
+        tramite.placa_busqueda = compactar_busqueda(tramite.placa)
+        lote.append(tramite)
+        if len(lote) >= 2000:
+            Preparacion.objects.bulk_update(lote, ['placa_busqueda'])
+            lote = []
+    if lote:
+        Preparacion.objects.bulk_update(lote, ['placa_busqueda'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('preparacion', '0014_materializar_historial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='preparacion',
+            name='placa_busqueda',
+            field=models.CharField(blank=True, default='', editable=False, help_text='Placa en minúsculas, sin tildes ni separadores (ABC-123 -> abc123)', max_length=10),
+        ),
+        migrations.RunPython(poblar_placa_busqueda, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='preparacion',
+            index=models.Index(fields=['estado_modulo', 'placa_busqueda'], name='idx_prep_modulo_placa'),
+        ),
+    ]
@@ -1,11 +1,20 @@
+import re
+
 from django.db import models
+from django.utils.translation import gettext_lazy as _
+from rest_framework.utils.encoders import JSONEncoder
 from user.models import User
 from departamentos.models import Departamento
 from municipios.models import Municipio
 from simple_history.models import HistoricalRecords
+from preparacion.lookups import BusquedaFullText, compactar_busqueda, normalizar_busqueda
 
 # Create your models here.
 
+# attname de los campos con los que se arma Preparacion.busqueda (ver construir_busqueda)
+CAMPOS_BUSQUEDA = {'placa', 'tipo_vehiculo', 'usuario_id', 'proveedor_id', 'departamento_id', 'municipio_id'}
+
+
 class Preparacion(models.Model):
     """
     Modelo para gestionar trámites en preparación
@@ -160,10 +169,35 @@ class Preparacion(models.Model):
         help_text="Fecha y hora de última actualización"
     )
 
+    # Texto desnormalizado para el buscador (índice FULLTEXT en MySQL)
+    busqueda = models.TextField(
+        blank=True,
+        default='',
+        editable=False,
+        help_text="Placa, tipo de vehículo, usuario, proveedor, departamento y municipio normalizados para búsqueda"
+    )
+
+    # Placa normalizada y sin separadores para buscar por prefijo con el índice B-tree
+    placa_busqueda = models.CharField(
+        max_length=10,
+        blank=True,
+        default='',
+        editable=False,
+        help_text="Placa en minúsculas, sin tildes ni separadores (ABC-123 -> abc123)"
+    )
+
+    # Versión del registro: aumenta en cada guardado (los clientes WebSocket la usan para detectar huecos)
+    version = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        help_text="Número de versión del trámite, aumenta en cada guardado"
+    )
+
     history = HistoricalRecords(
         table_name='history_preparacion',
         verbose_name='Historial de Preparación',
-        related_name='historico'
+        related_name='historico',
+        excluded_fields=['busqueda', 'placa_busqueda', 'version']
     )
 
     class Meta:
@@ -174,16 +208,122 @@ class Preparacion(models.Model):
         indexes = [
             models.Index(fields=['placa'], name='idx_prep_placa'),
             models.Index(fields=['estado'], name='idx_prep_estado'),
-            models.Index(fields=['estado_modulo'], name='idx_prep_estado_modulo'),
             models.Index(fields=['departamento', 'municipio'], name='idx_prep_ubicacion'),
             models.Index(fields=['created_at'], name='idx_prep_fecha'),
             models.Index(fields=['proveedor'], name='idx_prep_proveedor'),
             models.Index(fields=['fecha_recepcion_municipio'], name='idx_prep_fecha_recep'),
+            # Índices compuestos según los listados: todos filtran por estado_modulo y
+            # ordenan por -created_at (InnoDB agrega el id al final, útil para el cursor)
+            models.Index(fields=['estado_modulo', 'created_at'], name='idx_prep_modulo_fecha'),
+            models.Index(fields=['estado_modulo', 'estado', 'created_at'], name='idx_prep_modulo_estado'),
+            models.Index(fields=['estado_modulo', 'proveedor', 'created_at'], name='idx_prep_modulo_prov'),
+            models.Index(fields=['estado_modulo', 'fecha_recepcion_municipio'], name='idx_prep_modulo_recep'),
+            # Búsqueda por prefijo de placa dentro del módulo (LIKE 'abc12%')
+            models.Index(fields=['estado_modulo', 'placa_busqueda'], name='idx_prep_modulo_placa'),
         ]
 
     def __str__(self):
         return f"{self.placa} - {self.get_estado_display()}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # Valores leídos de la base de datos, para saber qué campos cambiaron antes de guardar
+        instancia._valores_cargados = dict(zip(field_names, values))
+        return instancia
+
+    def campos_modificados(self):
+        """
+        Retorna el attname de los campos cuyo valor difiere del leído de la base de datos.
+        Llamar antes de save(); en una instancia nueva retorna un conjunto vacío.
+        """
+        cargados = getattr(self, '_valores_cargados', {})
+        campos = {campo.attname: campo for campo in self._meta.concrete_fields}
+        # to_python normaliza lo que llega del request (p. ej. '5' en una FK) antes de comparar
+        return {
+            attname for attname, valor in cargados.items()
+            if attname not in ('updated_at', 'busqueda', 'placa_busqueda', 'version')
+            and campos[attname].to_python(getattr(self, attname)) != valor
+        }
+
+    def busqueda_desactualizada(self, update_fields=None):
+        """
+        Indica si hay que reconstruir `busqueda`: en una instancia nueva, o si
+        cambió (o no se leyó) alguno de los campos de los que sale. Así una
+        edición de estado no consulta usuario, proveedor, departamento y municipio.
+        """
+        cargados = getattr(self, '_valores_cargados', None)
+        if self._state.adding or cargados is None:
+            return True
+        if update_fields is not None:
+            guardados = {self._meta.get_field(campo).attname for campo in update_fields}
+            if not guardados & CAMPOS_BUSQUEDA:
+                return False
+        return bool(CAMPOS_BUSQUEDA - cargados.keys() or CAMPOS_BUSQUEDA & self.campos_modificados())
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        adicionales = ['version']
+        if self.busqueda_desactualizada(update_fields):
+            self.busqueda = self.construir_busqueda()
+            self.placa_busqueda = compactar_busqueda(self.placa)
+            adicionales += ['busqueda', 'placa_busqueda']
+
+        # Con la fila bloqueada en esta transacción (bloquear_version) la versión se numera
+        # sin releerla; si no, se incrementa en la base de datos para no perder saltos con
+        # guardados concurrentes y se lee solo si alguien accede a ella
+        version_bloqueada = getattr(self, '_version_bloqueada', None)
+        if self._state.adding:
+            self.version = 1
+        elif version_bloqueada is not None:
+            self.version = version_bloqueada + 1
+        else:
+            self.version = models.F('version') + 1
+
+        if update_fields is not None:
+            kwargs['update_fields'] = list(update_fields) + [
+                campo for campo in adicionales if campo not in update_fields
+            ]
+        super().save(*args, **kwargs)
+
+        self._version_bloqueada = None
+        if not isinstance(self.version, int):
+            # Campo diferido: Django lo lee de la base de datos al primer acceso
+            del self.__dict__['version']
+        # Lo guardado pasa a ser el estado "leído" para el siguiente campos_modificados()
+        self._valores_cargados = {
+            campo.attname: campo.to_python(getattr(self, campo.attname))
+            for campo in self._meta.concrete_fields
+            if campo.attname in self.__dict__
+        }
+
+    def bloquear_version(self, version=None):
+        """
+        Indica que la fila del trámite está bloqueada (SELECT ... FOR UPDATE) en la
+        transacción actual con `version` (por defecto la leída con el bloqueo): el
+        siguiente save() guarda version + 1 sin volver a leerla.
+        """
+        self._version_bloqueada = self.version if version is None else version
+
+    def construir_busqueda(self):
+        """
+        Construye el texto de la columna `busqueda` a partir del trámite y sus relaciones.
+        La placa se agrega también separada en letras y números (ABC123 -> abc 123)
+        para poder buscar por cualquiera de las dos partes.
+        """
+        placa = normalizar_busqueda(self.placa)
+        partes = [
+            placa,
+            ' '.join(re.findall(r'[a-z]+|[0-9]+', placa)),
+            self.tipo_vehiculo,
+            self.usuario.username if self.usuario_id else '',
+            self.proveedor.codigo_encargado if self.proveedor_id else '',
+            self.proveedor.nombre if self.proveedor_id else '',
+            self.departamento.departamento if self.departamento_id else '',
+            self.municipio.municipio if self.municipio_id else '',
+        ]
+        return normalizar_busqueda(' '.join(parte for parte in partes if parte))
+
     @property
     def documentos_completos(self):
         """Retorna True si todos los documentos están completados"""
@@ -223,6 +363,9 @@ class Preparacion(models.Model):
         return self.proveedor.codigo_encargado if self.proveedor else None
 
 
+Preparacion._meta.get_field('busqueda').register_lookup(BusquedaFullText)
+
+
 class PreparacionArchivo(models.Model):
     """
     Modelo para gestionar archivos asociados a un trámite de preparación
@@ -270,8 +413,217 @@ class PreparacionArchivo(models.Model):
         verbose_name_plural = "Archivos de Trámites"
         ordering = ["-created_at"]
         indexes = [
-            models.Index(fields=['tramite'], name='idx_prep_arch_tramite'),
+            # (tramite, created_at): carga por lotes de archivos de una página sin filesort
+            models.Index(fields=['tramite', 'created_at'], name='idx_prep_arch_tramite_fecha'),
         ]
 
     def __str__(self):
         return f"{self.nombre_original} - {self.tramite.placa}"
+
+
+class ResumenModulo(models.Model):
+    """
+    Conteo de trámites por módulo, estado y estado_tracker.
+
+    Se mantiene de forma incremental (en la misma transacción) desde las vistas
+    que crean, actualizan, eliminan o mueven trámites entre módulos, para que el
+    endpoint de estadísticas no tenga que hacer COUNT(*) ... GROUP BY.
+    """
+
+    estado_modulo = models.IntegerField(
+        help_text="Estado del módulo: 1-En preparación, 2-En Tracker, 3-En Finalizados, 0-Archivados"
+    )
+
+    estado = models.CharField(
+        max_length=20,
+        help_text="Estado del trámite"
+    )
+
+    estado_tracker = models.CharField(
+        max_length=20,
+        help_text="Estado del trámite en módulo Tracker"
+    )
+
+    total = models.IntegerField(
+        default=0,
+        help_text="Cantidad de trámites con esta combinación"
+    )
+
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        help_text="Fecha y hora de última actualización"
+    )
+
+    class Meta:
+        db_table = "preparacion_resumen"
+        verbose_name = "Resumen de Módulo"
+        verbose_name_plural = "Resumen de Módulos"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['estado_modulo', 'estado', 'estado_tracker'],
+                name='uniq_resumen_clave'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.estado_modulo} - {self.estado} / {self.estado_tracker}: {self.total}"
+
+
+class CambioHistorial(models.Model):
+    """
+    Cambios por campo de cada registro de historial del trámite y de sus archivos.
+
+    Se calculan una sola vez, al crearse el registro histórico (señal
+    post_create_historical_record, ver preparacion/historial.py), en lugar de
+    ejecutar diff_against cada vez que se abre la trazabilidad. Los endpoints de
+    historial leen esta tabla por (tramite_id, history_date). Para el historial
+    anterior a la tabla: `manage.py materializar_historial`.
+    """
+
+    ENTIDAD_ARCHIVO = 0
+    ENTIDAD_TRAMITE = 1
+    ENTIDAD_CHOICES = [
+        (ENTIDAD_ARCHIVO, 'Archivo'),
+        (ENTIDAD_TRAMITE, 'Trámite'),
+    ]
+
+    # Los mismos de simple_history, para que get_history_type_display coincida
+    TIPO_CHOICES = [
+        ('+', _('Created')),
+        ('~', _('Changed')),
+        ('-', _('Deleted')),
+    ]
+
+    tramite_id = models.IntegerField(
+        help_text="Trámite al que pertenece el registro (el propio o el del archivo)"
+    )
+
+    entidad = models.PositiveSmallIntegerField(
+        choices=ENTIDAD_CHOICES,
+        help_text="Tabla de historial de origen: 1-Trámite, 0-Archivo"
+    )
+
+    history_id = models.IntegerField(
+        help_text="history_id del registro en su tabla de historial"
+    )
+
+    history_date = models.DateTimeField(
+        help_text="Fecha del registro de historial"
+    )
+
+    history_type = models.CharField(
+        max_length=1,
+        choices=TIPO_CHOICES,
+        help_text="Tipo de registro: + creación, ~ cambio, - eliminación"
+    )
+
+    history_user = models.ForeignKey(
+        User,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='+',
+        null=True,
+        blank=True,
+        help_text="Usuario que hizo el cambio"
+    )
+
+    referencia = models.CharField(
+        max_length=255,
+        help_text="Placa del trámite o nombre original del archivo en ese registro"
+    )
+
+    # Serializados como los devuelve la API (fechas en ISO 8601, FKs como ID)
+    cambios = models.JSONField(
+        default=list,
+        encoder=JSONEncoder,
+        help_text="Lista de {campo, anterior, nuevo} respecto al registro anterior del mismo objeto"
+    )
+
+    class Meta:
+        db_table = "preparacion_historial_cambios"
+        verbose_name = "Cambio de Historial"
+        verbose_name_plural = "Cambios de Historial"
+        ordering = ["-history_date", "-entidad", "-history_id"]
+        constraints = [
+            models.UniqueConstraint(fields=['entidad', 'history_id'], name='uniq_cambio_registro'),
+        ]
+        indexes = [
+            # Trazabilidad de un trámite, paginada por (history_date, entidad, history_id)
+            models.Index(fields=['tramite_id', 'history_date', 'entidad', 'history_id'], name='idx_cambio_tramite_fecha'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_entidad_display()} {self.history_id} ({self.history_type})"
+
+
+class HistorialFrio(models.Model):
+    """
+    Registros de historial (trámite y archivos) de trámites archivados hace
+    tiempo, movidos fuera de history_preparacion y history_preparacion_archivos
+    por la retención (preparacion/retencion.py).
+
+    Los endpoints de historial no la leen (usan CambioHistorial); se conserva
+    la copia completa de cada registro para auditoría y para calcular el
+    cambio si el trámite vuelve a editarse.
+    """
+
+    tramite_id = models.IntegerField(
+        help_text="Trámite al que pertenece el registro"
+    )
+
+    entidad = models.PositiveSmallIntegerField(
+        choices=CambioHistorial.ENTIDAD_CHOICES,
+        help_text="Tabla de historial de origen: 1-Trámite, 0-Archivo"
+    )
+
+    objeto_id = models.IntegerField(
+        help_text="ID del trámite o del archivo del registro"
+    )
+
+    history_id = models.IntegerField(
+        help_text="history_id original del registro"
+    )
+
+    history_date = models.DateTimeField(
+        help_text="Fecha del registro de historial"
+    )
+
+    history_type = models.CharField(
+        max_length=1,
+        choices=CambioHistorial.TIPO_CHOICES,
+        help_text="Tipo de registro: + creación, ~ cambio, - eliminación"
+    )
+
+    history_user_id = models.IntegerField(
+        null=True,
+        blank=True,
+        help_text="ID del usuario que hizo el cambio"
+    )
+
+    history_change_reason = models.CharField(
+        max_length=100,
+        null=True,
+        blank=True,
+        help_text="Motivo del cambio"
+    )
+
+    datos = models.JSONField(
+        encoder=JSONEncoder,
+        help_text="Campos rastreados del registro (attname: valor)"
+    )
+
+    class Meta:
+        db_table = "preparacion_historial_frio"
+        verbose_name = "Historial Frío"
+        verbose_name_plural = "Historial Frío"
+        ordering = ["-history_date", "-history_id"]
+        constraints = [
+            models.UniqueConstraint(fields=['entidad', 'history_id'], name='uniq_frio_registro'),
+        ]
+        indexes = [
+            models.Index(fields=['entidad', 'objeto_id', 'history_date'], name='idx_frio_objeto_fecha'),
+            models.Index(fields=['tramite_id'], name='idx_frio_tramite'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_entidad_display()} {self.history_id} ({self.history_type})"
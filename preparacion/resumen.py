@@ -0,0 +1,115 @@
+# preparacion/resumen.py
+"""
+Mantenimiento incremental de la tabla ResumenModulo.
+
+Cada vista que crea, actualiza, elimina o cambia de módulo un trámite llama a
+estas funciones dentro de su transacción, así los conteos por módulo y estado
+quedan consistentes con los trámites y leerlos es O(1).
+"""
+from django.db.models import Count, F
+
+from preparacion.models import Preparacion, ResumenModulo
+
+
+def clave_resumen(tramite):
+    """Retorna la clave (estado_modulo, estado, estado_tracker) de un trámite"""
+    return (tramite.estado_modulo, tramite.estado, tramite.estado_tracker)
+
+
+def bloquear_clave(tramite):
+    """
+    Lee (con SELECT ... FOR UPDATE) la clave actual del trámite en base de datos.
+    Se usa antes de guardar/eliminar para que dos peticiones concurrentes sobre el
+    mismo trámite no descuenten dos veces la misma clave. Requiere transacción.
+
+    La misma lectura trae la versión bloqueada, así save() no tiene que releerla.
+    """
+    estado_modulo, estado, estado_tracker, version = Preparacion.objects.select_for_update().filter(
+        pk=tramite.pk
+    ).values_list('estado_modulo', 'estado', 'estado_tracker', 'version').get()
+    tramite.bloquear_version(version)
+    return (estado_modulo, estado, estado_tracker)
+
+
+def ajustar_resumen(clave, delta):
+    """
+    Suma `delta` al contador de la clave con un UPDATE atómico (total = total + delta).
+    Si la fila aún no existe se crea.
+    """
+    estado_modulo, estado, estado_tracker = clave
+    filtro = {
+        'estado_modulo': estado_modulo,
+        'estado': estado,
+        'estado_tracker': estado_tracker,
+    }
+
+    actualizados = ResumenModulo.objects.filter(**filtro).update(total=F('total') + delta)
+    if not actualizados:
+        ResumenModulo.objects.get_or_create(**filtro)
+        ResumenModulo.objects.filter(**filtro).update(total=F('total') + delta)
+
+
+def registrar_alta(tramite):
+    """Cuenta un trámite recién creado"""
+    ajustar_resumen(clave_resumen(tramite), 1)
+
+
+def registrar_baja(clave):
+    """Descuenta un trámite eliminado (usar la clave tomada antes de eliminarlo)"""
+    ajustar_resumen(clave, -1)
+
+
+def registrar_cambio(clave_anterior, tramite):
+    """Mueve el conteo si cambió el módulo, el estado o el estado_tracker del trámite"""
+    clave_nueva = clave_resumen(tramite)
+    if clave_anterior != clave_nueva:
+        ajustar_resumen(clave_anterior, -1)
+        ajustar_resumen(clave_nueva, 1)
+
+
+def obtener_resumen(estado_modulo):
+    """
+    Conteos de un módulo a partir de la tabla de resumen.
+
+    Returns:
+        dict: total, por_estado y por_estado_tracker del módulo
+    """
+    por_estado = {}
+    por_estado_tracker = {}
+    total = 0
+
+    filas = ResumenModulo.objects.filter(estado_modulo=estado_modulo, total__gt=0).values_list(
+        'estado', 'estado_tracker', 'total'
+    )
+    for estado, estado_tracker, cantidad in filas:
+        total += cantidad
+        por_estado[estado] = por_estado.get(estado, 0) + cantidad
+        por_estado_tracker[estado_tracker] = por_estado_tracker.get(estado_tracker, 0) + cantidad
+
+    return {
+        'estado_modulo': estado_modulo,
+        'total': total,
+        'por_estado': por_estado,
+        'por_estado_tracker': por_estado_tracker,
+    }
+
+
+def recalcular_resumen():
+    """
+    Reconstruye la tabla de resumen desde cero con un COUNT ... GROUP BY.
+    Solo para la carga inicial o para reparar después de cargas masivas.
+    """
+    conteos = Preparacion.objects.values('estado_modulo', 'estado', 'estado_tracker').annotate(
+        cantidad=Count('id')
+    ).order_by()
+
+    ResumenModulo.objects.all().delete()
+    ResumenModulo.objects.bulk_create([
+        ResumenModulo(
+            estado_modulo=fila['estado_modulo'],
+            estado=fila['estado'],
+            estado_tracker=fila['estado_tracker'],
+            total=fila['cantidad'],
+        )
+        for fila in conteos
+    ])
@@ -0,0 +1,167 @@
+# preparacion/retencion.py
+"""
+Retención del historial de trámites y archivos (settings.HISTORIAL).
+
+simple_history guarda una copia completa de la fila (con lista_documentos) en
+cada guardado, incluidas las transiciones entre módulos, así que las tablas de
+historial crecen sin límite. Este proceso (manage.py compactar_historial) las
+acota en dos pasos:
+
+1. Compactación: de los registros anteriores a DIAS_COMPACTAR se conservan
+   completos solo la creación y el último de cada período de DIAS_SNAPSHOT
+   días (snapshots); los intermedios se borran. La regla depende solo de las
+   fechas, así que repetir el proceso no borra más snapshots. El último
+   registro de cada objeto nunca se borra (simple_history lo usa como
+   anterior del siguiente cambio).
+2. Tabla fría: el historial de los trámites archivados (estado_modulo=0) sin
+   cambios en MESES_TABLA_FRIA meses se mueve completo a HistorialFrio.
+
+Antes de borrar un registro se asegura su CambioHistorial (el cambio respecto
+al registro anterior real), que es lo que leen los endpoints de historial:
+la trazabilidad que devuelven no cambia.
+"""
+from datetime import timedelta
+from itertools import groupby
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from preparacion.historial import ENTIDADES, HistoricoArchivo, HistoricoPreparacion, construir_cambio
+from preparacion.models import CambioHistorial, HistorialFrio, Preparacion
+
+
+def get_config(clave, defecto):
+    """Lee una opción de settings.HISTORIAL"""
+    return getattr(settings, 'HISTORIAL', {}).get(clave, defecto)
+
+
+def asegurar_cambios(registros):
+    """
+    Crea el CambioHistorial de los registros que aún no lo tienen.
+
+    Args:
+        registros (list): Registros de una tabla de historial ordenados por
+            (id, history_date, history_id), con todos los anteriores de cada objeto
+    """
+    if not registros:
+        return
+    entidad = ENTIDADES[type(registros[0])][0]
+    existentes = set(CambioHistorial.objects.filter(
+        entidad=entidad, history_id__in=[registro.history_id for registro in registros]
+    ).values_list('history_id', flat=True))
+
+    faltantes = []
+    for _, del_objeto in groupby(registros, key=lambda registro: registro.id):
+        anterior = None
+        for registro in del_objeto:
+            if registro.history_id not in existentes:
+                faltantes.append(construir_cambio(registro, anterior))
+            anterior = registro
+    CambioHistorial.objects.bulk_create(faltantes, batch_size=1000, ignore_conflicts=True)
+
+
+def registros_a_borrar(registros, dias_snapshot):
+    """
+    history_id de los registros compactables de un objeto (ya filtrados por
+    fecha de corte y ordenados): todos menos la creación y el último de cada período.
+    """
+    periodo = dias_snapshot * 86400
+    conservar = {registros[0].history_id}
+    for _, del_periodo in groupby(registros, key=lambda registro: int(registro.history_date.timestamp() // periodo)):
+        conservar.add(list(del_periodo)[-1].history_id)
+    return [registro.history_id for registro in registros if registro.history_id not in conservar]
+
+
+def compactar(historico, dias=None, dias_snapshot=None, lote=None, salida=None):
+    """
+    Compacta una tabla de historial (HistoricoPreparacion o HistoricoArchivo).
+
+    Returns:
+        int: Registros borrados
+    """
+    dias = dias if dias is not None else get_config('DIAS_COMPACTAR', 90)
+    dias_snapshot = dias_snapshot or get_config('DIAS_SNAPSHOT', 30)
+    lote = lote or get_config('LOTE', 500)
+
+    # Los registros anteriores al corte son un prefijo del historial de cada objeto
+    antiguos = historico.objects.filter(history_date__lt=timezone.now() - timedelta(days=dias))
+    primero = antiguos.order_by('id').values_list('id', flat=True).first()
+    ultimo = antiguos.order_by('-id').values_list('id', flat=True).first()
+    if primero is None:
+        return 0
+
+    borrados = 0
+    for inicio in range(primero, ultimo + 1, lote):
+        with transaction.atomic():
+            registros = list(antiguos.filter(id__gte=inicio, id__lt=inicio + lote).order_by(
+                'id', 'history_date', 'history_id'
+            ))
+            asegurar_cambios(registros)
+
+            # El último registro antiguo de cada objeto es el último de su período: siempre queda
+            ids = []
+            for _, del_objeto in groupby(registros, key=lambda registro: registro.id):
+                ids.extend(registros_a_borrar(list(del_objeto), dias_snapshot))
+            if ids:
+                historico.objects.filter(history_id__in=ids).delete()
+            borrados += len(ids)
+        if salida and ids:
+            salida(f'{historico._meta.db_table}: hasta ID {min(inicio + lote, ultimo + 1) - 1} ({borrados} borrados)')
+    return borrados
+
+
+def a_frio(registro):
+    """HistorialFrio (sin guardar) con la copia completa de un registro histórico"""
+    entidad, tramite_de, _ = ENTIDADES[type(registro)]
+    return HistorialFrio(
+        tramite_id=tramite_de(registro),
+        entidad=entidad,
+        objeto_id=registro.id,
+        history_id=registro.history_id,
+        history_date=registro.history_date,
+        history_type=registro.history_type,
+        history_user_id=registro.history_user_id,
+        history_change_reason=registro.history_change_reason,
+        datos={campo.attname: getattr(registro, campo.attname) for campo in registro.tracked_fields},
+    )
+
+
+def mover_a_frio(meses=None, lote=None, salida=None):
+    """
+    Mueve a HistorialFrio el historial (trámite y archivos) de los trámites
+    archivados cuya última modificación es anterior a `meses` meses.
+
+    Returns:
+        int: Registros movidos
+    """
+    meses = meses if meses is not None else get_config('MESES_TABLA_FRIA', 12)
+    lote = lote or get_config('LOTE', 500)
+    corte = timezone.now() - timedelta(days=30 * meses)
+    archivados = Preparacion.objects.filter(estado_modulo=0, updated_at__lt=corte).order_by('id')
+
+    movidos = 0
+    ultimo_id = 0
+    while True:
+        tramites = list(archivados.filter(id__gt=ultimo_id).values_list('id', flat=True)[:lote])
+        if not tramites:
+            return movidos
+        ultimo_id = tramites[-1]
+
+        with transaction.atomic():
+            for historico, filtro in (
+                (HistoricoPreparacion, {'id__in': tramites}),
+                (HistoricoArchivo, {'tramite_id__in': tramites}),
+            ):
+                registros = list(historico.objects.filter(**filtro).order_by('id', 'history_date', 'history_id'))
+                if not registros:
+                    continue
+                asegurar_cambios(registros)
+                HistorialFrio.objects.bulk_create(
+                    [a_frio(registro) for registro in registros], batch_size=1000, ignore_conflicts=True
+                )
+                historico.objects.filter(history_id__in=[registro.history_id for registro in registros]).delete()
+                movidos += len(registros)
+
+        if salida:
+            salida(f'Tabla fría: hasta el trámite {ultimo_id} ({movidos} registros movidos)')
@@ -0,0 +1,382 @@
+# preparacion/semillas.py
+"""
+Generación de datos de prueba a escala (benchmarks y experimentos de índices).
+
+Todo es determinista a partir de `semilla`: dos cargas con los mismos
+parámetros sobre una base vacía producen los mismos registros (las fechas son
+relativas al momento de la carga).
+
+Las filas se insertan con `bulk_create` por lotes y con IDs explícitos (en
+MySQL bulk_create no devuelve los IDs autoincrementales), así que `save()` no
+se ejecuta: `busqueda`, `placa_busqueda`, `version` y el historial se calculan
+aquí, y al final se reconstruye la tabla de resumen y se materializan los
+cambios del historial.
+"""
+import copy
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from departamentos.models import Departamento
+from municipios.models import Municipio
+from preparacion.historial import HistoricoArchivo, HistoricoPreparacion, materializar_historial
+from preparacion.lookups import compactar_busqueda
+from preparacion.models import Preparacion, PreparacionArchivo
+from preparacion.resumen import recalcular_resumen
+from proveedores.models import Proveedor
+from user.models import User
+
+# Departamentos de Colombia: (código DANE, nombre, municipio principal, cantidad de municipios).
+# No es el catálogo DANE de municipios: solo los departamentos, su municipio
+# principal y las cantidades son reales (ver sembrar_catalogo).
+DEPARTAMENTOS = [
+    (5, 'Antioquia', 'Medellín', 125),
+    (8, 'Atlántico', 'Barranquilla', 23),
+    (11, 'Bogotá D.C.', 'Bogotá', 1),
+    (13, 'Bolívar', 'Cartagena de Indias', 46),
+    (15, 'Boyacá', 'Tunja', 123),
+    (17, 'Caldas', 'Manizales', 27),
+    (18, 'Caquetá', 'Florencia', 16),
+    (19, 'Cauca', 'Popayán', 42),
+    (20, 'Cesar', 'Valledupar', 25),
+    (23, 'Córdoba', 'Montería', 30),
+    (25, 'Cundinamarca', 'Zipaquirá', 116),
+    (27, 'Chocó', 'Quibdó', 30),
+    (41, 'Huila', 'Neiva', 37),
+    (44, 'La Guajira', 'Riohacha', 15),
+    (47, 'Magdalena', 'Santa Marta', 30),
+    (50, 'Meta', 'Villavicencio', 29),
+    (52, 'Nariño', 'Pasto', 64),
+    (54, 'Norte de Santander', 'Cúcuta', 40),
+    (63, 'Quindío', 'Armenia', 12),
+    (66, 'Risaralda', 'Pereira', 14),
+    (68, 'Santander', 'Bucaramanga', 87),
+    (70, 'Sucre', 'Sincelejo', 26),
+    (73, 'Tolima', 'Ibagué', 47),
+    (76, 'Valle del Cauca', 'Cali', 42),
+    (81, 'Arauca', 'Arauca', 7),
+    (85, 'Casanare', 'Yopal', 19),
+    (86, 'Putumayo', 'Mocoa', 13),
+    (88, 'San Andrés, Providencia y Santa Catalina', 'San Andrés', 2),
+    (91, 'Amazonas', 'Leticia', 2),
+    (94, 'Guainía', 'Inírida', 1),
+    (95, 'Guaviare', 'San José del Guaviare', 4),
+    (97, 'Vaupés', 'Mitú', 3),
+    (99, 'Vichada', 'Puerto Carreño', 4),
+]
+
+# Distribución de trámites por módulo (estado_modulo: peso)
+PESOS_MODULO = {1: 30, 2: 30, 3: 25, 0: 15}
+
+# Módulos por los que pasa un trámite hasta llegar a su módulo actual
+RECORRIDO_MODULOS = {1: [1], 2: [1, 2], 3: [1, 2, 3], 0: [1, 2, 3, 0]}
+
+DOCUMENTOS = ['Cédula', 'SOAT', 'Revisión técnico-mecánica', 'Factura', 'Formulario de solicitud']
+
+TIPOS_ARCHIVO = [
+    ('application/pdf', 'pdf'),
+    ('image/png', 'png'),
+    ('image/jpeg', 'jpg'),
+]
+
+
+def sembrar_catalogo():
+    """
+    Crea los departamentos y municipios que falten.
+
+    Cada departamento recibe su cantidad real de municipios; el primero lleva
+    el nombre del municipio principal y el resto un nombre sintético
+    (`<Departamento> (sintético 002)`): reproduce el volumen y la distribución
+    por departamento que usan las consultas, no los nombres del DANE. Para
+    datos reales se carga antes el catálogo oficial; los departamentos que ya
+    tienen municipios no se tocan.
+    """
+    Departamento.objects.bulk_create(
+        [Departamento(id_departamento=codigo, departamento=nombre) for codigo, nombre, _, _ in DEPARTAMENTOS],
+        ignore_conflicts=True
+    )
+    con_municipios = set(Municipio.objects.values_list('departamento_id', flat=True).distinct())
+    existentes = set(Departamento.objects.values_list('id_departamento', flat=True))
+
+    municipios = []
+    for codigo, nombre, principal, cantidad in DEPARTAMENTOS:
+        if codigo in con_municipios or codigo not in existentes:
+            continue
+        municipios.append(Municipio(municipio=principal, departamento_id=codigo))
+        municipios.extend(
+            Municipio(municipio=f'{nombre} (sintético {numero:03d})', departamento_id=codigo)
+            for numero in range(2, cantidad + 1)
+        )
+    Municipio.objects.bulk_create(municipios, batch_size=1000)
+
+
+def asegurar_proveedores(cantidad, rnd):
+    """Crea proveedores de prueba hasta tener `cantidad`"""
+    faltan = cantidad - Proveedor.objects.count()
+    if faltan <= 0:
+        return
+    inicio = Proveedor.objects.count() + 1
+    Proveedor.objects.bulk_create([
+        Proveedor(
+            codigo_encargado=f'SEM-{numero:04d}',
+            nombre=f'Proveedor {numero:04d}',
+            whatsapp=f'300{rnd.randint(1000000, 9999999)}',
+        )
+        for numero in range(inicio, inicio + faltan)
+    ])
+
+
+def asegurar_usuarios(cantidad):
+    """Crea usuarios de prueba hasta tener `cantidad`"""
+    faltan = cantidad - User.objects.count()
+    if faltan <= 0:
+        return
+    inicio = User.objects.count() + 1
+    User.objects.bulk_create([
+        User(username=f'semilla{numero:03d}', first_name='Semilla', last_name=f'{numero:03d}')
+        for numero in range(inicio, inicio + faltan)
+    ])
+
+
+@contextmanager
+def sin_fechas_automaticas(*modelos):
+    """Desactiva auto_now/auto_now_add para conservar las fechas generadas en bulk_create"""
+    originales = []
+    for modelo in modelos:
+        for campo in modelo._meta.concrete_fields:
+            if getattr(campo, 'auto_now', False) or getattr(campo, 'auto_now_add', False):
+                originales.append((campo, campo.auto_now, campo.auto_now_add))
+                campo.auto_now = campo.auto_now_add = False
+    try:
+        yield
+    finally:
+        for campo, auto_now, auto_now_add in originales:
+            campo.auto_now, campo.auto_now_add = auto_now, auto_now_add
+
+
+def generar_placa(rnd, tipo_vehiculo):
+    letras = ''.join(rnd.choice('ABCDEFGHIJKLMNOPQRSTUVWXYZ') for _ in range(3))
+    if tipo_vehiculo == 'Motocicleta':
+        return f'{letras}{rnd.randint(10, 99)}{rnd.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ")}'
+    return f'{letras}{rnd.randint(100, 999)}'
+
+
+def aplicar_modulo(tramite, estado_modulo, rnd, proveedores, ahora):
+    """Estado, estado_tracker, proveedor y fecha de recepción coherentes con el módulo"""
+    tramite.estado_modulo = estado_modulo
+    if estado_modulo == 1:
+        tramite.estado = rnd.choice(['en_verificacion', 'para_radicacion', 'en_novedad'])
+        tramite.estado_tracker = 'sin_tracker'
+        return
+    tramite.proveedor = rnd.choice(proveedores)
+    tramite.fecha_recepcion_municipio = (ahora - timedelta(days=rnd.randint(0, 120))).date()
+    if estado_modulo == 2:
+        tramite.estado = 'para_radicacion'
+        tramite.estado_tracker = rnd.choice(['en_radicacion', 'con_novedad'])
+        tramite.estado_detalle = rnd.choice(['', 'Radicado en ventanilla', 'Falta firma del propietario'])
+    else:
+        tramite.estado = 'finalizado'
+        tramite.estado_tracker = 'finalizado'
+
+
+def registro_historico(historico, objeto, fecha, tipo, usuario_id):
+    """Fila del modelo de simple_history `historico` para `objeto` (copia de los campos rastreados)"""
+    return historico(
+        **{campo.attname: getattr(objeto, campo.attname) for campo in historico.tracked_fields},
+        history_date=fecha,
+        history_type=tipo,
+        history_user_id=usuario_id,
+        history_relation_id=objeto.pk,
+    )
+
+
+def editar(estado, rnd):
+    """Una edición típica del módulo en que está el trámite (sobre la copia `estado`)"""
+    if estado.estado_modulo == 1:
+        if rnd.random() < 0.5:
+            estado.estado = rnd.choice(['en_verificacion', 'para_radicacion', 'en_novedad'])
+        else:
+            estado.lista_documentos = [
+                {**documento, 'completado': rnd.random() < 0.7} for documento in estado.lista_documentos
+            ]
+    elif estado.estado_modulo == 2:
+        estado.estado_tracker = rnd.choice(['en_radicacion', 'con_novedad'])
+        estado.estado_detalle = rnd.choice(['Radicado en ventanilla', 'Falta firma del propietario', 'En revisión'])
+    else:
+        estado.estado_detalle = rnd.choice(['Entregado al cliente', 'Documentos devueltos', ''])
+
+
+def mover_a_modulo(estado, estado_modulo, tramite):
+    """Transición al módulo siguiente, con los valores que deja la vista correspondiente"""
+    estado.estado_modulo = estado_modulo
+    if estado_modulo == 2:
+        estado.estado_tracker = 'en_radicacion'
+        estado.proveedor_id = tramite.proveedor_id
+        estado.fecha_recepcion_municipio = tramite.fecha_recepcion_municipio
+    elif estado_modulo == 3:
+        estado.estado = 'finalizado'
+        estado.estado_tracker = 'finalizado'
+
+
+def historial_tramite(tramite, profundidad, rnd, usuarios):
+    """
+    Filas de historial de un trámite: la creación en Preparación, las
+    transiciones hasta su módulo actual y ediciones intermedias hasta sumar
+    `profundidad` filas. La última fila es el estado final del trámite y las
+    fechas quedan entre created_at y updated_at.
+    """
+    recorrido = RECORRIDO_MODULOS[tramite.estado_modulo]
+    if profundidad < len(recorrido):
+        # No alcanzan las filas para todo el recorrido: se conservan los últimos módulos
+        recorrido = recorrido[len(recorrido) - profundidad:]
+
+    # Pasos después de la creación: None = edición, n = transición al módulo n
+    transiciones = iter(recorrido[1:])
+    pasos = []
+    ediciones = profundidad - len(recorrido)
+    for siguiente in recorrido[1:] + [None]:
+        # Las ediciones se reparten entre los módulos del recorrido
+        cantidad = ediciones if siguiente is None else rnd.randint(0, ediciones)
+        pasos.extend([None] * cantidad)
+        ediciones -= cantidad
+        if siguiente is not None:
+            pasos.append(next(transiciones))
+
+    inicio = tramite.created_at
+    intervalo = (tramite.updated_at - inicio).total_seconds()
+    fechas = sorted(inicio + timedelta(seconds=rnd.uniform(0, intervalo)) for _ in pasos[:-1])
+    if pasos:
+        fechas.append(tramite.updated_at)
+
+    estado = copy.copy(tramite)
+    estado.estado_modulo = recorrido[0]
+    if recorrido[0] == 1:
+        estado.estado = 'en_verificacion'
+        estado.estado_tracker = 'sin_tracker'
+        estado.estado_detalle = None
+        estado.proveedor_id = None
+        estado.fecha_recepcion_municipio = None
+        estado.lista_documentos = [{**documento, 'completado': False} for documento in tramite.lista_documentos]
+    estado.updated_at = inicio
+
+    filas = [registro_historico(HistoricoPreparacion, estado, inicio, '+', tramite.usuario_id)]
+    for numero, (paso, fecha) in enumerate(zip(pasos, fechas)):
+        estado = copy.copy(estado)
+        if numero == len(pasos) - 1:
+            estado = copy.copy(tramite)
+        elif paso is None:
+            editar(estado, rnd)
+        else:
+            mover_a_modulo(estado, paso, tramite)
+        estado.updated_at = fecha
+        filas.append(registro_historico(HistoricoPreparacion, estado, fecha, '~', rnd.choice(usuarios).id))
+    return filas
+
+
+def sembrar_tramites(total, archivos_por=3, profundidad_historial=1, semilla=42, tamano_lote=5000, salida=None):
+    """
+    Inserta `total` trámites repartidos entre los cuatro módulos, con
+    `archivos_por` archivos cada uno y `profundidad_historial` filas de
+    historial por trámite (la creación y sus cambios posteriores).
+
+    Args:
+        total (int): Trámites a crear
+        archivos_por (int): Archivos por trámite
+        profundidad_historial (int): Filas de historial por trámite (mínimo 1)
+        semilla (int): Semilla del generador aleatorio
+        tamano_lote (int): Trámites por lote de bulk_create
+        salida (callable, optional): Función para informar el avance
+
+    Returns:
+        int: ID del primer trámite creado
+    """
+    rnd = random.Random(semilla)
+    sembrar_catalogo()
+    asegurar_proveedores(50, rnd)
+    asegurar_usuarios(20)
+
+    departamentos = {d.id_departamento: d for d in Departamento.objects.all()}
+    municipios = list(Municipio.objects.order_by('pk'))
+    for municipio in municipios:
+        municipio.departamento = departamentos[municipio.departamento_id]
+    proveedores = list(Proveedor.objects.order_by('pk'))
+    usuarios = list(User.objects.order_by('pk'))
+    modulos = list(PESOS_MODULO)
+    pesos = list(PESOS_MODULO.values())
+    tipos_vehiculo = [valor for valor, _ in Preparacion.TIPO_VEHICULO_CHOICES]
+
+    ahora = timezone.now()
+    primer_id = (Preparacion.objects.aggregate(maximo=Max('id'))['maximo'] or 0) + 1
+    siguiente_archivo = (PreparacionArchivo.objects.aggregate(maximo=Max('id'))['maximo'] or 0) + 1
+    primer_archivo = siguiente_archivo
+
+    with sin_fechas_automaticas(Preparacion, PreparacionArchivo):
+        for inicio in range(0, total, tamano_lote):
+            tramites, archivos, historial, historial_archivos = [], [], [], []
+
+            for tramite_id in range(primer_id + inicio, primer_id + min(inicio + tamano_lote, total)):
+                municipio = rnd.choice(municipios)
+                usuario = rnd.choice(usuarios)
+                tipo_vehiculo = rnd.choice(tipos_vehiculo)
+                creado = ahora - timedelta(minutes=rnd.randint(0, 2 * 365 * 24 * 60))
+                actualizado = creado
+                if profundidad_historial > 1:
+                    actualizado = creado + (ahora - creado) * rnd.random()
+
+                tramite = Preparacion(
+                    id=tramite_id,
+                    usuario=usuario,
+                    placa=generar_placa(rnd, tipo_vehiculo),
+                    tipo_vehiculo=tipo_vehiculo,
+                    departamento=municipio.departamento,
+                    municipio=municipio,
+                    paquete=f'paquete_{tramite_id}',
+                    lista_documentos=[
+                        {'nombre': nombre, 'completado': rnd.random() < 0.7} for nombre in DOCUMENTOS
+                    ],
+                    created_at=creado,
+                    updated_at=actualizado,
+                    version=profundidad_historial,
+                )
+                aplicar_modulo(tramite, rnd.choices(modulos, pesos)[0], rnd, proveedores, ahora)
+                tramite.busqueda = tramite.construir_busqueda()
+                tramite.placa_busqueda = compactar_busqueda(tramite.placa)
+                tramites.append(tramite)
+                historial.extend(historial_tramite(tramite, profundidad_historial, rnd, usuarios))
+
+                for numero in range(archivos_por):
+                    tipo, extension = rnd.choice(TIPOS_ARCHIVO)
+                    subido = creado + timedelta(minutes=numero)
+                    archivo = PreparacionArchivo(
+                        id=siguiente_archivo,
+                        tramite_id=tramite_id,
+                        archivo=f'preparacion/{subido:%Y/%m/%d}/doc_{siguiente_archivo}.{extension}',
+                        nombre_original=f'documento_{numero + 1}.{extension}',
+                        tipo_archivo=tipo,
+                        tamaño=rnd.randint(20_000, 3_000_000),
+                        created_at=subido,
+                    )
+                    siguiente_archivo += 1
+                    archivos.append(archivo)
+                    historial_archivos.append(registro_historico(HistoricoArchivo, archivo, subido, '+', usuario.id))
+
+            with transaction.atomic():
+                Preparacion.objects.bulk_create(tramites, batch_size=1000)
+                PreparacionArchivo.objects.bulk_create(archivos, batch_size=2000)
+                HistoricoPreparacion.objects.bulk_create(historial, batch_size=1000)
+                HistoricoArchivo.objects.bulk_create(historial_archivos, batch_size=2000)
+
+            if salida:
+                salida(f'{min(inicio + tamano_lote, total)}/{total} trámites')
+
+    with transaction.atomic():
+        recalcular_resumen()
+
+    # bulk_create no dispara la señal de simple_history
+    materializar_historial(HistoricoPreparacion, desde=primer_id, salida=salida)
+    materializar_historial(HistoricoArchivo, desde=primer_archivo, salida=salida)
+    return primer_id
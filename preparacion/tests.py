@@ -1,3 +1,452 @@
+import json
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import connection, transaction
+from django.db.models import OuterRef, Subquery
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework.utils.encoders import JSONEncoder
+
+from departamentos.models import Departamento
+from preparacion.api.services import MODULO_PREPARACION, MODULOS, filtrar_tramites
+from preparacion.management.commands.explain_listados import (
+    DEPENDIENTE, SIN_INDICE, consultas_listado, escenarios, explicar,
+)
+from preparacion.historial import HistoricoArchivo, HistoricoPreparacion, diferencias
+from preparacion.models import CambioHistorial, HistorialFrio, Preparacion, PreparacionArchivo
+from preparacion.retencion import compactar, mover_a_frio
+from preparacion.resumen import bloquear_clave, obtener_resumen, recalcular_resumen
+from preparacion.semillas import sembrar_tramites
+from preparacion.websocket.utils import filtros_evento
+from user.models import User
+
+
+class ConsultasListadoMixin:
+    """
+    Regresión de N+1 en el listado de un módulo: las consultas por petición
+    no dependen de cuántos trámites (ni archivos) tiene la página.
+
+    Cada app define `url` y `estado_modulo`.
+    """
+    url = None
+    estado_modulo = None
+
+    # COUNT + página (con sus JOINs) + archivos de toda la página
+    CONSULTAS_PAGINA = 3
+    # Página + archivos (keyset no cuenta filas)
+    CONSULTAS_CURSOR = 2
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='listado', password='x'))
+
+    def sembrar(self, cantidad, semilla):
+        """Crea `cantidad` trámites con archivos y los deja todos en el módulo probado"""
+        primer_id = sembrar_tramites(cantidad, archivos_por=3, semilla=semilla)
+        Preparacion.objects.filter(id__gte=primer_id).update(estado_modulo=self.estado_modulo)
+
+    def listar(self, consultas, params):
+        with self.assertNumQueries(consultas):
+            response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.data['results']
+
+    def test_consultas_constantes_paginado(self):
+        self.sembrar(3, semilla=1)
+        filas = self.listar(self.CONSULTAS_PAGINA, {'page_size': 100})
+        self.assertEqual(len(filas), 3)
+
+        self.sembrar(40, semilla=2)
+        filas = self.listar(self.CONSULTAS_PAGINA, {'page_size': 100})
+        self.assertEqual(len(filas), 43)
+        self.assertTrue(all(fila['total_archivos'] == 3 for fila in filas))
+
+    def test_consultas_constantes_cursor(self):
+        self.sembrar(3, semilla=1)
+        self.assertEqual(len(self.listar(self.CONSULTAS_CURSOR, {'cursor': '', 'page_size': 100})), 3)
+
+        self.sembrar(40, semilla=2)
+        filas = self.listar(self.CONSULTAS_CURSOR, {'cursor': '', 'page_size': 100})
+        self.assertEqual(len(filas), 43)
+        self.assertTrue(all(len(fila['archivos']) == 3 for fila in filas))
+
+
+class ListTramitesConsultasTests(ConsultasListadoMixin, TestCase):
+    url = '/api/preparacion/list/'
+    estado_modulo = 1
+
+
+class PlanesListadoTests(TestCase):
+    """EXPLAIN de las consultas de los cuatro listados: los nombres se resuelven por JOIN, sin subconsultas dependientes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        sembrar_tramites(120, archivos_por=2, semilla=3)
+
+    def subconsultas_dependientes(self, sql):
+        return [mensaje for tipo, mensaje in explicar(sql) if tipo == DEPENDIENTE]
+
+    def test_detecta_subconsulta_dependiente(self):
+        # La anotación que usaban antes los listados
+        tramites = Preparacion.objects.annotate(nombre_depto=Subquery(
+            Departamento.objects.filter(id_departamento=OuterRef('departamento_id')).values('departamento')[:1]
+        ))
+        self.assertTrue(self.subconsultas_dependientes(str(tramites.query)))
+
+    def test_busqueda_de_placa_usa_su_indice(self):
+        params = dict(escenarios(MODULOS[1]))['búsqueda placa']
+        consultas = consultas_listado(MODULOS[1], params)
+        self.assertTrue(consultas)
+        for sql in consultas:
+            self.assertNotIn(SIN_INDICE, [tipo for tipo, _ in explicar(sql, 'idx_prep_modulo_placa')], sql)
+
+        # La búsqueda de texto no recorre la placa en ese índice: el chequeo lo detecta
+        consultas = consultas_listado(MODULOS[1], {'search': 'bogota'})
+        self.assertIn(SIN_INDICE, [tipo for sql in consultas for tipo, _ in explicar(sql, 'idx_prep_modulo_placa')])
+
+    def test_listados_sin_subconsultas_dependientes(self):
+        for modulo in MODULOS.values():
+            casos = dict(escenarios(modulo, page_size=5))
+            # La página profunda recorre un OFFSET real y el cursor llega a la misma posición
+            self.assertGreater(int(casos['página profunda']['page']), 1)
+            self.assertIn('cursor profundo', casos)
+
+            for escenario, params in casos.items():
+                with self.subTest(modulo=modulo.nombre, escenario=escenario):
+                    consultas = consultas_listado(modulo, params)
+                    self.assertTrue(consultas)
+                    for sql in consultas:
+                        self.assertEqual(self.subconsultas_dependientes(sql), [], sql)
+
+
+class BusquedaTests(TestCase):
+    """Columna `busqueda`: cuándo se reconstruye y qué encuentra el buscador"""
+
+    @classmethod
+    def setUpTestData(cls):
+        primer_id = sembrar_tramites(2, archivos_por=0, semilla=4)
+        Preparacion.objects.filter(id__gte=primer_id).update(estado_modulo=1)
+        for tramite_id, placa in ((primer_id, 'ABC123'), (primer_id + 1, 'XYZ987')):
+            tramite = Preparacion.objects.get(id=tramite_id)
+            tramite.placa = placa
+            tramite.save()
+        cls.tramite_id = primer_id
+        cls.otro_id = primer_id + 1
+
+    def buscar(self, texto):
+        return set(filtrar_tramites(MODULO_PREPARACION, {'search': texto}).values_list('id', flat=True))
+
+    def test_edicion_sin_campos_de_busqueda_no_consulta_relaciones(self):
+        tramite = Preparacion.objects.get(id=self.tramite_id)
+        tramite.estado = 'en_novedad'
+        with CaptureQueriesContext(connection) as ctx:
+            tramite.save()
+        tablas = ('"user_user"', '"proveedores"', '"departamentos"', '"municipios"')
+        self.assertFalse([q['sql'] for q in ctx.captured_queries if any(t in q['sql'] for t in tablas)])
+
+    def test_cambio_de_placa_reconstruye_busqueda(self):
+        tramite = Preparacion.objects.get(id=self.tramite_id)
+        tramite.placa = 'XYZ987'
+        tramite.save()
+        busqueda = Preparacion.objects.get(id=self.tramite_id).busqueda
+        self.assertIn('xyz987', busqueda)
+        self.assertNotIn('abc123', busqueda)
+
+    def test_prefijo_de_placa(self):
+        self.assertEqual(self.buscar('ABC12'), {self.tramite_id})
+        self.assertEqual(self.buscar('abc-1'), {self.tramite_id})
+        self.assertEqual(self.buscar('ABC 123'), {self.tramite_id})
+        self.assertEqual(self.buscar('XYZ9'), {self.otro_id})
+        # Por prefijo, no por subcadena
+        self.assertNotIn(self.tramite_id, self.buscar('BC12'))
+
+    def test_busqueda_de_placa_no_usa_la_columna_de_texto(self):
+        sql = str(filtrar_tramites(MODULO_PREPARACION, {'search': 'ABC12'}).query)
+        self.assertIn('"placa_busqueda" >=', sql)
+        self.assertNotIn('"busqueda" LIKE', sql)
+
+    def test_sin_placa_con_ese_prefijo_busca_en_el_texto(self):
+        # Letras y números, pero ninguna placa empieza así: código de proveedor, etc.
+        codigo = Preparacion.objects.get(id=self.tramite_id).usuario.username
+        self.assertIn(self.tramite_id, self.buscar(codigo))
+        self.assertEqual(self.buscar('ABC124'), set())
+
+    def test_terminos_cortos_por_inicio_de_palabra(self):
+        # "98" es inicio de la palabra "987" (la placa también se guarda separada en letras y números)
+        self.assertIn(self.otro_id, self.buscar('98'))
+        self.assertNotIn(self.tramite_id, self.buscar('98'))
+
+
+class VersionTests(TestCase):
+    """Numeración de versiones y estado "leído" después de guardar"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tramite_id = sembrar_tramites(1, archivos_por=0, semilla=5)
+
+    def version_en_base(self):
+        return Preparacion.objects.values_list('version', flat=True).get(id=self.tramite_id)
+
+    def test_guardado_con_bloqueo_no_relee_la_version(self):
+        tramite = Preparacion.objects.get(id=self.tramite_id)
+        tramite.estado = 'en_novedad'
+        with transaction.atomic():
+            bloquear_clave(tramite)
+            with CaptureQueriesContext(connection) as ctx:
+                tramite.save()
+        relecturas = [
+            q['sql'] for q in ctx.captured_queries
+            if q['sql'].startswith('SELECT') and ' FROM "preparacion" ' in q['sql']
+        ]
+        self.assertEqual(relecturas, [])
+        self.assertEqual(tramite.version, self.version_en_base())
+
+    def test_guardado_sin_bloqueo_lee_la_version_al_usarla(self):
+        tramite = Preparacion.objects.get(id=self.tramite_id)
+        anterior = tramite.version
+        tramite.estado = 'en_novedad'
+        tramite.save()
+        self.assertIn('version', tramite.get_deferred_fields())
+        self.assertEqual(tramite.version, anterior + 1)
+        tramite.estado = 'para_radicacion'
+        tramite.save()
+        self.assertEqual(tramite.version, anterior + 2)
+        self.assertEqual(self.version_en_base(), anterior + 2)
+
+    def test_campos_modificados_despues_de_guardar(self):
+        tramite = Preparacion.objects.get(id=self.tramite_id)
+        tramite.estado = 'en_novedad'
+        tramite.save()
+        self.assertEqual(tramite.campos_modificados(), set())
+
+        tramite.estado_detalle = 'Falta firma'
+        self.assertEqual(tramite.campos_modificados(), {'estado_detalle'})
+        tramite.save()
+
+        tramite.estado = 'para_radicacion'
+        self.assertEqual(tramite.campos_modificados(), {'estado'})
+        filtros = filtros_evento(tramite)
+        self.assertEqual(filtros['anterior']['estado'], 'en_novedad')
+        self.assertEqual(filtros['actual']['estado'], 'para_radicacion')
+
+
+class RetencionHistorialTests(TestCase):
+    """Compactación y tabla fría: qué registros quedan y que la trazabilidad no cambia"""
+
+    # Estados de las ediciones, uno por guardado después de la creación
+    ESTADOS = ['en_novedad', 'para_radicacion', 'en_novedad', 'para_radicacion', 'en_novedad', 'para_radicacion']
+
+    def setUp(self):
+        self.tramite_id = sembrar_tramites(1, archivos_por=1, semilla=6)
+        tramite = Preparacion.objects.get(id=self.tramite_id)
+        for estado in self.ESTADOS:
+            tramite.estado = estado
+            tramite.save()
+
+    def historial(self):
+        return list(HistoricoPreparacion.objects.filter(id=self.tramite_id).order_by('history_date', 'history_id'))
+
+    def cambios(self):
+        """{history_id: cambios} de los CambioHistorial del trámite"""
+        return dict(CambioHistorial.objects.filter(
+            tramite_id=self.tramite_id, entidad=CambioHistorial.ENTIDAD_TRAMITE
+        ).values_list('history_id', 'cambios'))
+
+    def cambios_esperados(self):
+        """Cambios de cada registro respecto al anterior real, como quedan en el JSONField"""
+        registros = self.historial()
+        return {
+            registro.history_id: json.loads(json.dumps(diferencias(registro, anterior), cls=JSONEncoder))
+            for registro, anterior in zip(registros, [None] + registros[:-1])
+        }
+
+    def test_compactar_conserva_creacion_y_ultimo_de_cada_periodo(self):
+        # Fechas al inicio de un período de 30 días (los períodos se cuentan desde el epoch)
+        periodo = 30 * 86400
+        base = datetime.fromtimestamp(
+            (timezone.now() - timedelta(days=400)).timestamp() // periodo * periodo, tz=dt_timezone.utc
+        )
+        # Período 0: creación, intermedio, último. Período 1: dos intermedios y el último. Uno reciente.
+        fechas = [base + timedelta(days=dias) for dias in (0, 1, 2, 31, 35, 40)] + [timezone.now() - timedelta(days=5)]
+        registros = self.historial()
+        self.assertEqual(len(registros), len(fechas))
+        for registro, fecha in zip(registros, fechas):
+            HistoricoPreparacion.objects.filter(history_id=registro.history_id).update(history_date=fecha)
+        ids = [registro.history_id for registro in registros]
+
+        esperados = self.cambios_esperados()
+        # Historial escrito antes de la tabla de cambios: compactar debe materializarlo antes de borrar
+        CambioHistorial.objects.filter(
+            entidad=CambioHistorial.ENTIDAD_TRAMITE, history_id__in=ids[:-1]
+        ).delete()
+
+        self.assertEqual(compactar(HistoricoPreparacion, dias=90, dias_snapshot=30), 3)
+        restantes = [registro.history_id for registro in self.historial()]
+        self.assertEqual(restantes, [ids[0], ids[2], ids[5], ids[6]])
+        self.assertEqual(self.cambios(), esperados)
+
+        # La regla depende solo de las fechas: otra corrida no borra nada
+        self.assertEqual(compactar(HistoricoPreparacion, dias=90, dias_snapshot=30), 0)
+        self.assertEqual([registro.history_id for registro in self.historial()], restantes)
+        self.assertEqual(self.cambios(), esperados)
+
+    def test_mover_a_frio_y_reactivar(self):
+        Preparacion.objects.filter(id=self.tramite_id).update(
+            estado_modulo=0, updated_at=timezone.now() - timedelta(days=400)
+        )
+        registros = self.historial()
+        esperados = self.cambios_esperados()
+        archivos = HistoricoArchivo.objects.filter(tramite_id=self.tramite_id).count()
+        CambioHistorial.objects.filter(tramite_id=self.tramite_id).delete()
+
+        self.assertEqual(mover_a_frio(meses=12), len(registros) + archivos)
+        self.assertFalse(HistoricoPreparacion.objects.filter(id=self.tramite_id).exists())
+        self.assertFalse(HistoricoArchivo.objects.filter(tramite_id=self.tramite_id).exists())
+        self.assertEqual(
+            list(HistorialFrio.objects.filter(
+                tramite_id=self.tramite_id, entidad=CambioHistorial.ENTIDAD_TRAMITE
+            ).order_by('history_date', 'history_id').values_list('history_id', flat=True)),
+            [registro.history_id for registro in registros]
+        )
+        self.assertEqual(self.cambios(), esperados)
+        self.assertEqual(mover_a_frio(meses=12), 0)
+
+        # Reactivado: el primer registro nuevo se compara con el último de la tabla fría
+        tramite = Preparacion.objects.get(id=self.tramite_id)
+        tramite.estado_modulo = 1
+        tramite.save()
+        nuevo = HistoricoPreparacion.objects.get(id=self.tramite_id)
+        campos = {cambio['campo'] for cambio in self.cambios()[nuevo.history_id]}
+        self.assertIn('estado_modulo', campos)
+        self.assertNotIn('placa', campos)
+        self.assertNotIn('lista_documentos', campos)
+
+
+class TrazabilidadTests(TestCase):
+    """CambioHistorial escrito por la señal y paginación por cursor de la trazabilidad"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tramite_id = sembrar_tramites(1, archivos_por=3, semilla=7)
+        tramite = Preparacion.objects.get(id=cls.tramite_id)
+        for estado, placa in (('en_novedad', 'ABC123'), ('para_radicacion', 'ABC123'), ('en_novedad', 'XYZ987')):
+            tramite.estado = estado
+            tramite.placa = placa
+            tramite.lista_documentos = [
+                {**documento, 'completado': not documento['completado']} for documento in tramite.lista_documentos
+            ]
+            tramite.save()
+        for archivo in PreparacionArchivo.objects.filter(tramite_id=cls.tramite_id):
+            archivo.nombre_original = f'renombrado_{archivo.id}.pdf'
+            archivo.save()
+
+        # Trámite y archivo con la misma fecha: el cursor desempata por entidad e history_id
+        fecha = timezone.now() - timedelta(days=1)
+        for cambio in CambioHistorial.objects.filter(tramite_id=cls.tramite_id).order_by('-history_date')[:4]:
+            CambioHistorial.objects.filter(pk=cambio.pk).update(history_date=fecha)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='auditor', password='x', role='admin'))
+
+    def test_senal_guarda_lo_mismo_que_diff_against(self):
+        for historico, filtro in (
+            (HistoricoPreparacion, {'id': self.tramite_id}),
+            (HistoricoArchivo, {'tramite_id': self.tramite_id}),
+        ):
+            registros = historico.objects.filter(**filtro).exclude(history_type='+')
+            self.assertTrue(registros)
+            for registro in registros:
+                delta = registro.diff_against(registro.prev_record)
+                esperado = json.loads(json.dumps(
+                    [{"campo": c.field, "anterior": c.old, "nuevo": c.new} for c in delta.changes], cls=JSONEncoder
+                ))
+                cambio = CambioHistorial.objects.get(
+                    entidad=CambioHistorial.ENTIDAD_TRAMITE if historico is HistoricoPreparacion else CambioHistorial.ENTIDAD_ARCHIVO,
+                    history_id=registro.history_id,
+                )
+                self.assertTrue(esperado)
+                self.assertEqual(cambio.cambios, esperado)
+
+    def test_cursor_recorre_todos_los_eventos_una_vez_en_orden(self):
+        url = f'/api/preparacion/{self.tramite_id}/history/'
+        completa = self.client.get(url, {'page_size': 500}).data
+        self.assertIsNone(completa['next'])
+        eventos = completa['trazabilidad_completa']
+        self.assertEqual(len(eventos), completa['total_eventos'])
+        self.assertEqual({evento['entidad'] for evento in eventos}, {'Trámite', 'Archivo'})
+        self.assertEqual(
+            len(eventos),
+            HistoricoPreparacion.objects.filter(id=self.tramite_id).count()
+            + HistoricoArchivo.objects.filter(tramite_id=self.tramite_id).count()
+        )
+
+        paginas = []
+        respuesta = self.client.get(url, {'page_size': 2}).data
+        while True:
+            self.assertLessEqual(len(respuesta['trazabilidad_completa']), 2)
+            paginas.extend(respuesta['trazabilidad_completa'])
+            if respuesta['next'] is None:
+                break
+            respuesta = self.client.get(respuesta['next']).data
+        self.assertEqual(paginas, eventos)
+        fechas = [evento['fecha'] for evento in paginas]
+        self.assertEqual(fechas, sorted(fechas, reverse=True))
+
+
+class ResumenFlujoTests(TestCase):
+    """Los contadores incrementales coinciden con un COUNT ... GROUP BY en cada paso del flujo"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ubicacion = Preparacion.objects.values('departamento_id', 'municipio_id').get(
+            id=sembrar_tramites(1, archivos_por=0, semilla=8)
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='resumen', password='x', role='admin'))
+
+    def resumenes(self):
+        return [obtener_resumen(estado_modulo) for estado_modulo in (0, 1, 2, 3)]
+
+    def assertResumenConsistente(self):
+        incremental = self.resumenes()
+        with transaction.atomic():
+            recalcular_resumen()
+            recalculado = self.resumenes()
+            transaction.set_rollback(True)
+        self.assertEqual(incremental, recalculado)
+        return incremental
+
+    def test_crear_enviar_finalizar_eliminar(self):
+        inicial = self.assertResumenConsistente()
+
+        response = self.client.post('/api/preparacion/create/', {
+            'placa': 'res123',
+            'tipo_vehiculo': Preparacion.TIPO_VEHICULO_CHOICES[0][0],
+            'departamento': self.ubicacion['departamento_id'],
+            'municipio': self.ubicacion['municipio_id'],
+        })
+        self.assertEqual(response.status_code, 201, response.data)
+        tramite_id = response.data['id']
+        resumen = self.assertResumenConsistente()
+        self.assertEqual(resumen[1]['total'], inicial[1]['total'] + 1)
+
+        response = self.client.post(f'/api/preparacion/{tramite_id}/send-to-tracker/', {})
+        self.assertEqual(response.status_code, 200, response.data)
+        resumen = self.assertResumenConsistente()
+        self.assertEqual(resumen[1]['total'], inicial[1]['total'])
+        self.assertEqual(resumen[2]['total'], inicial[2]['total'] + 1)
+
+        response = self.client.post(f'/api/tracker/{tramite_id}/finalizar/', {})
+        self.assertEqual(response.status_code, 200, response.data)
+        resumen = self.assertResumenConsistente()
+        self.assertEqual(resumen[2]['total'], inicial[2]['total'])
+        self.assertEqual(resumen[3]['total'], inicial[3]['total'] + 1)
 
-# Create your tests here.
+        response = self.client.delete(f'/api/preparacion/{tramite_id}/delete/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.assertResumenConsistente(), inicial)
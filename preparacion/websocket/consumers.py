@@ -1,16 +1,28 @@
 # preparacion/websocket/consumers.py
+import asyncio
 import json
+import logging
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
 from django.contrib.auth import get_user_model
 
+from backend.logs import RegistroEventosMixin
+from backend.registro_eventos import get_config, reanudar, ultima_secuencia
+from preparacion.api.services import MODULO_PREPARACION
+from preparacion.websocket.filtros import SuscripcionFiltroMixin
+from preparacion.websocket.resync import responder_resync
+
+logger = logging.getLogger(__name__)
+
 User = get_user_model()
 
-class PreparacionConsumer(AsyncWebsocketConsumer):
+class PreparacionConsumer(RegistroEventosMixin, SuscripcionFiltroMixin, AsyncWebsocketConsumer):
     """
     Consumer para manejar conexiones WebSocket de la aplicación Preparación.
     Gestiona actualizaciones en tiempo real de trámites de preparación.
     """
+    grupo_modulo = 'preparacion_updates'
+    tipo_eliminado = 'preparacion_deleted'
+    dimensiones_filtro = ('departamento', 'estado')
     
     async def connect(self):
         """
@@ -22,6 +34,9 @@ class PreparacionConsumer(AsyncWebsocketConsumer):
         # Usuario (si está autenticado)
         self.user = self.scope.get('user')
 
+        # IDs de trámites a los que está suscrita esta conexión (grupos preparacion_<id>)
+        self.suscripciones = set()
+
         # Únete al grupo
         await self.channel_layer.group_add(
             self.room_group_name,
@@ -31,24 +46,34 @@ class PreparacionConsumer(AsyncWebsocketConsumer):
         # Acepta la conexión
         await self.accept()
 
-        # Envía mensaje de bienvenida
+        # Envía mensaje de bienvenida (con la última secuencia, para reanudar después)
         await self.send(text_data=json.dumps({
             'type': 'connection_established',
             'message': 'Conectado a actualizaciones de Preparación en tiempo real',
+            'seq': await ultima_secuencia(self.room_group_name),
             'timestamp': self.get_timestamp()
         }))
 
+        # Reenvía los eventos perdidos si el cliente se reconecta con ?resume_from=<seq>
+        await reanudar(self, self.room_group_name)
+
     async def disconnect(self, close_code):
         """
         Se ejecuta cuando un cliente se desconecta
         """
-        # Sale del grupo
+        # Sale del grupo (el del módulo o el de su filtro)
         await self.channel_layer.group_discard(
-            self.room_group_name,
+            self.grupo_actual(),
             self.channel_name
         )
-        
-        print(f"Cliente desconectado del grupo {self.room_group_name}")
+
+        # Sale de los grupos de trámites específicos para no dejar canales muertos en Redis
+        await asyncio.gather(*(
+            self.channel_layer.group_discard(f'preparacion_{preparacion_id}', self.channel_name)
+            for preparacion_id in getattr(self, 'suscripciones', ())
+        ))
+
+        logger.debug('Cliente desconectado del grupo %s', self.grupo_actual())
 
     async def receive(self, text_data):
         """
@@ -71,6 +96,20 @@ class PreparacionConsumer(AsyncWebsocketConsumer):
                 preparacion_id = text_data_json.get('preparacion_id')
                 if preparacion_id:
                     await self.subscribe_to_preparacion(preparacion_id)
+
+            elif message_type == 'unsubscribe':
+                # Cancelar la suscripción a un trámite específico
+                preparacion_id = text_data_json.get('preparacion_id')
+                if preparacion_id:
+                    await self.unsubscribe_from_preparacion(preparacion_id)
+
+            elif message_type == 'subscribe_filter':
+                # Recibir solo los eventos de trámites que coinciden con el filtro
+                await self.suscribir_filtro(text_data_json)
+
+            elif message_type == 'resync':
+                # El cliente detectó un hueco de versiones: reenviar los registros completos
+                await responder_resync(self, MODULO_PREPARACION, text_data_json)
             
         except json.JSONDecodeError:
             await self.send(text_data=json.dumps({
@@ -90,9 +129,13 @@ class PreparacionConsumer(AsyncWebsocketConsumer):
         """
         Envía notificación cuando se crea una preparación
         """
+        if not await self.pasa_filtro(event):
+            return
+
         await self.send(text_data=json.dumps({
             'type': 'preparacion_created',
             'data': event['data'],
+            'seq': event.get('seq'),
             'message': 'Nueva preparación creada',
             'timestamp': self.get_timestamp()
         }))
@@ -101,9 +144,13 @@ class PreparacionConsumer(AsyncWebsocketConsumer):
         """
         Envía notificación cuando se actualiza una preparación
         """
+        if not await self.pasa_filtro(event):
+            return
+
         await self.send(text_data=json.dumps({
             'type': 'preparacion_updated',
             'data': event['data'],
+            'seq': event.get('seq'),
             'message': 'Preparación actualizada',
             'timestamp': self.get_timestamp()
         }))
@@ -112,9 +159,13 @@ class PreparacionConsumer(AsyncWebsocketConsumer):
         """
         Envía notificación cuando se elimina una preparación
         """
+        if not await self.pasa_filtro(event):
+            return
+
         await self.send(text_data=json.dumps({
             'type': 'preparacion_deleted',
             'data': event['data'],
+            'seq': event.get('seq'),
             'message': 'Preparación eliminada',
             'timestamp': self.get_timestamp()
         }))
@@ -123,9 +174,13 @@ class PreparacionConsumer(AsyncWebsocketConsumer):
         """
         Envía notificación cuando cambia el estado de una preparación
         """
+        if not await self.pasa_filtro(event):
+            return
+
         await self.send(text_data=json.dumps({
             'type': 'preparacion_status_changed',
             'data': event['data'],
+            'seq': event.get('seq'),
             'message': f"Estado cambiado a: {event['data'].get('status')}",
             'timestamp': self.get_timestamp()
         }))
@@ -134,9 +189,13 @@ class PreparacionConsumer(AsyncWebsocketConsumer):
         """
         Envía notificación cuando se elimina un archivo de un trámite
         """
+        if not await self.pasa_filtro(event):
+            return
+
         await self.send(text_data=json.dumps({
             'type': 'archivo_deleted',
             'data': event['data'],
+            'seq': event.get('seq'),
             'message': f"Archivo eliminado: {event['data'].get('nombre_archivo')}",
             'timestamp': self.get_timestamp()
         }))
@@ -144,14 +203,30 @@ class PreparacionConsumer(AsyncWebsocketConsumer):
     # ===== Helper Methods =====
     async def subscribe_to_preparacion(self, preparacion_id):
         """
-        Suscribe al usuario a actualizaciones de un trámite específico
+        Suscribe al usuario a actualizaciones de un trámite específico.
+        Máximo MAX_SUSCRIPCIONES_TRAMITE trámites por conexión.
         """
-        specific_group = f'preparacion_{preparacion_id}'
-        await self.channel_layer.group_add(
-            specific_group,
-            self.channel_name
-        )
-        
+        preparacion_id = await self.validar_preparacion_id(preparacion_id)
+        if preparacion_id is None:
+            return
+
+        if preparacion_id not in self.suscripciones:
+            maximo = get_config('MAX_SUSCRIPCIONES_TRAMITE', 50)
+            if len(self.suscripciones) >= maximo:
+                await self.send(text_data=json.dumps({
+                    'type': 'error',
+                    'message': f'Máximo {maximo} trámites suscritos por conexión',
+                    'timestamp': self.get_timestamp()
+                }))
+                return
+
+            specific_group = f'preparacion_{preparacion_id}'
+            await self.channel_layer.group_add(
+                specific_group,
+                self.channel_name
+            )
+            self.suscripciones.add(preparacion_id)
+
         await self.send(text_data=json.dumps({
             'type': 'subscribed',
             'preparacion_id': preparacion_id,
@@ -159,6 +234,43 @@ class PreparacionConsumer(AsyncWebsocketConsumer):
             'timestamp': self.get_timestamp()
         }))
 
+    async def unsubscribe_from_preparacion(self, preparacion_id):
+        """
+        Cancela la suscripción a un trámite específico
+        """
+        preparacion_id = await self.validar_preparacion_id(preparacion_id)
+        if preparacion_id is None:
+            return
+
+        if preparacion_id in self.suscripciones:
+            await self.channel_layer.group_discard(
+                f'preparacion_{preparacion_id}',
+                self.channel_name
+            )
+            self.suscripciones.discard(preparacion_id)
+
+        await self.send(text_data=json.dumps({
+            'type': 'unsubscribed',
+            'preparacion_id': preparacion_id,
+            'message': f'Suscripción al trámite {preparacion_id} cancelada',
+            'timestamp': self.get_timestamp()
+        }))
+
+    async def validar_preparacion_id(self, preparacion_id):
+        """
+        Convierte el ID a entero (el nombre del grupo se arma con él).
+        Si no es válido envía un error y retorna None.
+        """
+        try:
+            return int(preparacion_id)
+        except (TypeError, ValueError):
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'message': 'preparacion_id inválido',
+                'timestamp': self.get_timestamp()
+            }))
+            return None
+
     @staticmethod
     def get_timestamp():
         """
@@ -0,0 +1,114 @@
+# preparacion/websocket/filtros.py
+import json
+from datetime import datetime
+
+from backend.notificaciones import id_registro, nombre_grupo_filtro
+from backend.registro_eventos import reanudar, ultima_secuencia
+
+
+class SuscripcionFiltroMixin:
+    """
+    Suscripción filtrada para los consumers de módulos.
+
+    El cliente envía {'type': 'subscribe_filter', 'filtro': {'proveedor': 5}}
+    y el consumer pasa del grupo del módulo al grupo de ese filtro
+    (`<grupo>.proveedor.5`), donde el despachador solo envía los eventos de
+    trámites con ese valor. Si el filtro tiene varias dimensiones, el grupo es
+    el de la primera según `dimensiones_filtro` y el resto se valida en
+    `pasa_filtro`. Un filtro vacío vuelve al grupo del módulo.
+
+    Si un trámite sale del filtro (p. ej. cambió de proveedor) el cliente recibe
+    el evento `tipo_eliminado` con reason 'fuera_de_filtro'. Si entra al filtro
+    por una actualización parcial, el cliente no lo tiene y debe pedir resync.
+
+    Cada consumer define:
+        grupo_modulo (str): Grupo del módulo (p. ej. 'tracker_updates')
+        tipo_eliminado (str): Handler de eliminación (p. ej. 'tracker_deleted')
+        dimensiones_filtro (tuple): Dimensiones aceptadas, en orden de prioridad
+    """
+    grupo_modulo = None
+    tipo_eliminado = None
+    dimensiones_filtro = ('proveedor', 'departamento', 'estado')
+
+    filtro = None
+    grupo_suscrito = None
+
+    def grupo_actual(self):
+        """Grupo en el que está el canal (el del filtro o el del módulo)"""
+        return self.grupo_suscrito or self.grupo_modulo
+
+    async def suscribir_filtro(self, mensaje):
+        """Cambia la suscripción del canal al grupo del filtro pedido"""
+        filtro = mensaje.get('filtro') or {}
+        if not isinstance(filtro, dict):
+            await self.enviar_error_filtro('El filtro debe ser un objeto')
+            return
+
+        invalidas = [dim for dim in filtro if dim not in self.dimensiones_filtro]
+        if invalidas:
+            await self.enviar_error_filtro(f"Dimensiones no soportadas: {', '.join(invalidas)}")
+            return
+
+        filtro = {dim: str(filtro[dim]) for dim in self.dimensiones_filtro if filtro.get(dim) not in (None, '')}
+        grupo = self.grupo_modulo
+        for dim in self.dimensiones_filtro:
+            if dim in filtro:
+                grupo = nombre_grupo_filtro(self.grupo_modulo, dim, filtro[dim])
+                break
+
+        # Primero se agrega al grupo nuevo y luego se sale del anterior: no se pierden eventos
+        anterior = self.grupo_actual()
+        if grupo != anterior:
+            await self.channel_layer.group_add(grupo, self.channel_name)
+            await self.channel_layer.group_discard(anterior, self.channel_name)
+
+        self.filtro = filtro or None
+        self.grupo_suscrito = grupo
+
+        await self.send(text_data=json.dumps({
+            'type': 'filter_subscribed',
+            'filtro': filtro,
+            'seq': await ultima_secuencia(self.grupo_modulo),
+            'timestamp': datetime.now().isoformat()
+        }))
+
+        # Reanudación con el filtro ya aplicado (los eventos se filtran en pasa_filtro)
+        if mensaje.get('resume_from') is not None:
+            try:
+                resume_from = int(mensaje['resume_from'])
+            except (TypeError, ValueError):
+                return
+            await reanudar(self, self.grupo_modulo, resume_from)
+
+    async def pasa_filtro(self, event):
+        """
+        Indica si el evento debe enviarse al cliente según su filtro.
+        Si el trámite salió del filtro envía la eliminación 'fuera_de_filtro' y retorna False.
+        """
+        filtros = event.get('filtros')
+        if not self.filtro or not filtros:
+            return True
+
+        def coincide(valores):
+            return all(valores.get(dim) == valor for dim, valor in self.filtro.items())
+
+        if coincide(filtros['actual']):
+            return True
+
+        if coincide(filtros['anterior']):
+            if event['type'].endswith('_deleted'):
+                return True
+            if event['type'].endswith('_updated'):
+                await self.send(text_data=json.dumps({
+                    'type': self.tipo_eliminado,
+                    'data': {'id': id_registro(event), 'reason': 'fuera_de_filtro'},
+                    'seq': event.get('seq')
+                }))
+        return False
+
+    async def enviar_error_filtro(self, mensaje):
+        await self.send(text_data=json.dumps({
+            'type': 'error',
+            'message': mensaje,
+            'timestamp': datetime.now().isoformat()
+        }))
@@ -0,0 +1,56 @@
+# preparacion/websocket/resync.py
+import json
+from datetime import datetime
+
+from channels.db import database_sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+
+from preparacion.api.services import obtener_tramites
+
+
+# Más IDs que esto en un pedido de resync: conviene recargar el listado completo
+MAX_IDS_RESYNC = 100
+
+
+async def responder_resync(consumer, modulo, mensaje):
+    """
+    Atiende un mensaje {'type': 'resync', 'ids': [...]} de un cliente que detectó
+    un hueco de versiones (version_base distinta a la versión que tiene).
+
+    Responde con las filas completas (mismo formato que el listado) y con los IDs
+    que ya no están en el módulo, para que el cliente los quite.
+
+    Args:
+        consumer (AsyncWebsocketConsumer): Consumer que recibió el mensaje
+        modulo (Modulo): Configuración del módulo del consumer
+        mensaje (dict): Mensaje recibido del cliente
+    """
+    try:
+        ids = [int(pk) for pk in mensaje.get('ids') or []]
+    except (TypeError, ValueError):
+        ids = []
+
+    if not ids:
+        await consumer.send(text_data=json.dumps({
+            'type': 'error',
+            'message': 'resync requiere una lista de ids',
+            'timestamp': datetime.now().isoformat()
+        }))
+        return
+
+    if len(ids) > MAX_IDS_RESYNC:
+        await consumer.send(text_data=json.dumps({
+            'type': 'resync',
+            'recargar': True,
+            'message': 'Demasiados registros, recargar el listado',
+            'timestamp': datetime.now().isoformat()
+        }))
+        return
+
+    filas, eliminados = await database_sync_to_async(obtener_tramites)(modulo, ids)
+    await consumer.send(text_data=json.dumps({
+        'type': 'resync',
+        'data': filas,
+        'eliminados': eliminados,
+        'timestamp': datetime.now().isoformat()
+    }, cls=DjangoJSONEncoder))
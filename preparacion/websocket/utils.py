@@ -1,74 +1,152 @@
 # preparacion/websocket/utils.py
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
+import logging
+from backend.notificaciones import construir_delta, encolar_evento
+from preparacion.websocket.consumers import PreparacionConsumer
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
+
+# Claves del payload WebSocket que dependen de cada campo del modelo Preparacion
+CLAVES_POR_CAMPO = {
+    'placa': ('placa',),
+    'tipo_vehiculo': ('tipo_vehiculo',),
+    'estado': ('estado',),
+    'estado_detalle': ('estado_detalle',),
+    'estado_tracker': ('estado_tracker',),
+    'paquete': ('paquete',),
+    'lista_documentos': ('lista_documentos', 'documentos_completos', 'documentos_completados', 'total_documentos'),
+    'departamento_id': ('departamento', 'nombre_depto'),
+    'municipio_id': ('municipio', 'nombre_muni'),
+    'proveedor_id': ('proveedor_id', 'proveedor_nombre', 'codigo_encargado'),
+    'fecha_recepcion_municipio': ('fecha_recepcion_municipio', 'hace_dias'),
+    'usuario_id': ('usuario',),
+}
+
+
+# Dimensiones por las que un cliente puede filtrar su suscripción -> campo del modelo
+DIMENSIONES_FILTRO = {
+    'proveedor': 'proveedor_id',
+    'departamento': 'departamento_id',
+    'estado': 'estado',
+}
+
 
 def get_timestamp():
     """Retorna timestamp ISO"""
     return datetime.now().isoformat()
 
 
-def notify_preparacion_created(preparacion_data):
+def claves_modificadas(campos, archivos=False):
+    """
+    Traduce los campos modificados del modelo (Preparacion.campos_modificados())
+    a las claves del payload WebSocket que hay que reenviar.
+
+    Args:
+        campos (set): attname de los campos modificados
+        archivos (bool): True si cambiaron los archivos del trámite
+
+    Returns:
+        set: Claves del payload (siempre incluye updated_at)
+    """
+    claves = {'updated_at'}
+    for campo in campos:
+        claves.update(CLAVES_POR_CAMPO.get(campo, ()))
+    if archivos:
+        claves.update(('archivos', 'total_archivos'))
+    return claves
+
+
+def filtros_evento(tramite):
+    """
+    Valores de las dimensiones de filtro del trámite, actuales y los leídos de la
+    base de datos (si cambiaron, el evento también llega a los clientes del filtro anterior).
+
+    Returns:
+        dict: {'actual': {dimension: valor}, 'anterior': {dimension: valor}} (valores como str)
+    """
+    cargados = getattr(tramite, '_valores_cargados', {})
+
+    def valor(dato):
+        return None if dato is None else str(dato)
+
+    return {
+        'actual': {dim: valor(getattr(tramite, campo)) for dim, campo in DIMENSIONES_FILTRO.items()},
+        'anterior': {
+            dim: valor(cargados.get(campo, getattr(tramite, campo)))
+            for dim, campo in DIMENSIONES_FILTRO.items()
+        },
+    }
+
+
+def notify_preparacion_created(preparacion_data, filtros=None):
     """
     Notifica a todos los clientes conectados que se creó una preparación
     
     Args:
         preparacion_data (dict): Datos serializados de la preparación
+        filtros (dict, optional): Valores de filtro del trámite (ver filtros_evento)
     """
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(
+    encolar_evento(
         'preparacion_updates',
         {
             'type': 'preparacion_created',
             'data': preparacion_data,
             'timestamp': get_timestamp()
-        }
+        },
+        filtros=filtros,
+        dimensiones=PreparacionConsumer.dimensiones_filtro
     )
-    print(f"✅ WebSocket: Notificación de creación enviada - ID: {preparacion_data.get('id')}")
+    logger.debug('WebSocket: Notificación de creación enviada - ID: %s', preparacion_data.get('id'))
 
 
-def notify_preparacion_updated(preparacion_data):
+def notify_preparacion_updated(preparacion_data, claves=None, filtros=None):
     """
     Notifica a todos los clientes conectados que se actualizó una preparación
-    
+
     Args:
         preparacion_data (dict): Datos serializados de la preparación
+        claves (set, optional): Claves que cambiaron; si se indican se envía solo
+            el delta ({id, version, version_base, cambios}) en lugar del registro completo
+        filtros (dict, optional): Valores de filtro del trámite (ver filtros_evento)
     """
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(
+    encolar_evento(
         'preparacion_updates',
         {
             'type': 'preparacion_updated',
-            'data': preparacion_data,
+            'data': preparacion_data if claves is None else construir_delta(preparacion_data, claves),
             'timestamp': get_timestamp()
-        }
+        },
+        filtros=filtros,
+        dimensiones=PreparacionConsumer.dimensiones_filtro
     )
-    print(f"✅ WebSocket: Notificación de actualización enviada - ID: {preparacion_data.get('id')}")
+    logger.debug('WebSocket: Notificación de actualización enviada - ID: %s', preparacion_data.get('id'))
 
 
-def notify_preparacion_deleted(preparacion_id, placa=None):
+def notify_preparacion_deleted(preparacion_id, placa=None, filtros=None):
     """
     Notifica a todos los clientes conectados que se eliminó una preparación
 
     Args:
         preparacion_id (int): ID de la preparación eliminada
         placa (str, optional): Placa del vehículo eliminado
+        filtros (dict, optional): Valores de filtro del trámite (ver filtros_evento)
     """
-    channel_layer = get_channel_layer()
     data = {'id': preparacion_id}
     if placa:
         data['placa'] = placa
 
-    async_to_sync(channel_layer.group_send)(
+    encolar_evento(
         'preparacion_updates',
         {
             'type': 'preparacion_deleted',
             'data': data,
             'timestamp': get_timestamp()
-        }
+        },
+        filtros=filtros,
+        dimensiones=PreparacionConsumer.dimensiones_filtro
     )
-    print(f"✅ WebSocket: Notificación de eliminación enviada - ID: {preparacion_id}")
+    logger.debug('WebSocket: Notificación de eliminación enviada - ID: %s', preparacion_id)
 
 
 def notify_preparacion_status_changed(preparacion_data):
@@ -78,8 +156,7 @@ def notify_preparacion_status_changed(preparacion_data):
     Args:
         preparacion_data (dict): Datos con el nuevo estado
     """
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(
+    encolar_evento(
         'preparacion_updates',
         {
             'type': 'preparacion_status_changed',
@@ -87,7 +164,7 @@ def notify_preparacion_status_changed(preparacion_data):
             'timestamp': get_timestamp()
         }
     )
-    print(f"✅ WebSocket: Notificación de cambio de estado - ID: {preparacion_data.get('id')}")
+    logger.debug('WebSocket: Notificación de cambio de estado - ID: %s', preparacion_data.get('id'))
 
 
 def notify_specific_preparacion(preparacion_id, event_type, data):
@@ -99,10 +176,9 @@ def notify_specific_preparacion(preparacion_id, event_type, data):
         event_type (str): Tipo de evento
         data (dict): Datos del evento
     """
-    channel_layer = get_channel_layer()
     group_name = f'preparacion_{preparacion_id}'
 
-    async_to_sync(channel_layer.group_send)(
+    encolar_evento(
         group_name,
         {
             'type': event_type,
@@ -110,10 +186,10 @@ def notify_specific_preparacion(preparacion_id, event_type, data):
             'timestamp': get_timestamp()
         }
     )
-    print(f"✅ WebSocket: Notificación específica enviada - Grupo: {group_name}")
+    logger.debug('WebSocket: Notificación específica enviada - Grupo: %s', group_name)
 
 
-def notify_archivo_deleted(tramite_id, archivo_id, nombre_archivo):
+def notify_archivo_deleted(tramite_id, archivo_id, nombre_archivo, filtros=None):
     """
     Notifica cuando se elimina un archivo de un trámite
 
@@ -121,9 +197,9 @@ def notify_archivo_deleted(tramite_id, archivo_id, nombre_archivo):
         tramite_id (int): ID del trámite
         archivo_id (int): ID del archivo eliminado
         nombre_archivo (str): Nombre del archivo eliminado
+        filtros (dict, optional): Valores de filtro del trámite (ver filtros_evento)
     """
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(
+    encolar_evento(
         'preparacion_updates',
         {
             'type': 'archivo_deleted',
@@ -133,12 +209,14 @@ def notify_archivo_deleted(tramite_id, archivo_id, nombre_archivo):
                 'nombre_archivo': nombre_archivo
             },
             'timestamp': get_timestamp()
-        }
+        },
+        filtros=filtros,
+        dimensiones=PreparacionConsumer.dimensiones_filtro
     )
-    print(f"✅ WebSocket: Notificación de eliminación de archivo - Trámite ID: {tramite_id}, Archivo ID: {archivo_id}")
+    logger.debug('WebSocket: Notificación de eliminación de archivo - Trámite ID: %s, Archivo ID: %s', tramite_id, archivo_id)
 
 
-def notify_preparacion_sent_to_tracker(preparacion_id, placa, tracker_id):
+def notify_preparacion_sent_to_tracker(preparacion_id, placa, tracker_id, filtros=None):
     """
     Notifica cuando un trámite se envía de preparación a tracker
 
@@ -146,9 +224,9 @@ def notify_preparacion_sent_to_tracker(preparacion_id, placa, tracker_id):
         preparacion_id (int): ID del trámite en preparación
         placa (str): Placa del vehículo
         tracker_id (int): ID del nuevo registro en tracker
+        filtros (dict, optional): Valores de filtro del trámite (ver filtros_evento)
     """
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(
+    encolar_evento(
         'preparacion_updates',
         {
             'type': 'preparacion_deleted',  # Lo eliminamos de la vista de preparación
@@ -159,6 +237,8 @@ def notify_preparacion_sent_to_tracker(preparacion_id, placa, tracker_id):
                 'reason': 'enviado_tracker'
             },
             'timestamp': get_timestamp()
-        }
+        },
+        filtros=filtros,
+        dimensiones=PreparacionConsumer.dimensiones_filtro
     )
-    print(f"✅ WebSocket: Trámite enviado a Tracker - Preparación ID: {preparacion_id}, Tracker ID: {tracker_id}")
\ No newline at end of file
+    logger.debug('WebSocket: Trámite enviado a Tracker - Preparación ID: %s, Tracker ID: %s', preparacion_id, tracker_id)
\ No newline at end of file
@@ -6,11 +6,14 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.pagination import PageNumberPagination
 from django.shortcuts import get_object_or_404
 from django.db import DatabaseError
-from django.db.models import Q, Subquery, OuterRef
+from django.db.models import Q, IntegerField
+from django.db.models.functions import Cast
 from datetime import datetime
 import json
 
 from proveedores.models import Proveedor
+from preparacion.models import Preparacion
+from preparacion.api.utils import actualizar_busqueda
 from user.api.permissions import RolePermission
 from departamentos.models import Departamento
 from municipios.models import Municipio
@@ -88,33 +91,32 @@ def create_proveedor(request):
 @permission_classes([IsAuthenticated, RolePermission(['admin'])])
 def list_proveedores(request):
     try:
-        # 1. Definir Subconsultas para obtener los nombres
-        # Buscamos en la tabla Departamento donde el id coincide con el valor guardado en Proveedor
-        nombre_depto_subquery = Departamento.objects.filter(
-            id_departamento=OuterRef('departamento')
-        ).values('departamento')[:1]
-
-        # Buscamos en la tabla Municipio donde el id coincide con el valor guardado en Proveedor
-        nombre_muni_subquery = Municipio.objects.filter(
-            id_municipio=OuterRef('municipio')
-        ).values('municipio')[:1]
-
-        # 2. QuerySet Base con Annotation
-        # Usamos annotate para crear campos virtuales 'nombre_depto' y 'nombre_muni'
+        # 1. QuerySet Base
+        # 'departamento' y 'municipio' guardan el ID como texto (ej: "05"), así que
+        # los nombres no se resuelven por fila con subconsultas correlacionadas:
+        # la búsqueda usa un IN no correlacionado y los nombres se agregan
+        # después de paginar, solo para la página actual.
         proveedores = Proveedor.objects.select_related('user').annotate(
-            nombre_depto=Subquery(nombre_depto_subquery),
-            nombre_muni=Subquery(nombre_muni_subquery)
+            depto_id=Cast('departamento', IntegerField()),
+            muni_id=Cast('municipio', IntegerField())
         ).all()
 
         # --- Filtro de Buscador (Search) ---
         search_query = request.query_params.get('search', None)
         if search_query:
+            deptos_coincidentes = Departamento.objects.filter(
+                departamento__icontains=search_query
+            ).values('id_departamento')
+            munis_coincidentes = Municipio.objects.filter(
+                municipio__icontains=search_query
+            ).values('id_municipio')
+
             proveedores = proveedores.filter(
                 Q(codigo_encargado__icontains=search_query) |
                 Q(nombre__icontains=search_query) |
                 Q(whatsapp__icontains=search_query) |
-                Q(nombre_depto__icontains=search_query) | # Ahora puedes buscar por nombre de texto
-                Q(nombre_muni__icontains=search_query)
+                Q(depto_id__in=deptos_coincidentes) | # Búsqueda por nombre de texto
+                Q(muni_id__in=munis_coincidentes)
             )
 
         # --- Filtros de Estado, Depto y Muni ---
@@ -145,7 +147,6 @@ def list_proveedores(request):
             proveedores = proveedores.filter(created_at__lte=end_date_inclusive)
 
         # 3. Selección de campos (Values)
-        # Incluimos los campos originales (IDs) y los anotados (Nombres)
         proveedores_data = proveedores.order_by('-id').values(
             'id',
             'codigo_encargado',
@@ -153,8 +154,8 @@ def list_proveedores(request):
             'whatsapp',
             'departamento',        # Este es el ID (ej: "05")
             'municipio',           # Este es el ID (ej: "05001")
-            'nombre_depto',        # Este es el Nombre (ej: "Antioquia")
-            'nombre_muni',         # Este es el Nombre (ej: "Medellín")
+            'depto_id',
+            'muni_id',
             'transitos_habilitados',
             'is_active',
             'created_at',
@@ -164,9 +165,26 @@ def list_proveedores(request):
         page_size = int(request.query_params.get('page_size', 10))
         paginator = PageNumberPagination()
         paginator.page_size = page_size
-        
-        paginated_queryset = paginator.paginate_queryset(proveedores_data, request)
-        return paginator.get_paginated_response(paginated_queryset)
+
+        pagina = paginator.paginate_queryset(proveedores_data, request)
+
+        # 5. Nombres de departamento y municipio solo para la página actual
+        nombres_depto = dict(Departamento.objects.filter(
+            id_departamento__in={fila['depto_id'] for fila in pagina}
+        ).values_list('id_departamento', 'departamento'))
+        nombres_muni = dict(Municipio.objects.filter(
+            id_municipio__in={fila['muni_id'] for fila in pagina}
+        ).values_list('id_municipio', 'municipio'))
+
+        resultados = []
+        for fila in pagina:
+            depto_id = fila.pop('depto_id')
+            muni_id = fila.pop('muni_id')
+            fila['nombre_depto'] = nombres_depto.get(depto_id)  # Este es el Nombre (ej: "Antioquia")
+            fila['nombre_muni'] = nombres_muni.get(muni_id)     # Este es el Nombre (ej: "Medellín")
+            resultados.append(fila)
+
+        return paginator.get_paginated_response(resultados)
 
     except Exception as e:
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -212,6 +230,8 @@ def update_proveedor(request, pk):
                 except json.JSONDecodeError:
                     data['transitos_habilitados'] = []
 
+        busqueda_anterior = (proveedor.codigo_encargado, proveedor.nombre)
+
         proveedor.codigo_encargado = data.get('codigo_encargado', proveedor.codigo_encargado)
         proveedor.nombre = data.get('nombre', proveedor.nombre)
         proveedor.whatsapp = data.get('whatsapp', proveedor.whatsapp)
@@ -224,6 +244,10 @@ def update_proveedor(request, pk):
 
         proveedor.save()
 
+        # El código y el nombre del proveedor forman parte del buscador de trámites
+        if busqueda_anterior != (proveedor.codigo_encargado, proveedor.nombre):
+            actualizar_busqueda(Preparacion.objects.filter(proveedor=proveedor))
+
         response_data = {
             "id": proveedor.id,
             "codigo_encargado": proveedor.codigo_encargado,
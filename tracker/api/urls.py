@@ -4,6 +4,7 @@ from . import views
 urlpatterns = [
     path('create/', views.create_tracker, name='create_tracker'),
     path('list/', views.list_trackers, name='list_trackers'),
+    path('stats/', views.stats_trackers, name='stats_trackers'),
     path('<int:pk>/', views.get_tracker, name='get_tracker'),
     path('<int:pk>/update/', views.update_tracker, name='update_tracker'),
     path('<int:pk>/delete/', views.delete_tracker, name='delete_tracker'),
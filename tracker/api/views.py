@@ -1,15 +1,26 @@
 # tracker/api/views.py
+import logging
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import NotFound
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.pagination import PageNumberPagination
 from django.shortcuts import get_object_or_404
 from django.db import DatabaseError, transaction
-from django.db.models import Q, Subquery, OuterRef
 from datetime import datetime
 
-from preparacion.models import Preparacion, PreparacionArchivo
+from preparacion.historial import trazabilidad
+from preparacion.models import CambioHistorial, Preparacion
+from preparacion.api.services import listar_tramites, MODULO_TRACKER
+from preparacion.resumen import (
+    bloquear_clave,
+    clave_resumen,
+    obtener_resumen,
+    registrar_alta,
+    registrar_baja,
+    registrar_cambio
+)
+from preparacion.websocket.utils import claves_modificadas, filtros_evento
 from user.api.permissions import RolePermission
 from departamentos.models import Departamento
 from municipios.models import Municipio
@@ -20,6 +31,8 @@ from tracker.websocket.utils import (
     notify_tracker_deleted
 )
 
+logger = logging.getLogger(__name__)
+
 
 # ✅ Crear trámite en tracker
 @api_view(['POST'])
@@ -99,6 +112,7 @@ def create_tracker(request):
                 paquete=data.get('paquete', ''),
                 lista_documentos=data.get('lista_documentos', [])
             )
+            registrar_alta(tracker)
 
             # 5. Construir datos para WebSocket
             tracker_data = {
@@ -119,10 +133,11 @@ def create_tracker(request):
                 'usuario': tracker.usuario.username if tracker.usuario else 'Sin asignar',
                 'created_at': tracker.created_at.isoformat(),
                 'updated_at': tracker.updated_at.isoformat(),
+                'version': tracker.version,
             }
 
             # 6. Notificar vía WebSocket
-            notify_tracker_created(tracker_data)
+            notify_tracker_created(tracker_data, filtros=filtros_evento(tracker))
 
             return Response({
                 "id": tracker.id,
@@ -133,9 +148,7 @@ def create_tracker(request):
     except ValueError as e:
         return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
-        print(f"❌ Error completo al crear tracker: {type(e).__name__}: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception('Error al crear tracker')
         return Response(
             {"error": f"Error inesperado al procesar el trámite: {str(e)}"},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -147,125 +160,23 @@ def create_tracker(request):
 @permission_classes([IsAuthenticated, RolePermission(['admin'])])
 def list_trackers(request):
     try:
-        # 1. Definir Subconsultas para obtener los nombres
-        nombre_depto_subquery = Departamento.objects.filter(
-            id_departamento=OuterRef('departamento')
-        ).values('departamento')[:1]
-
-        nombre_muni_subquery = Municipio.objects.filter(
-            id_municipio=OuterRef('municipio')
-        ).values('municipio')[:1]
-
-        # 2. QuerySet Base con Annotation (filtrado por estado_modulo=2 para Tracker)
-        trackers = Preparacion.objects.select_related(
-            'usuario', 'departamento', 'municipio', 'proveedor'
-        ).annotate(
-            nombre_depto=Subquery(nombre_depto_subquery),
-            nombre_muni=Subquery(nombre_muni_subquery)
-        ).filter(estado_modulo=2)  # CRÍTICO: Solo registros del módulo Tracker
-
-        # --- Filtros ---
-        # Filtro de búsqueda general
-        search_query = request.query_params.get('search', None)
-        if search_query:
-            trackers = trackers.filter(
-                Q(placa__icontains=search_query) |
-                Q(tipo_vehiculo__icontains=search_query) |
-                Q(usuario__username__icontains=search_query) |
-                Q(proveedor__codigo_encargado__icontains=search_query) |
-                Q(proveedor__nombre__icontains=search_query) |
-                Q(nombre_depto__icontains=search_query) |
-                Q(nombre_muni__icontains=search_query)
-            )
-
-        # Filtro de estado
-        estado_filter = request.query_params.get('estado', None)
-        if estado_filter:
-            trackers = trackers.filter(estado=estado_filter)
-
-        # Filtro de tipo de vehículo
-        tipo_vehiculo_filter = request.query_params.get('tipo_vehiculo', None)
-        if tipo_vehiculo_filter:
-            trackers = trackers.filter(tipo_vehiculo=tipo_vehiculo_filter)
-
-        # Filtro de proveedor
-        proveedor_filter = request.query_params.get('proveedor', None)
-        if proveedor_filter:
-            trackers = trackers.filter(proveedor_id=proveedor_filter)
-
-        # Filtro de departamento
-        departamento_filter = request.query_params.get('departamento', None)
-        if departamento_filter:
-            trackers = trackers.filter(departamento_id=departamento_filter)
-
-        # Filtro de municipio
-        municipio_filter = request.query_params.get('municipio', None)
-        if municipio_filter:
-            trackers = trackers.filter(municipio_id=municipio_filter)
-
-        # Filtros de fecha de recepción
-        start_date_str = request.query_params.get('start_date', None)
-        end_date_str = request.query_params.get('end_date', None)
-
-        if start_date_str:
-            start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
-            trackers = trackers.filter(fecha_recepcion_municipio__gte=start_date)
-
-        if end_date_str:
-            end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
-            trackers = trackers.filter(fecha_recepcion_municipio__lte=end_date)
-
-        # 3. Construir datos
-        trackers_data = []
-        for tracker in trackers.order_by('-created_at'):
-
-            # Obtener archivos del trámite
-            archivos = tracker.archivos.all().values(
-                'id', 'nombre_original', 'tipo_archivo', 'tamaño', 'archivo', 'created_at'
-            )
+        return listar_tramites(MODULO_TRACKER, request)
 
-            archivos_list = [{
-                "id": arch['id'],
-                "nombre": arch['nombre_original'],
-                "tipo": arch['tipo_archivo'],
-                "tamaño": arch['tamaño'],
-                "url": arch['archivo'],
-                "created_at": arch['created_at']
-            } for arch in archivos]
-
-            trackers_data.append({
-                'id': tracker.id,
-                'placa': tracker.placa,
-                'archivos': archivos_list,
-                'total_archivos': len(archivos_list),
-                'tipo_vehiculo': tracker.tipo_vehiculo,
-                'departamento': tracker.departamento_id,
-                'municipio': tracker.municipio_id,
-                'nombre_depto': tracker.nombre_depto,
-                'nombre_muni': tracker.nombre_muni,
-                'estado': tracker.estado,
-                'estado_detalle': tracker.estado_detalle,
-                'estado_tracker': tracker.estado_tracker,
-                'fecha_recepcion_municipio': tracker.fecha_recepcion_municipio,
-                'hace_dias': tracker.hace_dias,
-                'proveedor_id': tracker.proveedor_id,
-                'codigo_encargado': tracker.codigo_encargado,
-                'proveedor_nombre': tracker.proveedor.nombre if tracker.proveedor else None,
-                'usuario': tracker.usuario.username if tracker.usuario else 'Sin asignar',
-                'created_at': tracker.created_at,
-                'updated_at': tracker.updated_at,
-            })
-
-        # 4. Paginación
-        page_size = int(request.query_params.get('page_size', 10))
-        paginator = PageNumberPagination()
-        paginator.page_size = page_size
+    except Exception as e:
+        return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-        paginated_queryset = paginator.paginate_queryset(trackers_data, request)
-        return paginator.get_paginated_response(paginated_queryset)
 
+# ✅ Conteos del módulo Tracker (tabla de resumen)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, RolePermission(['admin'])])
+def stats_trackers(request):
+    try:
+        return Response(obtener_resumen(MODULO_TRACKER.estado_modulo), status=status.HTTP_200_OK)
     except Exception as e:
-        return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return Response(
+            {"error": f"Error al obtener estadísticas: {str(e)}"},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
 
 
 # ✅ Obtener trámite por ID
@@ -332,7 +243,14 @@ def update_tracker(request, pk):
         if 'proveedor' in data:
             tracker.proveedor_id = data.get('proveedor')
 
-        tracker.save()
+        # Campos que cambiaron (por WebSocket se envía solo el delta) y filtros antes/después del cambio
+        campos = tracker.campos_modificados()
+        filtros = filtros_evento(tracker)
+
+        with transaction.atomic():
+            clave_anterior = bloquear_clave(tracker)
+            tracker.save()
+            registrar_cambio(clave_anterior, tracker)
 
         response_data = {
             "id": tracker.id,
@@ -362,8 +280,9 @@ def update_tracker(request, pk):
             'usuario': tracker.usuario.username if tracker.usuario else 'Sin asignar',
             'created_at': tracker.created_at.isoformat(),
             'updated_at': tracker.updated_at.isoformat(),
+            'version': tracker.version,
         }
-        notify_tracker_updated(tracker_data)
+        notify_tracker_updated(tracker_data, claves_modificadas(campos), filtros=filtros)
 
         return Response(response_data, status=status.HTTP_200_OK)
 
@@ -389,11 +308,15 @@ def delete_tracker(request, pk):
         # Guardar datos antes de eliminar para la notificación WebSocket
         tracker_id = tracker.id
         tracker_placa = tracker.placa
+        filtros = filtros_evento(tracker)
 
-        tracker.delete()
+        with transaction.atomic():
+            clave = bloquear_clave(tracker)
+            tracker.delete()
+            registrar_baja(clave)
 
         # Notificar vía WebSocket
-        notify_tracker_deleted(tracker_id, tracker_placa)
+        notify_tracker_deleted(tracker_id, tracker_placa, filtros=filtros)
 
         return Response(
             {"message": "Tracker deleted successfully"},
@@ -414,43 +337,17 @@ def get_tracker_history(request, pk):
         # 1. Obtener el trámite principal
         tracker = get_object_or_404(Preparacion, pk=pk, estado_modulo=2)
 
-        # 2. Obtener historial del trámite
-        tracker_history = tracker.history.all().select_related('history_user')
-
-        timeline = []
-
-        # --- Procesar Historial del Tracker ---
-        for record in tracker_history:
-            cambios = []
-            if record.prev_record:
-                delta = record.diff_against(record.prev_record)
-                for change in delta.changes:
-                    cambios.append({
-                        "campo": change.field,
-                        "anterior": change.old,
-                        "nuevo": change.new
-                    })
-
-            timeline.append({
-                "fecha": record.history_date,
-                "usuario": record.history_user.username if record.history_user else "Sistema",
-                "entidad": "Trámite Tracker",
-                "evento": record.get_history_type_display(),
-                "descripcion": f"Cambio en datos del trámite {record.placa}",
-                "detalles": cambios,
-                "tipo": "tracker"
-            })
-
-        # 3. Ordenar toda la línea de tiempo por fecha descendente
-        timeline.sort(key=lambda x: x['fecha'], reverse=True)
-
+        # 2. Cambios ya materializados del trámite (una consulta por página, ?cursor=&page_size=)
         return Response({
             "tracker_id": pk,
             "placa_actual": tracker.placa,
-            "total_eventos": len(timeline),
-            "trazabilidad_completa": timeline
+            **trazabilidad(request, pk, {
+                CambioHistorial.ENTIDAD_TRAMITE: ("Trámite Tracker", "tracker", "Cambio en datos del trámite {referencia}"),
+            })
         }, status=status.HTTP_200_OK)
 
+    except NotFound:
+        raise
     except Exception as e:
         return Response(
             {"error": f"Error al generar trazabilidad: {str(e)}"},
@@ -474,7 +371,9 @@ def finalizar_tracker(request, pk):
     try:
         with transaction.atomic():
             # 1. Obtener el trámite del módulo Tracker
-            tracker = get_object_or_404(Preparacion, pk=pk, estado_modulo=2)
+            tracker = get_object_or_404(Preparacion.objects.select_for_update(), pk=pk, estado_modulo=2)
+            clave_anterior = clave_resumen(tracker)
+            tracker.bloquear_version()  # leído con select_for_update
 
             # 2. Guardar datos del tracker antes de la transición (para notificaciones)
             tracker_data_before = {
@@ -491,7 +390,9 @@ def finalizar_tracker(request, pk):
             if 'estado_detalle' in request.data:
                 tracker.estado_detalle = request.data.get('estado_detalle', '')
 
+            filtros = filtros_evento(tracker)  # antes de guardar: valores anteriores y nuevos
             tracker.save()
+            registrar_cambio(clave_anterior, tracker)
 
             # 4. Construir datos completos para el módulo Finalizados (WebSocket)
             finalizado_data = {
@@ -513,15 +414,18 @@ def finalizar_tracker(request, pk):
                 'usuario': tracker.usuario.username if tracker.usuario else 'Sin asignar',
                 'created_at': tracker.created_at.isoformat(),
                 'updated_at': tracker.updated_at.isoformat(),
+                'version': tracker.version,
             }
 
             # 5. Emitir notificaciones WebSocket
             # 5.1. Notificar al módulo Tracker que el registro fue eliminado
-            notify_tracker_deleted(tracker_data_before['id'], tracker_data_before['placa'])
+            notify_tracker_deleted(
+                tracker_data_before['id'], tracker_data_before['placa'], filtros=filtros
+            )
 
             # 5.2. Notificar al módulo Finalizados que se creó un nuevo registro
             from finalizados.websocket.utils import notify_finalizado_created
-            notify_finalizado_created(finalizado_data)
+            notify_finalizado_created(finalizado_data, filtros=filtros)
 
             return Response({
                 "message": "Trámite finalizado exitosamente",
@@ -532,9 +436,7 @@ def finalizar_tracker(request, pk):
             }, status=status.HTTP_200_OK)
 
     except Exception as e:
-        print(f"❌ Error al finalizar tracker: {type(e).__name__}: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception('Error al finalizar tracker')
         return Response(
             {"error": f"Error al finalizar el trámite: {str(e)}"},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
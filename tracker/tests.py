@@ -1,3 +1,8 @@
 from django.test import TestCase
 
-# Create your tests here.
+from preparacion.tests import ConsultasListadoMixin
+
+
+class ListTrackersConsultasTests(ConsultasListadoMixin, TestCase):
+    url = '/api/tracker/list/'
+    estado_modulo = 2
@@ -1,9 +1,18 @@
 # tracker/websocket/consumers.py
 import json
+import logging
 from channels.generic.websocket import AsyncWebsocketConsumer
 
+from backend.logs import RegistroEventosMixin
+from backend.registro_eventos import reanudar, ultima_secuencia
+from preparacion.api.services import MODULO_TRACKER
+from preparacion.websocket.filtros import SuscripcionFiltroMixin
+from preparacion.websocket.resync import responder_resync
 
-class TrackerConsumer(AsyncWebsocketConsumer):
+logger = logging.getLogger(__name__)
+
+
+class TrackerConsumer(RegistroEventosMixin, SuscripcionFiltroMixin, AsyncWebsocketConsumer):
     """
     WebSocket Consumer para actualizaciones en tiempo real del módulo Tracker.
 
@@ -12,6 +21,8 @@ class TrackerConsumer(AsyncWebsocketConsumer):
     - Trámite actualizado
     - Trámite eliminado
     """
+    grupo_modulo = 'tracker_updates'
+    tipo_eliminado = 'tracker_deleted'
 
     async def connect(self):
         """Conecta al cliente y lo añade al grupo de actualizaciones"""
@@ -23,16 +34,20 @@ class TrackerConsumer(AsyncWebsocketConsumer):
 
         await self.accept()
 
-        # Enviar mensaje de confirmación de conexión
+        # Enviar mensaje de confirmación de conexión (con la última secuencia, para reanudar después)
         await self.send(text_data=json.dumps({
             'type': 'connection_established',
-            'message': '✅ Conectado a actualizaciones de Tracker en tiempo real'
+            'message': '✅ Conectado a actualizaciones de Tracker en tiempo real',
+            'seq': await ultima_secuencia("tracker_updates")
         }))
 
+        # Reenviar los eventos perdidos si el cliente se reconecta con ?resume_from=<seq>
+        await reanudar(self, "tracker_updates")
+
     async def disconnect(self, close_code):
-        """Desconecta al cliente del grupo de actualizaciones"""
+        """Desconecta al cliente del grupo de actualizaciones (el del módulo o el de su filtro)"""
         await self.channel_layer.group_discard(
-            "tracker_updates",
+            self.grupo_actual(),
             self.channel_name
         )
 
@@ -40,29 +55,49 @@ class TrackerConsumer(AsyncWebsocketConsumer):
         """Maneja mensajes recibidos del cliente"""
         try:
             data = json.loads(text_data)
+            if data.get('type') == 'resync':
+                # El cliente detectó un hueco de versiones: reenviar los registros completos
+                await responder_resync(self, MODULO_TRACKER, data)
+                return
+            if data.get('type') == 'subscribe_filter':
+                # Recibir solo los eventos de trámites que coinciden con el filtro
+                await self.suscribir_filtro(data)
+                return
             # Aquí puedes manejar mensajes del cliente si es necesario
-            print(f"📩 Mensaje recibido del cliente: {data}")
+            logger.debug('Mensaje recibido del cliente: %s', data)
         except json.JSONDecodeError:
-            print("⚠️ Error al decodificar JSON del cliente")
+            logger.warning('Error al decodificar JSON del cliente')
 
     # Handlers para eventos del grupo
     async def tracker_created(self, event):
         """Envía notificación de trámite creado"""
+        if not await self.pasa_filtro(event):
+            return
+
         await self.send(text_data=json.dumps({
             'type': 'tracker_created',
-            'data': event['data']
+            'data': event['data'],
+            'seq': event.get('seq')
         }))
 
     async def tracker_updated(self, event):
         """Envía notificación de trámite actualizado"""
+        if not await self.pasa_filtro(event):
+            return
+
         await self.send(text_data=json.dumps({
             'type': 'tracker_updated',
-            'data': event['data']
+            'data': event['data'],
+            'seq': event.get('seq')
         }))
 
     async def tracker_deleted(self, event):
         """Envía notificación de trámite eliminado"""
+        if not await self.pasa_filtro(event):
+            return
+
         await self.send(text_data=json.dumps({
             'type': 'tracker_deleted',
-            'data': event['data']
+            'data': event['data'],
+            'seq': event.get('seq')
         }))
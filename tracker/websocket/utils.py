@@ -1,42 +1,47 @@
 # tracker/websocket/utils.py
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
+from backend.notificaciones import construir_delta, encolar_evento
+from tracker.websocket.consumers import TrackerConsumer
 
 
-def notify_tracker_created(tracker_data):
+def notify_tracker_created(tracker_data, filtros=None):
     """
     Notifica a todos los clientes conectados que se creó un nuevo trámite en Tracker.
+    `filtros` (ver filtros_evento) envía el evento también a los grupos por filtro.
     """
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(
+    encolar_evento(
         "tracker_updates",
         {
             "type": "tracker_created",
             "data": tracker_data
-        }
+        },
+        filtros=filtros,
+        dimensiones=TrackerConsumer.dimensiones_filtro
     )
 
 
-def notify_tracker_updated(tracker_data):
+def notify_tracker_updated(tracker_data, claves=None, filtros=None):
     """
     Notifica a todos los clientes conectados que se actualizó un trámite en Tracker.
+    Si se indican `claves` se envía solo el delta de esas claves con la versión.
+    `filtros` (ver filtros_evento) envía el evento también a los grupos por filtro.
     """
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(
+    encolar_evento(
         "tracker_updates",
         {
             "type": "tracker_updated",
-            "data": tracker_data
-        }
+            "data": tracker_data if claves is None else construir_delta(tracker_data, claves)
+        },
+        filtros=filtros,
+        dimensiones=TrackerConsumer.dimensiones_filtro
     )
 
 
-def notify_tracker_deleted(tracker_id, tracker_placa):
+def notify_tracker_deleted(tracker_id, tracker_placa, filtros=None):
     """
     Notifica a todos los clientes conectados que se eliminó un trámite en Tracker.
+    `filtros` (ver filtros_evento) envía el evento también a los grupos por filtro.
     """
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(
+    encolar_evento(
         "tracker_updates",
         {
             "type": "tracker_deleted",
@@ -44,5 +49,7 @@ def notify_tracker_deleted(tracker_id, tracker_placa):
                 "id": tracker_id,
                 "placa": tracker_placa
             }
-        }
+        },
+        filtros=filtros,
+        dimensiones=TrackerConsumer.dimensiones_filtro
     )
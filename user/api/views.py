@@ -1,3 +1,4 @@
+import logging
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
@@ -8,10 +9,15 @@ from django.contrib.auth.hashers import make_password
 from django.db import DatabaseError
 from user.models import User
 from .permissions import RolePermission
+from preparacion.models import Preparacion
+from preparacion.api.utils import actualizar_busqueda
+from backend.middleware import invalidar_usuario
 
 from django.db.models import Q # Importar Q para búsquedas complejas
 from datetime import datetime  # Importar datetime para manejar fechas
 
+logger = logging.getLogger(__name__)
+
 # Obtener usuario autenticado
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -95,8 +101,6 @@ def create_user(request):
 @permission_classes([IsAuthenticated, RolePermission(['admin'])])
 def list_users(request):
     try:
-        print("Rol del usuario:", request.user.role)
-
         # 1. Obtener todos los usuarios como un queryset
         users = User.objects.all()
 
@@ -118,7 +122,7 @@ def list_users(request):
         if role_filter:
             # Filtra usuarios por rol específico
             users = users.filter(role=role_filter)
-            print(f"Filtrando por rol: {role_filter}")
+            logger.debug('Filtrando por rol: %s', role_filter)
 
         # --- Filtro por Estado (Status/is_active) ---
         status_filter = request.query_params.get('status', None)
@@ -126,7 +130,7 @@ def list_users(request):
             # Convertir '1' a True y '0' a False
             is_active_bool = status_filter == '1'
             users = users.filter(is_active=is_active_bool)
-            print(f"Filtrando por estado activo: {is_active_bool}")
+            logger.debug('Filtrando por estado activo: %s', is_active_bool)
 
         # --- Filtros de Fecha de Inicio y Fecha de Fin (Date Range) ---
         start_date_str = request.query_params.get('start_date', None)
@@ -138,7 +142,7 @@ def list_users(request):
                 start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
                 # Filtra usuarios cuya fecha de unión sea mayor o igual a la fecha de inicio
                 users = users.filter(date_joined__gte=start_date)
-                print(f"Filtrando desde fecha: {start_date}")
+                logger.debug('Filtrando desde fecha: %s', start_date)
             except ValueError:
                 return Response(
                     {"error": "El formato de la fecha de inicio debe ser YYYY-MM-DD."},
@@ -154,18 +158,14 @@ def list_users(request):
                 from datetime import datetime, timedelta
                 end_date_inclusive = datetime.combine(end_date, datetime.max.time())
                 users = users.filter(date_joined__lte=end_date_inclusive)
-                print(f"Filtrando hasta fecha: {end_date}")
+                logger.debug('Filtrando hasta fecha: %s', end_date)
             except ValueError:
                 return Response(
                     {"error": "El formato de la fecha de fin debe ser YYYY-MM-DD."},
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-        # 3. Contar total de usuarios después de aplicar filtros (antes de paginar)
-        total_count = users.count()
-        print(f"Total de usuarios después de filtros: {total_count}")
-                
-        # 4. Seleccionar los campos a devolver (values) y Ordenar
+        # 3. Seleccionar los campos a devolver (values) y Ordenar
         # Se ordena por 'id' para asegurar un orden consistente antes de paginar
         users = users.order_by('-id').values(  # Cambiado a '-id' para mostrar los más recientes primero
             'id', 
@@ -178,7 +178,7 @@ def list_users(request):
             'date_joined'
         )
 
-        # 5. Aplicar paginación manualmente
+        # 4. Aplicar paginación manualmente (el paginador cuenta el total)
         page_size_param = request.query_params.get('page_size', 10)
         
         # Asegurarse de que page_size es un entero válido
@@ -187,22 +187,14 @@ def list_users(request):
         except (ValueError, TypeError):
             page_size_int = 10
         
-        print(f"Tamaño de página solicitado: {page_size_int}")
-        
         paginator = PageNumberPagination()
         paginator.page_size = page_size_int
         paginated_users = paginator.paginate_queryset(users, request)
 
-        # Imprimir información de paginación
-        print(f"Página actual: {request.query_params.get('page', 1)}")
-        print(f"Usuarios en esta página: {len(paginated_users) if paginated_users else 0}")
-
         return paginator.get_paginated_response(paginated_users)
 
     except Exception as e:
-        print(f"Error en list_users: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception('Error en list_users')
         return Response(
             {"error": f"Error fetching users: {str(e)}"},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -236,6 +228,7 @@ def get_user(request, pk):
 def update_user(request, pk):
     try:
         user = get_object_or_404(User, pk=pk)
+        username_anterior = user.username
         user.username = request.data.get('username', user.username)
         user.first_name = request.data.get('first_name', user.first_name)
         user.last_name = request.data.get('last_name', user.last_name)
@@ -252,6 +245,13 @@ def update_user(request, pk):
 
         user.save()
 
+        # Los WebSockets deben ver el rol/estado nuevo en el próximo handshake
+        invalidar_usuario(user.id)
+
+        # El username forma parte del buscador de trámites
+        if username_anterior != user.username:
+            actualizar_busqueda(Preparacion.objects.filter(usuario=user))
+
         data = {
             "id": user.id,
             "username": user.username,
@@ -279,7 +279,9 @@ def update_user(request, pk):
 def delete_user(request, pk):
     try:
         user = get_object_or_404(User, pk=pk)
+        user_id = user.id
         user.delete()
+        invalidar_usuario(user_id)
         return Response(
             {"message": "User deleted successfully"},
             status=status.HTTP_204_NO_CONTENT
@@ -1,3 +1,133 @@
-from django.test import TestCase
+import asyncio
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase, override_settings
+
+from backend.middleware import CacheUsuarios
+from user.websocket.consumers import AgregadorPresencia
+from user.websocket.presencia import PresenciaLocal
+
+
+@override_settings(PRESENCIA={'INTERVALO_DIFUSION': 0.01})
+class AgregadorPresenciaTests(SimpleTestCase):
+    """Difusión agrupada de entradas y salidas de usuarios"""
+
+    def difundir(self, acciones, al_enviar=None):
+        """Ejecuta `acciones(agregador)` y retorna los users_delta enviados al grupo"""
+        enviados = []
+        agregador = AgregadorPresencia('usuarios_prueba')
+
+        async def group_send(grupo, mensaje):
+            enviados.append(mensaje)
+            await asyncio.sleep(0)
+            if al_enviar and len(enviados) == 1:
+                # Cambio que llega mientras se espera el envío del primer delta
+                al_enviar(agregador)
+
+        async def total():
+            return 0
+
+        async def escenario():
+            acciones(agregador)
+            while agregador.tarea is not None and not agregador.tarea.done():
+                await asyncio.sleep(0.01)
+
+        capa = mock.Mock(group_send=group_send)
+        with mock.patch('user.websocket.consumers.get_channel_layer', return_value=capa), \
+                mock.patch('user.websocket.consumers.presencia_async', return_value=total):
+            asyncio.run(escenario())
+        return enviados
+
+    def test_agrupa_cambios_del_intervalo(self):
+        enviados = self.difundir(lambda agregador: (
+            agregador.conectado({'id': 1, 'name': 'uno'}),
+            agregador.conectado({'id': 2, 'name': 'dos'}),
+            agregador.desconectado(2),
+        ))
+        self.assertEqual(len(enviados), 1)
+        self.assertEqual(enviados[0]['joined'], [{'id': 1, 'name': 'uno'}])
+        self.assertEqual(enviados[0]['left'], [])
+
+    def test_cambio_durante_el_envio_no_se_pierde(self):
+        enviados = self.difundir(
+            lambda agregador: agregador.conectado({'id': 1, 'name': 'uno'}),
+            al_enviar=lambda agregador: agregador.desconectado(1),
+        )
+        self.assertEqual(len(enviados), 2)
+        self.assertEqual(enviados[1]['left'], [1])
+
+
+class CacheUsuariosTests(SimpleTestCase):
+    """Cache de usuarios del handshake WebSocket"""
+
+    def test_invalidar(self):
+        cache = CacheUsuarios(tamano=10, ttl=60)
+        cache.guardar(1, 'usuario')
+        self.assertEqual(cache.obtener('1'), 'usuario')
+        cache.invalidar(1)
+        self.assertIsNone(cache.obtener(1))
+
+    def test_sin_suscripcion_no_usa_el_cache(self):
+        # Redis inalcanzable: las invalidaciones de otros workers no llegarían
+        cache = CacheUsuarios(tamano=10, ttl=60, backend='redis', redis_url='redis://127.0.0.1:1/0')
+        with self.assertLogs('backend.middleware', 'WARNING'):
+            cache.guardar(1, 'usuario')
+            cache.oyente.join(timeout=0.5)
+        self.assertIsNone(cache.obtener(1))
+
+
+class PresenciaLocalTests(SimpleTestCase):
+    """Vencimiento de conexiones y varias conexiones por usuario"""
+
+    def setUp(self):
+        self.ahora = 1000.0
+        patcher = mock.patch('user.websocket.presencia.time.time', side_effect=lambda: self.ahora)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.presencia = PresenciaLocal(ttl=30)
+
+    def test_conexion_sin_latido_vence(self):
+        self.assertTrue(self.presencia.conectar('canal-1', 7, {'id': 7}))
+        self.ahora += 29
+        self.assertTrue(self.presencia.en_linea(7))
+        self.ahora += 1
+        self.assertFalse(self.presencia.en_linea(7))
+        self.assertEqual(self.presencia.usuarios(), [])
+        self.assertEqual(self.presencia.total(), 0)
+        # Al volver a conectarse vuelve a estar en línea
+        self.assertTrue(self.presencia.conectar('canal-2', 7, {'id': 7}))
+
+    def test_latido_renueva_el_vencimiento(self):
+        self.presencia.conectar('canal-1', 7, {'id': 7})
+        self.ahora += 20
+        self.presencia.latido('canal-1', 7)
+        self.ahora += 20
+        self.assertTrue(self.presencia.en_linea(7))
+        self.ahora += 10
+        self.assertFalse(self.presencia.en_linea(7))
+
+    def test_varias_conexiones_del_mismo_usuario(self):
+        self.assertTrue(self.presencia.conectar('canal-1', 7, {'id': 7}))
+        self.assertFalse(self.presencia.conectar('canal-2', 7, {'id': 7}))
+        self.presencia.conectar('canal-3', 8, {'id': 8})
+        self.assertEqual(self.presencia.total(), 2)
+
+        # Cerrar una pestaña no lo saca de línea; cerrar la última sí
+        self.assertFalse(self.presencia.desconectar('canal-1', 7))
+        self.assertTrue(self.presencia.en_linea(7))
+        self.assertEqual(sorted(datos['id'] for datos in self.presencia.usuarios()), [7, 8])
+        self.assertTrue(self.presencia.desconectar('canal-2', 7))
+        self.assertFalse(self.presencia.en_linea(7))
+        self.assertEqual(self.presencia.usuarios(), [{'id': 8}])
+
+    def test_desconectar_con_la_otra_conexion_vencida(self):
+        # El worker de canal-1 murió sin desconectar; canal-2 sigue con latidos
+        self.presencia.conectar('canal-1', 7, {'id': 7})
+        self.presencia.conectar('canal-2', 7, {'id': 7})
+        self.ahora += 20
+        self.presencia.latido('canal-2', 7)
+        self.ahora += 20
+        self.assertEqual(self.presencia.total(), 1)
+        self.assertTrue(self.presencia.desconectar('canal-2', 7))
+        self.assertEqual(self.presencia.total(), 0)
+        self.assertFalse(self.presencia.desconectar('canal-2', 7))
@@ -1,30 +1,110 @@
 # user/websocket/consumers.py
+import asyncio
 import json
+import logging
+from asgiref.sync import sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
+from channels.layers import get_channel_layer
 from channels.db import database_sync_to_async
 from django.contrib.auth import get_user_model
 
+from backend.logs import RegistroEventosMixin
+from .presencia import get_config, get_presencia
+
 User = get_user_model()
+logger = logging.getLogger(__name__)
 
 
-class UsersOnlineConsumer(AsyncWebsocketConsumer):
-    """Consumer para manejar usuarios conectados en tiempo real."""
-    
-    connected_users = {}
+def presencia_async(metodo):
+    """Ejecuta un método del backend de presencia fuera del event loop"""
+    return sync_to_async(getattr(get_presencia(), metodo), thread_sensitive=False)
+
+
+class AgregadorPresencia:
+    """
+    Junta las entradas y salidas de usuarios de este proceso durante
+    INTERVALO_DIFUSION y las envía al grupo como un solo `users_delta`.
+
+    Al inicio de turno, con muchos operadores conectándose a la vez, cada
+    cliente recibe unos pocos deltas en lugar de la lista completa por cada
+    conexión. La lista completa solo se envía a quien la pide
+    (`get_connected_users`).
+    """
+
+    def __init__(self, grupo):
+        self.grupo = grupo
+        self.pendientes = {}  # user_id -> [primer cambio, último cambio, user_data]
+        self.tarea = None
+
+    def conectado(self, user_data):
+        self.registrar(user_data['id'], 'joined', user_data)
+
+    def desconectado(self, user_id):
+        self.registrar(user_id, 'left', None)
+
+    def registrar(self, user_id, cambio, user_data):
+        if user_id in self.pendientes:
+            self.pendientes[user_id][1:] = [cambio, user_data]
+        else:
+            self.pendientes[user_id] = [cambio, cambio, user_data]
+        if self.tarea is None or self.tarea.done():
+            self.tarea = asyncio.create_task(self.vaciar())
+
+    async def vaciar(self):
+        """
+        Espera el intervalo y envía el delta neto acumulado. Los cambios que
+        llegan mientras se envía (la tarea sigue viva y registrar() no programa
+        otra) se envían en la siguiente vuelta.
+        """
+        while self.pendientes:
+            await asyncio.sleep(get_config('INTERVALO_DIFUSION', 1.0))
+            pendientes, self.pendientes = self.pendientes, {}
+
+            joined, left = [], []
+            for user_id, (primero, ultimo, user_data) in pendientes.items():
+                if primero == 'joined' and ultimo == 'left':
+                    # Entró y salió dentro del intervalo: los demás nunca lo vieron
+                    continue
+                if ultimo == 'joined':
+                    joined.append(user_data)
+                else:
+                    left.append(user_id)
+            if joined or left:
+                await self.enviar(joined, left)
+
+    async def enviar(self, joined, left):
+        try:
+            total = await presencia_async('total')()
+            await get_channel_layer().group_send(self.grupo, {
+                'type': 'users_delta',
+                'joined': joined,
+                'left': left,
+                'total': total
+            })
+        except Exception as e:
+            logger.warning('Error enviando cambios de presencia: %s', e)
+
+
+agregador = AgregadorPresencia('users_online')
+
+
+class UsersOnlineConsumer(RegistroEventosMixin, AsyncWebsocketConsumer):
+    """
+    Consumer para manejar usuarios conectados en tiempo real.
+
+    La presencia vive en el backend compartido (ver presencia.py), no en el
+    proceso: cada conexión se registra con un TTL que se renueva con un latido
+    periódico mientras el socket está abierto.
+    """
     
     async def connect(self):
         """Se ejecuta cuando un cliente se conecta al WebSocket"""
-        print("=" * 50)
-        print("🔵 [UsersOnlineConsumer] Intento de conexión...")
-        
         try:
             # Grupo general de usuarios en línea
             self.room_group_name = 'users_online'
             
             # Obtener usuario del scope
             self.user = self.scope.get('user')
-            print(f"🔵 Usuario: {self.user}")
-            print(f"🔵 Autenticado: {self.user.is_authenticated if self.user else 'No user'}")
             
             # Únete al grupo
             await self.channel_layer.group_add(
@@ -34,30 +114,27 @@ class UsersOnlineConsumer(AsyncWebsocketConsumer):
             
             # IMPORTANTE: Acepta la conexión SIEMPRE
             await self.accept()
-            print("✅ Conexión WebSocket ACEPTADA")
             
             # Obtener datos del usuario
             user_data = None
+            self.tarea_latido = None
             if self.user and self.user.is_authenticated:
                 try:
                     user_data = await self.get_user_data(self.user)
                     
-                    # Registrar conexión
-                    UsersOnlineConsumer.connected_users[self.channel_name] = {
-                        'user_id': self.user.id,
-                        'user_data': user_data,
-                        'channel_name': self.channel_name
-                    }
+                    # Registrar conexión en la presencia compartida
+                    nuevo = await presencia_async('conectar')(self.channel_name, self.user.id, user_data)
+                    self.tarea_latido = asyncio.create_task(self.latir())
                     
-                    print(f"✅ Usuario registrado: {user_data['name']} (ID: {self.user.id})")
-                    print(f"📊 Total usuarios conectados: {len(UsersOnlineConsumer.connected_users)}")
+                    logger.debug('Usuario registrado: %s (ID: %s)', user_data['name'], self.user.id)
                     
-                    # Notificar a todos
-                    await self.broadcast_users_update()
+                    # Notificar a todos (solo si es su primera conexión)
+                    if nuevo:
+                        agregador.conectado(user_data)
                 except Exception as e:
-                    print(f"⚠️ Error al obtener datos del usuario: {e}")
+                    logger.warning('Error al obtener datos del usuario: %s', e)
             else:
-                print("⚠️ Usuario no autenticado o anónimo")
+                logger.debug('Usuario no autenticado o anónimo')
             
             # Enviar mensaje de bienvenida
             await self.send(text_data=json.dumps({
@@ -68,25 +145,19 @@ class UsersOnlineConsumer(AsyncWebsocketConsumer):
                 'timestamp': self.get_timestamp()
             }))
             
-            print("=" * 50)
-            
-        except Exception as e:
-            print(f"❌ ERROR EN CONNECT: {type(e).__name__}: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            print("=" * 50)
+        except Exception:
+            logger.exception('Error en connect de UsersOnlineConsumer')
     
     async def disconnect(self, close_code):
         """Se ejecuta cuando un cliente se desconecta"""
-        print(f"🔴 Desconexión - Código: {close_code}")
-        
         try:
-            if self.channel_name in UsersOnlineConsumer.connected_users:
-                user_info = UsersOnlineConsumer.connected_users[self.channel_name]
-                print(f"❌ Usuario desconectado: {user_info['user_data']['name']}")
+            if getattr(self, 'tarea_latido', None):
+                self.tarea_latido.cancel()
                 
-                del UsersOnlineConsumer.connected_users[self.channel_name]
-                await self.broadcast_users_update()
+                fuera = await presencia_async('desconectar')(self.channel_name, self.user.id)
+                logger.debug('Usuario desconectado: %s (código %s)', self.user, close_code)
+                if fuera:
+                    agregador.desconectado(self.user.id)
             
             await self.channel_layer.group_discard(
                 self.room_group_name,
@@ -94,17 +165,17 @@ class UsersOnlineConsumer(AsyncWebsocketConsumer):
             )
             
         except Exception as e:
-            print(f"❌ Error en disconnect: {e}")
+            logger.warning('Error en disconnect: %s', e)
     
     async def receive(self, text_data):
         """Recibe mensajes del WebSocket desde el cliente"""
-        print(f"📨 Mensaje recibido: {text_data}")
-        
         try:
             text_data_json = json.loads(text_data)
             message_type = text_data_json.get('type')
             
             if message_type == 'ping':
+                if getattr(self, 'tarea_latido', None):
+                    await presencia_async('latido')(self.channel_name, self.user.id)
                 await self.send(text_data=json.dumps({
                     'type': 'pong',
                     'message': 'pong',
@@ -115,38 +186,36 @@ class UsersOnlineConsumer(AsyncWebsocketConsumer):
                 await self.send_connected_users()
             
         except Exception as e:
-            print(f"❌ Error en receive: {e}")
+            logger.warning('Error en receive: %s', e)
             await self.send(text_data=json.dumps({
                 'type': 'error',
                 'message': str(e),
                 'timestamp': self.get_timestamp()
             }))
     
-    async def users_update(self, event):
-        """Envía actualización de usuarios conectados a todos"""
+    async def latir(self):
+        """Renueva el TTL de esta conexión mientras el socket siga abierto"""
+        intervalo = get_config('INTERVALO_LATIDO', 30)
+        while True:
+            await asyncio.sleep(intervalo)
+            try:
+                await presencia_async('latido')(self.channel_name, self.user.id)
+            except Exception as e:
+                logger.warning('Error renovando presencia: %s', e)
+    
+    async def users_delta(self, event):
+        """Envía a todos los usuarios que entraron y salieron en el último intervalo"""
         await self.send(text_data=json.dumps({
-            'type': 'users_update',
-            'users': event['users'],
+            'type': 'users_delta',
+            'joined': event['joined'],
+            'left': event['left'],
             'total': event['total'],
             'timestamp': self.get_timestamp()
         }))
     
-    async def broadcast_users_update(self):
-        """Envía la lista actualizada de usuarios a todos los conectados"""
-        users_list = self.get_unique_users_list()
-        
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'users_update',
-                'users': users_list,
-                'total': len(users_list)
-            }
-        )
-    
     async def send_connected_users(self):
         """Envía la lista de usuarios conectados solo al solicitante"""
-        users_list = self.get_unique_users_list()
+        users_list = await presencia_async('usuarios')()
         
         await self.send(text_data=json.dumps({
             'type': 'users_update',
@@ -155,16 +224,6 @@ class UsersOnlineConsumer(AsyncWebsocketConsumer):
             'timestamp': self.get_timestamp()
         }))
     
-    def get_unique_users_list(self):
-        """Obtiene lista única de usuarios"""
-        unique_users = {}
-        for channel_data in UsersOnlineConsumer.connected_users.values():
-            user_id = channel_data['user_id']
-            if user_id not in unique_users:
-                unique_users[user_id] = channel_data['user_data']
-        
-        return list(unique_users.values())
-    
     @database_sync_to_async
     def get_user_data(self, user):
         """Obtiene datos del usuario"""
@@ -0,0 +1,187 @@
+# user/websocket/presencia.py
+"""
+Presencia de usuarios en línea compartida entre workers.
+
+Cada conexión WebSocket se registra con un vencimiento (ahora + TTL) que el
+consumer renueva con un latido periódico. Si un worker muere sin ejecutar
+`disconnect`, sus conexiones vencen solas.
+
+Backends (settings.PRESENCIA['BACKEND']):
+- 'redis': estructuras compartidas por todos los workers
+    presencia:usuarios         ZSET user_id -> vencimiento (usuarios en línea)
+    presencia:usuario:<id>     ZSET canal -> vencimiento (conexiones del usuario)
+    presencia:datos            HASH user_id -> JSON con los datos del usuario
+- 'local': diccionarios en memoria (un solo proceso; desarrollo y pruebas)
+"""
+import json
+import threading
+import time
+
+from django.conf import settings
+
+
+def get_config(clave, defecto):
+    """Lee una opción de settings.PRESENCIA"""
+    return getattr(settings, 'PRESENCIA', {}).get(clave, defecto)
+
+
+class PresenciaLocal:
+    """Presencia en memoria del proceso"""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.conexiones = {}  # user_id -> {canal: vencimiento}
+        self.datos = {}  # user_id -> user_data
+
+    def purgar(self, user_id, ahora):
+        """Elimina las conexiones vencidas del usuario (con el lock tomado)"""
+        canales = self.conexiones.get(user_id, {})
+        for canal in [canal for canal, vence in canales.items() if vence <= ahora]:
+            del canales[canal]
+        if not canales:
+            self.conexiones.pop(user_id, None)
+            self.datos.pop(user_id, None)
+
+    def conectar(self, canal, user_id, user_data):
+        """Registra la conexión. Retorna True si el usuario pasó a estar en línea"""
+        ahora = time.time()
+        with self.lock:
+            self.purgar(user_id, ahora)
+            nuevo = user_id not in self.conexiones
+            self.conexiones.setdefault(user_id, {})[canal] = ahora + self.ttl
+            self.datos[user_id] = user_data
+        return nuevo
+
+    def latido(self, canal, user_id):
+        """Renueva el vencimiento de la conexión"""
+        with self.lock:
+            if user_id in self.conexiones:
+                self.conexiones[user_id][canal] = time.time() + self.ttl
+
+    def desconectar(self, canal, user_id):
+        """Quita la conexión. Retorna True si el usuario quedó sin conexiones (fuera de línea)"""
+        with self.lock:
+            canales = self.conexiones.get(user_id)
+            if canales is None:
+                return False
+            canales.pop(canal, None)
+            self.purgar(user_id, time.time())
+            return user_id not in self.conexiones
+
+    def en_linea(self, user_id):
+        with self.lock:
+            self.purgar(user_id, time.time())
+            return user_id in self.conexiones
+
+    def usuarios(self):
+        """Datos de los usuarios en línea (uno por usuario)"""
+        ahora = time.time()
+        with self.lock:
+            for user_id in list(self.conexiones):
+                self.purgar(user_id, ahora)
+            return list(self.datos.values())
+
+    def total(self):
+        ahora = time.time()
+        with self.lock:
+            for user_id in list(self.conexiones):
+                self.purgar(user_id, ahora)
+            return len(self.conexiones)
+
+
+class PresenciaRedis:
+    """Presencia en Redis, compartida por todos los workers"""
+
+    USUARIOS = 'presencia:usuarios'
+    DATOS = 'presencia:datos'
+
+    # Quita el canal y, si el usuario ya no tiene conexiones vigentes, lo saca de
+    # línea. En Lua para que una conexión simultánea en otro worker no se pierda.
+    DESCONECTAR = """
+    redis.call('ZREM', KEYS[1], ARGV[1])
+    redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[2])
+    if redis.call('ZCARD', KEYS[1]) == 0 then
+        redis.call('ZREM', KEYS[2], ARGV[3])
+        redis.call('HDEL', KEYS[3], ARGV[3])
+        return 1
+    end
+    return 0
+    """
+
+    def __init__(self, url, ttl):
+        import redis
+        self.cliente = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.script_desconectar = self.cliente.register_script(self.DESCONECTAR)
+
+    @staticmethod
+    def clave_usuario(user_id):
+        return f'presencia:usuario:{user_id}'
+
+    def conectar(self, canal, user_id, user_data):
+        ahora = time.time()
+        vence = ahora + self.ttl
+        pipe = self.cliente.pipeline()
+        pipe.zscore(self.USUARIOS, user_id)
+        pipe.zadd(self.clave_usuario(user_id), {canal: vence})
+        pipe.expire(self.clave_usuario(user_id), int(self.ttl) * 2)
+        pipe.zadd(self.USUARIOS, {user_id: vence})
+        pipe.hset(self.DATOS, user_id, json.dumps(user_data))
+        anterior = pipe.execute()[0]
+        return anterior is None or anterior <= ahora
+
+    def latido(self, canal, user_id):
+        vence = time.time() + self.ttl
+        pipe = self.cliente.pipeline()
+        pipe.zadd(self.clave_usuario(user_id), {canal: vence}, xx=True)
+        pipe.expire(self.clave_usuario(user_id), int(self.ttl) * 2)
+        pipe.zadd(self.USUARIOS, {user_id: vence}, gt=True)
+        pipe.execute()
+
+    def desconectar(self, canal, user_id):
+        return bool(self.script_desconectar(
+            keys=[self.clave_usuario(user_id), self.USUARIOS, self.DATOS],
+            args=[canal, time.time(), user_id]
+        ))
+
+    def en_linea(self, user_id):
+        vence = self.cliente.zscore(self.USUARIOS, user_id)
+        return vence is not None and vence > time.time()
+
+    def purgar(self):
+        """Saca de línea a los usuarios vencidos (worker caído sin disconnect)"""
+        ahora = time.time()
+        vencidos = self.cliente.zrangebyscore(self.USUARIOS, '-inf', ahora)
+        if vencidos:
+            pipe = self.cliente.pipeline()
+            pipe.zremrangebyscore(self.USUARIOS, '-inf', ahora)
+            pipe.hdel(self.DATOS, *vencidos)
+            pipe.execute()
+
+    def usuarios(self):
+        self.purgar()
+        ids = self.cliente.zrangebyscore(self.USUARIOS, time.time(), '+inf')
+        if not ids:
+            return []
+        return [json.loads(datos) for datos in self.cliente.hmget(self.DATOS, ids) if datos]
+
+    def total(self):
+        return self.cliente.zcount(self.USUARIOS, time.time(), '+inf')
+
+
+_presencia = None
+_presencia_lock = threading.Lock()
+
+
+def get_presencia():
+    """Backend de presencia configurado (se crea una vez por proceso)"""
+    global _presencia
+    with _presencia_lock:
+        if _presencia is None:
+            ttl = get_config('TTL', 90)
+            if get_config('BACKEND', 'local') == 'redis':
+                _presencia = PresenciaRedis(get_config('REDIS_URL', 'redis://127.0.0.1:6379/0'), ttl)
+            else:
+                _presencia = PresenciaLocal(ttl)
+        return _presencia
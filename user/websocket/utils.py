@@ -1,8 +1,13 @@
 # user/websocket/utils.py
+import logging
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
 from datetime import datetime
 
+from .presencia import get_presencia
+
+logger = logging.getLogger(__name__)
+
 
 def get_timestamp():
     """Retorna timestamp ISO"""
@@ -25,7 +30,7 @@ def broadcast_user_connected(user_data):
             'timestamp': get_timestamp()
         }
     )
-    print(f"✅ WebSocket: Usuario conectado - {user_data.get('name')}")
+    logger.debug('WebSocket: Usuario conectado - %s', user_data.get('name'))
 
 
 def broadcast_user_disconnected(user_data):
@@ -44,25 +49,17 @@ def broadcast_user_disconnected(user_data):
             'timestamp': get_timestamp()
         }
     )
-    print(f"❌ WebSocket: Usuario desconectado - {user_data.get('name')}")
+    logger.debug('WebSocket: Usuario desconectado - %s', user_data.get('name'))
 
 
 def get_connected_users():
     """
-    Retorna la lista de usuarios conectados actualmente
+    Retorna la lista de usuarios conectados actualmente (en todos los workers)
     
     Returns:
         list: Lista de usuarios conectados
     """
-    from .consumers import UsersOnlineConsumer
-    
-    unique_users = {}
-    for channel_data in UsersOnlineConsumer.connected_users.values():
-        user_id = channel_data['user_id']
-        if user_id not in unique_users:
-            unique_users[user_id] = channel_data['user_data']
-    
-    return list(unique_users.values())
+    return get_presencia().usuarios()
 
 
 def get_online_count():
@@ -72,8 +69,7 @@ def get_online_count():
     Returns:
         int: Cantidad de usuarios en línea
     """
-    from .consumers import UsersOnlineConsumer
-    return UsersOnlineConsumer.get_online_count()
+    return get_presencia().total()
 
 
 def is_user_online(user_id):
@@ -86,5 +82,4 @@ def is_user_online(user_id):
     Returns:
         bool: True si está en línea, False si no
     """
-    from .consumers import UsersOnlineConsumer
-    return UsersOnlineConsumer.is_user_online(user_id)
\ No newline at end of file
+    return get_presencia().en_linea(user_id)